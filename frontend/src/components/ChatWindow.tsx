@@ -169,6 +169,9 @@ export function ChatWindow() {
               if (ev.type === 'query_update') {
                 setAdjustedQuery((ev as any).query || '');
               }
+              if (ev.type === 'queue') {
+                setThinkingSteps((prev) => [...prev, `Server busy, waiting for a ${ev.stage} slot (position ${ev.position})`]);
+              }
               if (ev.type === 'tool_call') {
                 setThinkingSteps((prev) => [...prev, `Calling tool: ${ev.name}`]);
               }
@@ -191,6 +194,12 @@ export function ChatWindow() {
                       if (!result?.chartjs) return null;
                       return { type: 'chartjs_data', result } as ToolPanelEvent;
                     }
+                    case 'cohort_analysis': {
+                      if (result?.chartjs) return { type: 'chartjs_data', result } as ToolPanelEvent;
+                      const hasRows = Array.isArray(result?.rows) && result.rows.length > 0;
+                      if (!hasRows) return null;
+                      return { type: 'run_analysis_plan', result } as ToolPanelEvent;
+                    }
                     case 'sql_tutor': {
                       const tipsLen = Array.isArray(result?.tips) ? result.tips.length : 0;
                       const examplesLen = Array.isArray(result?.examples) ? result.examples.length : 0;
@@ -1,11 +1,12 @@
 import React from 'react';
+import { fetchResultPage } from '../services/api';
 
 export type ToolPanelEvent =
-  | { type: 'business_insight'; result: { insight?: string; columns?: string[]; rows?: any[] } }
+  | { type: 'business_insight'; result: { insight?: string; columns?: string[]; rows?: any[]; total_rows?: number; result_id?: string } }
   | { type: 'chartjs_data'; result: { chartjs: any } }
   | { type: 'sql_tutor'; result: { tips?: string[]; schema?: Record<string, string[]>; examples?: string[] } }
   | { type: 'stakeholder_suggest'; result: { suggestions?: Array<{ role?: string; name?: string; email?: string }>; prompt?: string } }
-  | { type: 'run_analysis_plan'; result: { columns?: string[]; rows?: any[]; python_code?: string } }
+  | { type: 'run_analysis_plan'; result: { columns?: string[]; rows?: any[]; total_rows?: number; result_id?: string; python_code?: string } }
   | { type: 'unknown'; result: any };
 
 export function ToolPanels({ panels }: { panels: ToolPanelEvent[] }) {
@@ -31,26 +32,7 @@ function renderPanel(p: ToolPanelEvent): React.ReactNode {
         <>
           {insight && <div style={{ marginBottom: 8 }}>{insight}</div>}
           {columns.length > 0 && rows.length > 0 && (
-            <div style={{ overflowX: 'auto' }}>
-              <table style={{ borderCollapse: 'collapse', fontSize: 12, width: '100%' }}>
-                <thead>
-                  <tr>
-                    {columns.map((c) => (
-                      <th key={c} style={{ textAlign: 'left', padding: '4px 6px', borderBottom: '1px solid var(--border)' }}>{c}</th>
-                    ))}
-                  </tr>
-                </thead>
-                <tbody>
-                  {rows.slice(0, 20).map((r, i) => (
-                    <tr key={i}>
-                      {columns.map((c, ci) => (
-                        <td key={ci} style={{ padding: '4px 6px' }}>{String(r?.[c] ?? '')}</td>
-                      ))}
-                    </tr>
-                  ))}
-                </tbody>
-              </table>
-            </div>
+            <VirtualTable columns={columns} rows={rows} totalRows={p.result?.total_rows} resultId={p.result?.result_id} />
           )}
         </>
       );
@@ -111,25 +93,13 @@ function renderPanel(p: ToolPanelEvent): React.ReactNode {
       return (
         <>
           {columns.length > 0 && rows.length > 0 && (
-            <div style={{ overflowX: 'auto', marginBottom: 8 }}>
-              <table style={{ borderCollapse: 'collapse', fontSize: 12, width: '100%' }}>
-                <thead>
-                  <tr>
-                    {columns.map((c: string) => (
-                      <th key={c} style={{ textAlign: 'left', padding: '4px 6px', borderBottom: '1px solid var(--border)' }}>{c}</th>
-                    ))}
-                  </tr>
-                </thead>
-                <tbody>
-                  {rows.slice(0, 50).map((r: Record<string, unknown>, i: number) => (
-                    <tr key={i}>
-                      {columns.map((c: string, ci: number) => (
-                        <td key={ci} style={{ padding: '4px 6px' }}>{String(r?.[c] ?? '')}</td>
-                      ))}
-                    </tr>
-                  ))}
-                </tbody>
-              </table>
+            <div style={{ marginBottom: 8 }}>
+              <VirtualTable
+                columns={columns}
+                rows={rows}
+                totalRows={(p.result as any)?.total_rows}
+                resultId={(p.result as any)?.result_id}
+              />
             </div>
           )}
           {pythonCode && (
@@ -175,6 +145,109 @@ function renderPanel(p: ToolPanelEvent): React.ReactNode {
   }
 }
 
+const ROW_HEIGHT = 26;
+const OVERSCAN = 8;
+const PAGE_SIZE = 200;
+const cellStyle: React.CSSProperties = { padding: '4px 6px', height: ROW_HEIGHT, boxSizing: 'border-box', whiteSpace: 'nowrap' };
+
+// Windowed table: only the rows in view (plus OVERSCAN) are in the DOM, with spacer
+// rows standing in for the rest. When the server kept part of the result back
+// (result_id + total_rows), further pages are fetched as the user scrolls toward them.
+function VirtualTable({
+  columns,
+  rows,
+  totalRows,
+  resultId,
+  height = 320,
+}: {
+  columns: string[];
+  rows: any[];
+  totalRows?: number;
+  resultId?: string;
+  height?: number;
+}) {
+  const [loaded, setLoaded] = React.useState<any[]>(rows);
+  const [scrollTop, setScrollTop] = React.useState(0);
+  const [loading, setLoading] = React.useState(false);
+  const [exhausted, setExhausted] = React.useState(false);
+  // Offset of the page in flight, so re-renders while it loads don't request it again
+  const pending = React.useRef<number | null>(null);
+
+  React.useEffect(() => {
+    setLoaded(rows);
+    setExhausted(false);
+    setLoading(false);
+    pending.current = null;
+  }, [rows, resultId]);
+
+  const total = resultId && !exhausted ? Math.max(totalRows ?? loaded.length, loaded.length) : loaded.length;
+  const first = Math.max(0, Math.floor(scrollTop / ROW_HEIGHT) - OVERSCAN);
+  const last = Math.min(total, Math.ceil((scrollTop + height) / ROW_HEIGHT) + OVERSCAN);
+
+  React.useEffect(() => {
+    if (!resultId || exhausted || loaded.length >= total || last < loaded.length - OVERSCAN) return;
+    const offset = loaded.length;
+    if (pending.current === offset) return;
+    pending.current = offset;
+    setLoading(true);
+    fetchResultPage(resultId, offset, PAGE_SIZE).then((page) => {
+      if (pending.current !== offset) return;
+      pending.current = null;
+      setLoading(false);
+      if (!page || !Array.isArray(page.rows) || page.rows.length === 0) {
+        setExhausted(true);
+      } else {
+        setLoaded((prev) => (prev.length === page.offset ? prev.concat(page.rows) : prev));
+      }
+    });
+  }, [resultId, exhausted, loaded.length, total, last]);
+
+  const visible: React.ReactNode[] = [];
+  for (let i = first; i < last; i++) {
+    const r = loaded[i];
+    visible.push(
+      <tr key={i}>
+        {columns.map((c, ci) => (
+          <td key={ci} style={cellStyle}>{r === undefined ? (ci === 0 ? '…' : '') : String(r?.[c] ?? '')}</td>
+        ))}
+      </tr>
+    );
+  }
+
+  return (
+    <>
+      <div
+        style={{ overflow: 'auto', maxHeight: height }}
+        onScroll={(e) => setScrollTop((e.target as HTMLDivElement).scrollTop)}
+      >
+        <table style={{ borderCollapse: 'collapse', fontSize: 12, width: '100%' }}>
+          <thead>
+            <tr>
+              {columns.map((c) => (
+                <th
+                  key={c}
+                  style={{ textAlign: 'left', padding: '4px 6px', borderBottom: '1px solid var(--border)', position: 'sticky', top: 0, background: '#fff' }}
+                >{c}</th>
+              ))}
+            </tr>
+          </thead>
+          <tbody>
+            {first > 0 && <tr style={{ height: first * ROW_HEIGHT }} />}
+            {visible}
+            {last < total && <tr style={{ height: (total - last) * ROW_HEIGHT }} />}
+          </tbody>
+        </table>
+      </div>
+      {total > 0 && (
+        <div style={{ fontSize: 11, color: '#555', marginTop: 4 }}>
+          {loaded.length < total ? `Loaded ${loaded.length.toLocaleString()} of ${total.toLocaleString()} rows` : `${total.toLocaleString()} rows`}
+          {loading ? ' • loading…' : ''}
+        </div>
+      )}
+    </>
+  );
+}
+
 function ChartCanvas({ config }: { config: any }) {
   const canvasRef = React.useRef<HTMLCanvasElement | null>(null);
   React.useEffect(() => {
@@ -0,0 +1,30 @@
+import { SSEParser } from './sse';
+
+function collect(chunks: string[], flush = false): string[] {
+  const out: string[] = [];
+  const parser = new SSEParser((data) => out.push(data));
+  chunks.forEach((c) => parser.push(c));
+  if (flush) parser.flush();
+  return out;
+}
+
+test('dispatches one event per blank-line terminated frame', () => {
+  expect(collect(['data: {"a":1}\n\ndata: {"b":2}\n\n'])).toEqual(['{"a":1}', '{"b":2}']);
+});
+
+test('reassembles frames split across chunks and CRLF line endings', () => {
+  const text = 'data: {"type":"final","text":"hello"}\r\n\r\ndata:{"x":2}\n\n';
+  const whole = collect([text]);
+  const bytewise = collect(text.split(''));
+  expect(whole).toEqual(['{"type":"final","text":"hello"}', '{"x":2}']);
+  expect(bytewise).toEqual(whole);
+});
+
+test('joins multi-line data and ignores comments and other fields', () => {
+  expect(collect([': ping\nevent: msg\ndata: a\ndata: b\nid: 1\n\n'])).toEqual(['a\nb']);
+});
+
+test('flush dispatches a trailing frame without a blank line', () => {
+  expect(collect(['data: {"a":1}\n\ndata: {"b"', ':2}'])).toEqual(['{"a":1}']);
+  expect(collect(['data: {"a":1}\n\ndata: {"b"', ':2}'], true)).toEqual(['{"a":1}', '{"b":2}']);
+});
@@ -2,6 +2,60 @@
 export type OnError = (error: Error) => void;
 export type OnDone = () => void;
 
+// Incremental text/event-stream parser: each pushed chunk is scanned once, so a
+// frame split across many reads costs time proportional to its size, not to
+// the square of it. Only `data:` fields are used; comments and other fields are ignored.
+export class SSEParser {
+  private partial: string[] = [];
+  private dataLines: string[] = [];
+
+  constructor(private onData: (data: string) => void) {}
+
+  push(chunk: string): void {
+    let start = 0;
+    let nl = chunk.indexOf('\n');
+    while (nl !== -1) {
+      let line = chunk.slice(start, nl);
+      if (this.partial.length > 0) {
+        this.partial.push(line);
+        line = this.partial.join('');
+        this.partial = [];
+      }
+      this.handleLine(line.endsWith('\r') ? line.slice(0, -1) : line);
+      start = nl + 1;
+      nl = chunk.indexOf('\n', start);
+    }
+    if (start < chunk.length) this.partial.push(chunk.slice(start));
+  }
+
+  // Dispatch whatever is buffered when the stream ends without a trailing blank line
+  flush(): void {
+    if (this.partial.length > 0) {
+      const line = this.partial.join('');
+      this.partial = [];
+      this.handleLine(line);
+    }
+    this.dispatch();
+  }
+
+  private handleLine(line: string): void {
+    if (line === '') {
+      this.dispatch();
+      return;
+    }
+    if (line.startsWith('data:')) {
+      this.dataLines.push(line.charCodeAt(5) === 32 ? line.slice(6) : line.slice(5));
+    }
+  }
+
+  private dispatch(): void {
+    if (this.dataLines.length === 0) return;
+    const data = this.dataLines.length === 1 ? this.dataLines[0] : this.dataLines.join('\n');
+    this.dataLines = [];
+    this.onData(data);
+  }
+}
+
 // Parse text/event-stream from a ReadableStream (fetch) where each data line is JSON
 export async function readJsonSSEFromFetch(
   response: Response,
@@ -17,52 +71,25 @@ export async function readJsonSSEFromFetch(
   }
   const reader = response.body.getReader();
   const decoder = new TextDecoder();
-  let buffer = '';
+  const parser = new SSEParser((text) => {
+    try {
+      onJson(JSON.parse(text));
+    } catch (e: any) {
+      onError(new Error('Invalid JSON frame'));
+    }
+  });
   try {
     while (true) {
       if (signal?.aborted) throw new Error('aborted');
       const { done, value } = await reader.read();
       if (done) break;
-      buffer += decoder.decode(value, { stream: true });
-      const parts = buffer.split(/\n\n/);
-      buffer = parts.pop() ?? '';
-      for (const part of parts) {
-        const lines = part.split(/\n/);
-        for (const line of lines) {
-          if (line.startsWith('data:')) {
-            let text = line.slice(5);
-            if (text.startsWith(' ')) text = text.slice(1);
-            try {
-              const obj = JSON.parse(text);
-              onJson(obj);
-            } catch (e: any) {
-              onError(new Error('Invalid JSON frame'));
-            }
-          }
-        }
-      }
-    }
-    if (buffer.length > 0) {
-      const lines = buffer.split(/\n/);
-      for (const line of lines) {
-        if (line.startsWith('data:')) {
-          let text = line.slice(5);
-          if (text.startsWith(' ')) text = text.slice(1);
-          try {
-            const obj = JSON.parse(text);
-            onJson(obj);
-          } catch (e: any) {
-            onError(new Error('Invalid JSON frame'));
-          }
-        }
-      }
+      parser.push(decoder.decode(value, { stream: true }));
     }
+    parser.push(decoder.decode());
+    parser.flush();
     onDone();
   } catch (err: any) {
     onError(err instanceof Error ? err : new Error(String(err)));
     onDone();
   }
 }
-
-
-
@@ -70,3 +70,20 @@ export async function fetchMemory(sessionId: string): Promise<unknown> {
 }
 
 
+
+export async function fetchResultPage(
+  resultId: string,
+  offset: number,
+  limit: number
+): Promise<{ columns: string[]; rows: any[]; offset: number; total_rows: number } | null> {
+  const u = new URL(`${API_BASE_URL}/results/${encodeURIComponent(resultId)}`);
+  u.searchParams.set('offset', String(offset));
+  u.searchParams.set('limit', String(limit));
+  try {
+    const res = await fetch(u.toString());
+    if (!res.ok) return null;
+    return res.json();
+  } catch {
+    return null;
+  }
+}
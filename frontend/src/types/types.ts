@@ -26,6 +26,8 @@ export type AgentEvent =
   | { type: 'tool_call'; name: string; args: unknown }
   | { type: 'tool_result'; name: string; result: unknown }
   | { type: 'query_update'; query: string }
+  | { type: 'queue'; stage: 'model' | 'tool'; position: number }
+  | { type: 'profile'; samples: number; duration_ms: number; collapsed: string; top_self: { frame: string; samples: number; share: number }[] }
   | { type: 'final'; text: string };
 
 
@@ -0,0 +1,178 @@
+import os
+import time
+import threading
+from collections import OrderedDict, deque
+from typing import Any, Deque, Dict, List, Optional
+
+
+MAX_CONCURRENT_MODEL_CALLS = int(os.getenv("MAX_CONCURRENT_MODEL_CALLS", "8"))
+MAX_CONCURRENT_TOOL_WORK = int(os.getenv("MAX_CONCURRENT_TOOL_WORK", str(max(1, os.cpu_count() or 1))))
+MAX_QUEUED_REQUESTS = int(os.getenv("MAX_QUEUED_REQUESTS", "32"))
+QUEUE_RETRY_AFTER_SEC = int(os.getenv("QUEUE_RETRY_AFTER_SEC", "2"))
+
+# Upper bounds (seconds) of the wait-time histogram buckets
+WAIT_BUCKETS = (0.005, 0.025, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+class QueueFullError(Exception):
+    def __init__(self, limiter: str, retry_after: int):
+        super().__init__(f"{limiter} queue is full")
+        self.limiter = limiter
+        self.retry_after = retry_after
+
+
+class Ticket:
+    def __init__(self, limiter: "FairLimiter", session_id: str):
+        self.limiter = limiter
+        self.session_id = session_id
+        self.enqueued_at = time.perf_counter()
+        self.granted = threading.Event()
+        self.done = False
+
+    def position(self) -> int:
+        """0 once granted, otherwise 1-based position in dispatch order."""
+        return self.limiter.position(self)
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        return self.granted.wait(timeout)
+
+    def release(self) -> None:
+        self.limiter.release(self)
+
+
+class FairLimiter:
+    """Concurrency limit with a bounded wait queue served round-robin across sessions.
+
+    Each session has its own FIFO; when a slot frees up the next session in
+    rotation gets it, so one chatty session cannot starve the others.
+    """
+
+    def __init__(self, name: str, limit: int, max_queue: int):
+        self.name = name
+        self.limit = max(1, limit)
+        self.max_queue = max(0, max_queue)
+        self._lock = threading.Lock()
+        self._active = 0
+        self._waiting: "OrderedDict[str, Deque[Ticket]]" = OrderedDict()
+        self._queued = 0
+        self.admitted_total = 0
+        self.rejected_total = 0
+        self.wait_count = 0
+        self.wait_sum = 0.0
+        self.wait_max = 0.0
+        self.wait_buckets = [0] * len(WAIT_BUCKETS)
+
+    def enqueue(self, session_id: str, force: bool = False) -> Ticket:
+        """Take a slot or join the queue; raises QueueFullError unless `force` (in-flight work)."""
+        ticket = Ticket(self, session_id)
+        with self._lock:
+            if self._active < self.limit and not self._queued:
+                self._grant_locked(ticket)
+                return ticket
+            if not force and self._queued >= self.max_queue:
+                self.rejected_total += 1
+                raise QueueFullError(self.name, QUEUE_RETRY_AFTER_SEC)
+            self._waiting.setdefault(session_id, deque()).append(ticket)
+            self._queued += 1
+        return ticket
+
+    def _grant_locked(self, ticket: Ticket) -> None:
+        waited = time.perf_counter() - ticket.enqueued_at
+        self._active += 1
+        self.admitted_total += 1
+        self.wait_count += 1
+        self.wait_sum += waited
+        self.wait_max = max(self.wait_max, waited)
+        for i, bound in enumerate(WAIT_BUCKETS):
+            if waited <= bound:
+                self.wait_buckets[i] += 1
+        ticket.granted.set()
+
+    def _dispatch_locked(self) -> None:
+        while self._active < self.limit and self._waiting:
+            session_id, tickets = next(iter(self._waiting.items()))
+            ticket = tickets.popleft()
+            self._queued -= 1
+            if tickets:
+                self._waiting.move_to_end(session_id)
+            else:
+                del self._waiting[session_id]
+            self._grant_locked(ticket)
+
+    def release(self, ticket: Ticket) -> None:
+        """Give back a granted slot, or withdraw a ticket that is still waiting."""
+        with self._lock:
+            if ticket.done:
+                return
+            ticket.done = True
+            if ticket.granted.is_set():
+                self._active -= 1
+            else:
+                tickets = self._waiting.get(ticket.session_id)
+                if tickets is not None and ticket in tickets:
+                    tickets.remove(ticket)
+                    self._queued -= 1
+                    if not tickets:
+                        del self._waiting[ticket.session_id]
+            self._dispatch_locked()
+
+    def position(self, ticket: Ticket) -> int:
+        with self._lock:
+            if ticket.granted.is_set():
+                return 0
+            # Simulate the round-robin dispatch order
+            queues = [list(q) for q in self._waiting.values()]
+            pos = 0
+            depth = 0
+            while any(depth < len(q) for q in queues):
+                for q in queues:
+                    if depth < len(q):
+                        pos += 1
+                        if q[depth] is ticket:
+                            return pos
+                depth += 1
+            return pos
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "limit": self.limit,
+                "active": self._active,
+                "queued": self._queued,
+                "max_queue": self.max_queue,
+                "admitted_total": self.admitted_total,
+                "rejected_total": self.rejected_total,
+                "wait_seconds_sum": round(self.wait_sum, 6),
+                "wait_seconds_count": self.wait_count,
+                "wait_seconds_max": round(self.wait_max, 6),
+                "wait_buckets": list(self.wait_buckets),
+            }
+
+
+def render_prometheus(limiters: List[FairLimiter]) -> str:
+    """Text exposition of queue depth, active slots and wait-time histograms.
+
+    Each metric family is written whole (HELP, TYPE, then every limiter's
+    samples), as the exposition format requires.
+    """
+    stats = [(f'limiter="{lim.name}"', lim.stats()) for lim in limiters]
+    families = [
+        ("admission_active", "gauge", "Requests holding a slot.", "active"),
+        ("admission_queue_depth", "gauge", "Requests waiting for a slot.", "queued"),
+        ("admission_admitted_total", "counter", "Requests granted a slot.", "admitted_total"),
+        ("admission_rejected_total", "counter", "Requests rejected because the queue was full.", "rejected_total"),
+    ]
+    lines: List[str] = []
+    for metric, kind, help_text, key in families:
+        lines.append(f"# HELP {metric} {help_text}")
+        lines.append(f"# TYPE {metric} {kind}")
+        lines.extend(f"{metric}{{{lbl}}} {s[key]}" for lbl, s in stats)
+    lines.append("# HELP admission_wait_seconds Time spent queued before getting a slot.")
+    lines.append("# TYPE admission_wait_seconds histogram")
+    for lbl, s in stats:
+        for bound, count in zip(WAIT_BUCKETS, s["wait_buckets"]):
+            lines.append(f'admission_wait_seconds_bucket{{{lbl},le="{bound}"}} {count}')
+        lines.append(f'admission_wait_seconds_bucket{{{lbl},le="+Inf"}} {s["wait_seconds_count"]}')
+        lines.append(f"admission_wait_seconds_sum{{{lbl}}} {s['wait_seconds_sum']}")
+        lines.append(f"admission_wait_seconds_count{{{lbl}}} {s['wait_seconds_count']}")
+    return "\n".join(lines) + "\n"
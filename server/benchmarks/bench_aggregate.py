@@ -0,0 +1,81 @@
+"""Grouped aggregation: pandas groupby vs parallel_utils across worker counts.
+
+Run from server/:  python benchmarks/bench_aggregate.py [--rows 5000000] [--workers 1,2,4,8]
+"""
+import os
+import sys
+import time
+import argparse
+from typing import Any, Callable, Dict, List
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from parallel_utils import group_aggregate, shutdown_pool  # noqa: E402
+
+
+def _events(rows: int, users: int) -> pd.DataFrame:
+    rng = np.random.default_rng(0)
+    return pd.DataFrame({
+        "user_id": pd.Categorical.from_codes(rng.integers(0, users, rows), [f"u{i}" for i in range(users)]).astype(str),
+        "page": rng.choice(["home", "product", "reviews", "cart", "checkout", "support", "blog", "about"], rows),
+        "clicks": rng.integers(0, 20, rows),
+        "session_duration_sec": np.where(rng.random(rows) < 0.05, np.nan, rng.random(rows) * 300),
+    })
+
+
+CASES: Dict[str, Any] = {
+    "sum clicks by user": (["user_id"], {"clicks": ("clicks", "sum")}),
+    "5 ops by user": (["user_id"], {
+        "n": ("clicks", "size"),
+        "clicks": ("clicks", "sum"),
+        "avg_sec": ("session_duration_sec", "mean"),
+        "min_sec": ("session_duration_sec", "min"),
+        "max_sec": ("session_duration_sec", "max"),
+    }),
+    "mean by user, page": (["user_id", "page"], {"avg_sec": ("session_duration_sec", "mean")}),
+}
+
+
+def _bench(fn: Callable[[], Any], rounds: int) -> float:
+    fn()
+    started = time.perf_counter()
+    for _ in range(rounds):
+        fn()
+    return (time.perf_counter() - started) / rounds
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=5_000_000)
+    parser.add_argument("--users", type=int, default=100_000)
+    parser.add_argument("--rounds", type=int, default=3)
+    parser.add_argument("--workers", default=None, help="comma-separated worker counts (default: 1, 2, 4, ... up to the core count)")
+    args = parser.parse_args()
+
+    cores = os.cpu_count() or 1
+    if args.workers:
+        counts: List[int] = [int(w) for w in args.workers.split(",")]
+    else:
+        counts = sorted({1, cores, *[2 ** i for i in range(1, 6) if 2 ** i <= cores]})
+    df = _events(args.rows, args.users)
+    print(f"rows: {args.rows:,}, users: {args.users:,}, cores: {cores}, rounds: {args.rounds}")
+    if cores < 2:
+        print("note: one core available; worker counts above 1 only add scheduling overhead here")
+    header = f"{'case':<22}{'pandas s':>10}" + "".join(f"{f'w={w} s':>10}{'x':>6}" for w in counts)
+    print(header)
+    for label, (keys, aggs) in CASES.items():
+        serial = _bench(lambda: group_aggregate(df, keys, aggs, parallel=False), args.rounds)
+        line = f"{label:<22}{serial:>10.3f}"
+        for w in counts:
+            # Keys come from the full table, so their encoding is cached after the warm-up call
+            t = _bench(lambda: group_aggregate(df, keys, aggs, sources={k: df for k in keys}, parallel=True, workers=w), args.rounds)
+            line += f"{t:>10.3f}{serial / t:>5.1f}x"
+        print(line)
+    shutdown_pool()
+
+
+if __name__ == "__main__":
+    main()
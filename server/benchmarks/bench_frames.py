@@ -0,0 +1,90 @@
+"""Encode time and SSE frame throughput: legacy json.dumps path vs frame_utils.
+
+Run from server/:  python benchmarks/bench_frames.py [--rounds 200]
+"""
+import os
+import sys
+import json
+import time
+import argparse
+from typing import Any, Callable, Dict, Iterator, List
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import frame_utils  # noqa: E402
+from frame_utils import Encoded, frame, sse_frames  # noqa: E402
+
+
+def _table_result(rows: int) -> Dict[str, Any]:
+    rng = np.random.default_rng(0)
+    df = pd.DataFrame({
+        "user_id": [f"u{i % 997}" for i in range(rows)],
+        "clicks": rng.integers(0, 50, rows),
+        "amount": np.where(rng.random(rows) < 0.1, np.nan, rng.random(rows) * 100),
+        "at": pd.Timestamp("2025-01-01", tz="UTC") + pd.to_timedelta(rng.integers(0, 86400 * 60, rows), unit="s"),
+        "page": rng.choice(["home", "pricing", "docs", "checkout"], rows),
+    })
+    return {"columns": list(df.columns), "rows": df.to_dict(orient="records")}
+
+
+def _chart_result(points: int, series: int) -> Dict[str, Any]:
+    rng = np.random.default_rng(1)
+    labels = pd.date_range("2024-01-01", periods=points, freq="h").strftime("%Y-%m-%d %H:00").tolist()
+    datasets = [{"label": f"s{i}", "data": rng.random(points).round(3).tolist(), "borderColor": "#6C5CE7"} for i in range(series)]
+    return {"chartjs": {"type": "line", "data": {"labels": labels, "datasets": datasets}, "options": {"responsive": True}}}
+
+
+def legacy_frames(name: str, result: Dict[str, Any]) -> Iterator[str]:
+    """The previous path: tool_result frame and history message each json.dumps'd, then split into lines."""
+    history = json.dumps(result, default=str)  # noqa: F841 - mirrors the chat_history copy
+    payload = json.dumps({"type": "tool_result", "name": name, "result": result}, default=str)
+    lines = payload.splitlines() or [""]
+    for line in lines:
+        yield f"data: {line}\n"
+    yield "\n"
+
+
+def new_frames(name: str, result: Dict[str, Any]) -> Iterator[bytes]:
+    encoded = Encoded(result)
+    history = encoded.text  # noqa: F841
+    return sse_frames([frame("tool_result", name=name, result=encoded)])
+
+
+def _bench(fn: Callable[[], Any], rounds: int) -> float:
+    fn()
+    started = time.perf_counter()
+    for _ in range(rounds):
+        fn()
+    return (time.perf_counter() - started) / rounds
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rounds", type=int, default=200)
+    args = parser.parse_args()
+
+    payloads = {
+        "small": {"insight": "Top buyers by total revenue.", "columns": ["name", "total"], "rows": [{"name": "A", "total": 10.5}]},
+        "table_1k": _table_result(1000),
+        "table_10k": _table_result(10000),
+        "chart_5k_x3": _chart_result(5000, 3),
+    }
+    encoder = "orjson" if frame_utils.orjson is not None else "stdlib json"
+    print(f"encoder: {encoder}, rounds: {args.rounds}")
+    print(f"{'payload':<14}{'bytes':>10}{'legacy ms':>12}{'new ms':>10}{'speedup':>9}{'legacy MB/s':>13}{'new MB/s':>10}")
+    for label, result in payloads.items():
+        rounds = max(1, args.rounds // (10 if "10k" in label else 1))
+        size = sum(len(chunk) for chunk in new_frames("tool", result))
+        legacy = _bench(lambda: list(legacy_frames("tool", result)), rounds)
+        new = _bench(lambda: list(new_frames("tool", result)), rounds)
+        print(
+            f"{label:<14}{size:>10}{legacy * 1000:>12.3f}{new * 1000:>10.3f}{legacy / new:>8.1f}x"
+            f"{size / legacy / 1e6:>13.1f}{size / new / 1e6:>10.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
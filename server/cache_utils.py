@@ -0,0 +1,173 @@
+import os
+import json
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from types import SimpleNamespace
+from typing import Any, Dict, List, Optional
+
+
+CACHE_MODES = ("off", "readwrite", "record", "replay")
+
+
+def _canonical(obj: Any) -> bytes:
+    return json.dumps(obj, sort_keys=True, separators=(",", ":"), default=str).encode("utf-8")
+
+
+def conversation_key(model: str, tools: Any, messages: List[Dict[str, Any]], temperature: float = 0.0, extra: Optional[Dict[str, Any]] = None) -> str:
+    """Chained hash over the conversation: the header, then each message folded in turn.
+
+    Each agent step sends the previous history plus a few new messages, so the
+    key of a step is derived from the key of every earlier prefix.
+    """
+    h = hashlib.sha256(_canonical({"model": model, "tools": tools, "temperature": temperature, "extra": extra or {}})).hexdigest()
+    for m in messages:
+        h = hashlib.sha256(h.encode("ascii") + _canonical(m)).hexdigest()
+    return h
+
+
+def message_to_dict(msg: Any) -> Dict[str, Any]:
+    tool_calls = []
+    for tc in (getattr(msg, "tool_calls", None) or []):
+        tool_calls.append({
+            "id": tc.id,
+            "type": "function",
+            "function": {"name": tc.function.name, "arguments": tc.function.arguments or "{}"},
+        })
+    return {"content": getattr(msg, "content", None), "tool_calls": tool_calls}
+
+
+def message_from_dict(data: Dict[str, Any]) -> SimpleNamespace:
+    tool_calls = [
+        SimpleNamespace(
+            id=tc["id"],
+            type=tc.get("type", "function"),
+            function=SimpleNamespace(name=tc["function"]["name"], arguments=tc["function"].get("arguments") or "{}"),
+        )
+        for tc in (data.get("tool_calls") or [])
+    ]
+    return SimpleNamespace(content=data.get("content"), tool_calls=tool_calls or None)
+
+
+class CompletionCache:
+    """On-disk cache of chat completion messages, one JSON file per key.
+
+    Modes:
+      - off: never read or write
+      - readwrite: serve hits, store misses (default)
+      - record: always call the model, overwrite stored entries
+      - replay: serve hits only; a miss is an error (offline benchmarks)
+
+    Entries are evicted least-recently-used once `max_entries` or `max_bytes` is exceeded.
+    """
+
+    def __init__(self, cache_dir: str, mode: str = "readwrite", max_entries: int = 2000, max_bytes: int = 64 * 1024 * 1024):
+        self.cache_dir = cache_dir
+        self.mode = mode if mode in CACHE_MODES else "readwrite"
+        self.max_entries = max(1, int(max_entries))
+        self.max_bytes = max(1, int(max_bytes))
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._index: "OrderedDict[str, int]" = OrderedDict()
+        self._total_bytes = 0
+        if self.mode != "off":
+            self._load_index()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key + ".json")
+
+    def _load_index(self) -> None:
+        os.makedirs(self.cache_dir, exist_ok=True)
+        entries = []
+        for fname in os.listdir(self.cache_dir):
+            if not fname.endswith(".json"):
+                continue
+            try:
+                st = os.stat(os.path.join(self.cache_dir, fname))
+            except OSError:
+                continue
+            entries.append((st.st_mtime, fname[:-5], st.st_size))
+        for _, key, size in sorted(entries):
+            self._index[key] = size
+            self._total_bytes += size
+        self._evict_locked()
+
+    def _evict_locked(self) -> None:
+        while self._index and (len(self._index) > self.max_entries or self._total_bytes > self.max_bytes):
+            key, size = self._index.popitem(last=False)
+            self._total_bytes -= size
+            try:
+                os.remove(self._path(key))
+            except OSError:
+                pass
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        if self.mode in ("off", "record"):
+            return None
+        with self._lock:
+            if key not in self._index:
+                self.misses += 1
+                return None
+            self._index.move_to_end(key)
+        try:
+            with open(self._path(key)) as f:
+                entry = json.load(f)
+            os.utime(self._path(key))
+        except Exception:
+            with self._lock:
+                self._total_bytes -= self._index.pop(key, 0)
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        return entry.get("message")
+
+    def put(self, key: str, message: Dict[str, Any]) -> None:
+        if self.mode in ("off", "replay"):
+            return
+        payload = _canonical({"key": key, "ts": time.time(), "message": message})
+        tmp_path = self._path(key) + ".tmp"
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            with open(tmp_path, "wb") as f:
+                f.write(payload)
+            os.replace(tmp_path, self._path(key))
+        except Exception:
+            return
+        with self._lock:
+            self._total_bytes -= self._index.pop(key, 0)
+            self._index[key] = len(payload)
+            self._total_bytes += len(payload)
+            self._evict_locked()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "mode": self.mode,
+                "entries": len(self._index),
+                "bytes": self._total_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+
+def cached_chat_completion(cache: CompletionCache, client: Any, model: str, messages: List[Dict[str, Any]], tools: Any, temperature: float = 0.1, **kwargs: Any) -> Any:
+    """Return the assistant message for `messages`, consulting `cache` before calling the model."""
+    key = conversation_key(model, tools, messages, temperature, extra=kwargs)
+    cached = cache.get(key)
+    if cached is not None:
+        return message_from_dict(cached)
+    if cache.mode == "replay":
+        raise LookupError("replay cache miss for this conversation")
+    completion = client.chat.completions.create(
+        model=model,
+        messages=messages,
+        tools=tools,
+        temperature=temperature,
+        **kwargs,
+    )
+    msg = completion.choices[0].message
+    cache.put(key, message_to_dict(msg))
+    return msg
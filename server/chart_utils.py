@@ -0,0 +1,92 @@
+from typing import Dict, List
+
+import numpy as np
+import pandas as pd
+
+
+TIME_BUCKET_FORMATS: Dict[str, str] = {
+    "minute": "%Y-%m-%d %H:%M",
+    "hour": "%Y-%m-%d %H:00",
+    "day": "%Y-%m-%d",
+    "week": "%Y-%m-%d",
+    "month": "%Y-%m",
+}
+
+
+def bucket_timestamps(ts: pd.Series, bucket: str) -> pd.Series:
+    """Floor parsed UTC timestamps to the start of their bucket ("week" starts on Monday).
+
+    Grouping on the floored datetimes and formatting only the resulting
+    labels avoids a per-row strftime.
+    """
+    if bucket == "minute":
+        return ts.dt.floor("min")
+    if bucket == "hour":
+        return ts.dt.floor("h")
+    day = ts.dt.floor("D")
+    if bucket == "week":
+        return day - pd.to_timedelta(ts.dt.weekday, unit="D")
+    if bucket == "month":
+        return day - pd.to_timedelta(ts.dt.day - 1, unit="D")
+    return day
+
+
+def bucket_labels(index: pd.Index, bucket: str) -> List[str]:
+    if isinstance(index, pd.DatetimeIndex):
+        fmt = TIME_BUCKET_FORMATS.get(bucket, TIME_BUCKET_FORMATS["day"])
+        return index.strftime(fmt).tolist()
+    return index.astype(str).tolist()
+
+
+def lttb_indices(values: np.ndarray, target: int) -> np.ndarray:
+    """Largest-Triangle-Three-Buckets over evenly spaced points; returns the kept positions.
+
+    Evenly spaced x matches how a Chart.js category axis lays out labels.
+    NaN values are treated as 0 when ranking triangles.
+    """
+    n = len(values)
+    if target >= n or target < 3:
+        return np.arange(n)
+    y = np.nan_to_num(values.astype(float))
+    x = np.arange(n, dtype=float)
+    kept = np.empty(target, dtype=np.int64)
+    kept[0] = 0
+    kept[-1] = n - 1
+    # Buckets over the interior points, one kept point per bucket
+    edges = np.linspace(1, n - 1, target - 1).astype(np.int64)
+    a = 0
+    for i in range(target - 2):
+        start, end = edges[i], max(edges[i + 1], edges[i] + 1)
+        nxt_start, nxt_end = edges[i + 1], (edges[i + 2] if i + 2 < len(edges) else n)
+        if nxt_end <= nxt_start:
+            nxt_end = nxt_start + 1
+        avg_x = x[nxt_start:nxt_end].mean()
+        avg_y = y[nxt_start:nxt_end].mean()
+        area = np.abs((x[a] - avg_x) * (y[start:end] - y[a]) - (x[a] - x[start:end]) * (avg_y - y[a]))
+        a = start + int(np.argmax(area))
+        kept[i + 1] = a
+    return kept
+
+
+def minmax_indices(matrix: np.ndarray, target: int) -> np.ndarray:
+    """Shared positions keeping every column's min and max per bucket, at most `target` in total.
+
+    Used for multi-series charts where all datasets share one label axis.
+    """
+    n, k = matrix.shape
+    if target >= n:
+        return np.arange(n)
+    if target < 2 * k + 2:
+        # Too many series for even one bucket of extremes: endpoints plus evenly spaced positions
+        return np.unique(np.linspace(0, n - 1, max(target, 1)).round().astype(np.int64))
+    n_buckets = max(1, target // max(2 * k, 1) - 1)
+    edges = np.linspace(1, n - 1, n_buckets + 1).astype(np.int64)
+    filled = np.nan_to_num(matrix.astype(float))
+    keep: List[int] = [0, n - 1]
+    for start, end in zip(edges[:-1], edges[1:]):
+        if end <= start:
+            continue
+        block = filled[start:end]
+        keep.extend((start + block.argmin(axis=0)).tolist())
+        keep.extend((start + block.argmax(axis=0)).tolist())
+    return np.unique(np.asarray(keep, dtype=np.int64))
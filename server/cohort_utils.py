@@ -0,0 +1,280 @@
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+
+COHORT_GRANULARITIES = ("week", "month")
+DEFAULT_MAX_PERIODS = 12
+# Period offsets are packed next to the user code in one int64 key
+_OFFSET_BITS = 20
+
+
+def _to_ns(ts: pd.Series) -> np.ndarray:
+    return pd.to_datetime(ts, errors="coerce", utc=True).to_numpy(dtype="datetime64[ns]")
+
+
+def period_number(ts: np.ndarray, granularity: str) -> np.ndarray:
+    """Absolute period number of datetime64 values: Monday-based weeks or calendar months since 1970."""
+    if granularity == "month":
+        return ts.astype("datetime64[M]").astype(np.int64)
+    # 1970-01-01 was a Thursday; shift so weeks start on Monday
+    return (ts.astype("datetime64[D]").astype(np.int64) + 3) // 7
+
+
+def period_label(period: int, granularity: str) -> str:
+    if granularity == "month":
+        return str(np.datetime64(int(period), "M"))
+    return str(np.datetime64(int(period) * 7 - 3, "D"))
+
+
+class CohortMatrix:
+    """Signup-cohort retention and revenue counters for one period granularity.
+
+    Users are assigned to the period of their signup; every event or
+    purchase lands in cell (cohort, periods since signup). Active users are
+    counted once per cell by keeping the sorted set of (user, offset) keys
+    already seen, so appending rows only touches the new rows and queries
+    read a small dense matrix.
+    """
+
+    def __init__(self, granularity: str):
+        if granularity not in COHORT_GRANULARITIES:
+            raise ValueError(f"granularity must be one of {COHORT_GRANULARITIES}")
+        self.granularity = granularity
+        self.user_ids = pd.Index([], dtype=object)
+        self.user_period = np.empty(0, dtype=np.int64)
+        self.base: Optional[int] = None
+        self.sizes = np.zeros(0, dtype=np.int64)
+        self.active = np.zeros((0, 0), dtype=np.int64)
+        self.revenue = np.zeros((0, 0), dtype=np.float64)
+        self.seen = np.empty(0, dtype=np.int64)
+        self.last_period: Optional[int] = None
+
+    def _grow(self, max_cohort: int, max_offset: int) -> None:
+        rows = max_cohort - self.base + 1
+        cols = max_offset + 1
+        r0, c0 = self.active.shape
+        if rows <= r0 and cols <= c0:
+            return
+        rows, cols = max(rows, r0), max(cols, c0)
+        active = np.zeros((rows, cols), dtype=np.int64)
+        revenue = np.zeros((rows, cols), dtype=np.float64)
+        active[:r0, :c0] = self.active
+        revenue[:r0, :c0] = self.revenue
+        self.active, self.revenue = active, revenue
+        self.sizes = np.concatenate([self.sizes, np.zeros(rows - len(self.sizes), dtype=np.int64)])
+
+    def _observe(self, periods: np.ndarray) -> None:
+        if len(periods):
+            top = int(periods.max())
+            self.last_period = top if self.last_period is None else max(self.last_period, top)
+
+    def add_users(self, ids: pd.Series, signup: pd.Series) -> int:
+        """Register new users with their signup time; ids already known are ignored."""
+        ts = _to_ns(signup)
+        ids_arr = ids.to_numpy(dtype=object)
+        keep = ~np.isnat(ts) & ~pd.isna(ids_arr) & ~pd.Index(ids_arr).isin(self.user_ids)
+        ids_arr, ts = ids_arr[keep], ts[keep]
+        first = ~pd.Index(ids_arr).duplicated()
+        ids_arr, ts = ids_arr[first], ts[first]
+        if not len(ids_arr):
+            return 0
+        periods = period_number(ts, self.granularity)
+        if self.base is None:
+            self.base = int(periods.min())
+        elif periods.min() < self.base:
+            # Re-anchor the matrices on an earlier first cohort
+            shift = self.base - int(periods.min())
+            pad = lambda m: np.concatenate([np.zeros((shift, m.shape[1]), dtype=m.dtype), m])
+            self.active, self.revenue = pad(self.active), pad(self.revenue)
+            self.sizes = np.concatenate([np.zeros(shift, dtype=np.int64), self.sizes])
+            self.base -= shift
+        self._grow(int(periods.max()), 0)
+        np.add.at(self.sizes, periods - self.base, 1)
+        self.user_ids = self.user_ids.append(pd.Index(ids_arr, dtype=object))
+        self.user_period = np.concatenate([self.user_period, periods])
+        self._observe(periods)
+        return int(len(ids_arr))
+
+    def _cells(self, user_ids: pd.Series, ts: pd.Series) -> Dict[str, np.ndarray]:
+        codes = self.user_ids.get_indexer(user_ids.to_numpy(dtype=object))
+        when = _to_ns(ts)
+        ok = (codes >= 0) & ~np.isnat(when)
+        codes, periods = codes[ok], period_number(when[ok], self.granularity)
+        self._observe(periods)
+        offsets = periods - self.user_period[codes]
+        # Activity before signup is not part of any cohort cell
+        valid = (offsets >= 0) & (offsets < (1 << _OFFSET_BITS))
+        return {"ok": ok, "valid": valid, "codes": codes[valid], "offsets": offsets[valid]}
+
+    def add_events(self, user_ids: pd.Series, ts: pd.Series) -> int:
+        """Count each user once per (cohort, offset) cell; returns the number of newly active cells."""
+        if self.base is None:
+            return 0
+        cells = self._cells(user_ids, ts)
+        if not len(cells["codes"]):
+            return 0
+        keys = np.unique((cells["codes"].astype(np.int64) << _OFFSET_BITS) | cells["offsets"])
+        new = keys[~np.isin(keys, self.seen, assume_unique=True)]
+        if not len(new):
+            return 0
+        codes, offsets = new >> _OFFSET_BITS, new & ((1 << _OFFSET_BITS) - 1)
+        cohorts = self.user_period[codes] - self.base
+        self._grow(self.base + int(cohorts.max()), int(offsets.max()))
+        np.add.at(self.active, (cohorts, offsets), 1)
+        self.seen = np.union1d(self.seen, new)
+        return int(len(new))
+
+    def add_purchases(self, user_ids: pd.Series, ts: pd.Series, amounts: pd.Series) -> float:
+        if self.base is None:
+            return 0.0
+        cells = self._cells(user_ids, ts)
+        if not len(cells["codes"]):
+            return 0.0
+        values = pd.to_numeric(amounts, errors="coerce").to_numpy(dtype=float)[cells["ok"]][cells["valid"]]
+        values = np.nan_to_num(values)
+        cohorts = self.user_period[cells["codes"]] - self.base
+        self._grow(self.base + int(cohorts.max()), int(cells["offsets"].max()))
+        np.add.at(self.revenue, (cohorts, cells["offsets"]), values)
+        return float(values.sum())
+
+    def _period_of(self, value: str, name: str) -> int:
+        ts = _to_ns(pd.Series([value]))[:1]
+        # An unparseable date coerces to NaT, which would silently drop the bound
+        if np.isnat(ts[0]):
+            raise ValueError(f"{name} is not a valid date: {value!r}")
+        return int(period_number(ts, self.granularity)[0])
+
+    def query(
+        self,
+        metric: str = "retention",
+        since: Optional[str] = None,
+        until: Optional[str] = None,
+        max_periods: int = DEFAULT_MAX_PERIODS,
+        per_user: bool = False,
+    ) -> Dict[str, Any]:
+        """Cohort x offset matrix: retention as a share of cohort size, revenue as a cumulative total.
+
+        Cells after the latest observed period are None; cohorts with no users are skipped.
+        """
+        if metric not in ("retention", "active", "revenue"):
+            raise ValueError("metric must be retention, active or revenue")
+        if self.base is None:
+            return {"cohorts": [], "sizes": [], "periods": [], "matrix": []}
+        n_cohorts = len(self.sizes)
+        first, last = 0, n_cohorts - 1
+        if since:
+            first = max(first, self._period_of(since, "since") - self.base)
+        if until:
+            last = min(last, self._period_of(until, "until") - self.base)
+        n_periods = max(1, min(int(max_periods), self.active.shape[1] or 1))
+        cohorts = [c for c in range(first, last + 1) if self.sizes[c]]
+        if not cohorts:
+            return {"cohorts": [], "sizes": [], "periods": list(range(n_periods)), "matrix": []}
+        idx = np.asarray(cohorts)
+        sizes = self.sizes[idx].astype(float)
+
+        def window(m: np.ndarray) -> np.ndarray:
+            out = np.zeros((len(idx), n_periods), dtype=float)
+            cols = min(n_periods, m.shape[1])
+            out[:, :cols] = m[idx, :cols]
+            return out
+
+        if metric == "revenue":
+            values = np.cumsum(window(self.revenue), axis=1)
+            if per_user:
+                values = values / sizes[:, None]
+        else:
+            values = window(self.active)
+            if metric == "retention":
+                values = values / sizes[:, None]
+        # Offsets that lie in the future for a cohort have no data yet
+        observed = (self.last_period - (idx + self.base))[:, None] >= np.arange(n_periods)[None, :]
+        digits = 4 if metric == "retention" else 2
+        matrix = [
+            [round(float(v), digits) if ok else None for v, ok in zip(row, mask)]
+            for row, mask in zip(values, observed)
+        ]
+        return {
+            "cohorts": [period_label(c + self.base, self.granularity) for c in cohorts],
+            "sizes": [int(s) for s in self.sizes[idx]],
+            "periods": list(range(n_periods)),
+            "matrix": matrix,
+        }
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "granularity": self.granularity,
+            "users": int(len(self.user_ids)),
+            "cohorts": int((self.sizes > 0).sum()),
+            "max_offset": int(self.active.shape[1] - 1) if self.active.size else 0,
+            "active_cells": int(len(self.seen)),
+        }
+
+
+def build_cohorts(dfs: Dict[str, pd.DataFrame]) -> Dict[str, CohortMatrix]:
+    """Week and month cohort matrices from users.signup_date, events.timestamp and purchases.purchased_at."""
+    users = dfs.get("users")
+    if users is None or not {"id", "signup_date"} <= set(users.columns):
+        return {}
+    out: Dict[str, CohortMatrix] = {}
+    for granularity in COHORT_GRANULARITIES:
+        m = CohortMatrix(granularity)
+        m.add_users(users["id"], users["signup_date"])
+        update_cohorts({granularity: m}, "events", dfs.get("events"))
+        update_cohorts({granularity: m}, "purchases", dfs.get("purchases"))
+        out[granularity] = m
+    return out
+
+
+def update_cohorts(cohorts: Dict[str, CohortMatrix], table: str, rows: Optional[pd.DataFrame]) -> None:
+    """Fold newly appended rows of `table` into every cohort matrix."""
+    if rows is None or rows.empty:
+        return
+    for m in cohorts.values():
+        if table == "users" and {"id", "signup_date"} <= set(rows.columns):
+            m.add_users(rows["id"], rows["signup_date"])
+        elif table == "events" and {"user_id", "timestamp"} <= set(rows.columns):
+            m.add_events(rows["user_id"], rows["timestamp"])
+        elif table == "purchases" and {"user_id", "purchased_at", "total_amount"} <= set(rows.columns):
+            m.add_purchases(rows["user_id"], rows["purchased_at"], rows["total_amount"])
+            # A purchase also makes the user active in that period
+            m.add_events(rows["user_id"], rows["purchased_at"])
+
+
+def heatmap_spec(result: Dict[str, Any], metric: str) -> Dict[str, Any]:
+    """Heatmap-style Chart.js bubble chart: one square-ish point per cell, opacity scaled by value."""
+    cells: List[Dict[str, Any]] = []
+    colors: List[str] = []
+    flat = [v for row in result["matrix"] for v in row if v is not None]
+    top = max(flat) if flat else 0.0
+    for label, row in zip(result["cohorts"], result["matrix"]):
+        for period, v in zip(result["periods"], row):
+            if v is None:
+                continue
+            cells.append({"x": period, "y": label, "r": 9, "v": v})
+            alpha = 0.08 + 0.92 * (v / top) if top else 0.08
+            colors.append(f"rgba(108, 92, 231, {alpha:.3f})")
+    title = {"retention": "Retention by signup cohort", "active": "Active users by signup cohort", "revenue": "Cumulative revenue by signup cohort"}[metric]
+    return {
+        "type": "bubble",
+        "data": {
+            "datasets": [{
+                "label": title,
+                "data": cells,
+                "backgroundColor": colors,
+                "borderWidth": 0,
+                "pointStyle": "rect",
+            }]
+        },
+        "options": {
+            "responsive": True,
+            "maintainAspectRatio": False,
+            "plugins": {"legend": {"display": False}, "title": {"display": True, "text": title}},
+            "scales": {
+                "x": {"type": "linear", "min": -0.5, "max": len(result["periods"]) - 0.5, "ticks": {"stepSize": 1}, "title": {"display": True, "text": "periods since signup"}},
+                "y": {"type": "category", "labels": result["cohorts"], "reverse": True, "title": {"display": True, "text": "signup cohort"}},
+            },
+        },
+    }
@@ -1,17 +1,23 @@
 import os
 import json
 import uuid
+import pickle
+import time
 from datetime import datetime, timedelta
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Optional, Tuple
 
 import pandas as pd
-from faker import Faker
 
+from partition_utils import PARTITIONED_TABLES, cluster_by_time
 
-DATA_DIR = os.path.join(os.path.dirname(__file__), "data")
+
+DATA_DIR = os.getenv("DATA_DIR", os.path.join(os.path.dirname(__file__), "data"))
 USERS_PATH = os.path.join(DATA_DIR, "users.json")
 EVENTS_PATH = os.path.join(DATA_DIR, "events.json")
 PURCHASES_PATH = os.path.join(DATA_DIR, "purchases.json")
+SNAPSHOT_PATH = os.getenv("DATA_SNAPSHOT_PATH", os.path.join(DATA_DIR, "snapshot.pkl"))
+SNAPSHOT_VERSION = 5
+SOURCE_PATHS = {"users": USERS_PATH, "events": EVENTS_PATH, "purchases": PURCHASES_PATH}
 
 
 def ensure_data_dir() -> None:
@@ -22,6 +28,11 @@ def ensure_data_dir() -> None:
 def generate_fake_data(num_users: int = 100, num_events: int = 1500) -> None:
     """Create demo JSON data files if they don't already exist: users, events, purchases."""
     ensure_data_dir()
+    if all(os.path.exists(p) for p in SOURCE_PATHS.values()):
+        return
+    # Faker is slow to import and only needed when data has to be generated
+    from faker import Faker
+
     fake = Faker()
     Faker.seed(42)
 
@@ -106,11 +117,167 @@ def load_dataframes() -> Dict[str, pd.DataFrame]:
         events = json.load(f)
     with open(PURCHASES_PATH) as f:
         purchases = json.load(f)    
-    return {
+    dfs = {
         "users": pd.DataFrame(users),
         "events": pd.DataFrame(events),
         "purchases": pd.DataFrame(purchases),
     }
+    # Time-ordered rows make each day/month partition one contiguous range of the frame
+    for tbl, col in PARTITIONED_TABLES.items():
+        if col in dfs[tbl].columns:
+            dfs[tbl] = cluster_by_time(dfs[tbl], pd.to_datetime(dfs[tbl][col], errors="coerce", utc=True))
+    return dfs
+
+
+def is_time_column(name: str) -> bool:
+    return "date" in name or "time" in name or name.endswith("_at") or name.endswith("timestamp")
+
+
+def _top_by_user(df: pd.DataFrame, value_col: str, users: Optional[pd.DataFrame]) -> pd.DataFrame:
+    from parallel_utils import group_aggregate
+
+    grp = group_aggregate(df, ["user_id"], {value_col: (value_col, "sum")}, {"user_id": df})
+    grp = grp.reset_index().sort_values(value_col, ascending=False)
+    if users is not None:
+        keep = [c for c in ("id", "name", "email") if c in users.columns]
+        grp = grp.merge(users[keep], left_on="user_id", right_on="id", how="left")
+    return grp.reset_index(drop=True)
+
+
+def build_derived_state(dfs: Dict[str, pd.DataFrame]) -> Dict[str, Any]:
+    """Precompute state the tools would otherwise rebuild per request.
+
+    - timestamps: parsed UTC datetimes for every time-like column
+    - days: the same as "YYYY-MM-DD" strings (chart x axis)
+    - user_pos: users.id -> row position
+    - aggregates: per-user revenue and clicks, sorted descending and joined to names
+    - event_index: events as (user, time)-sorted NumPy arrays for funnel analysis
+    - cohorts: weekly and monthly signup-cohort retention/revenue matrices
+    - sessions: events grouped into inactivity-gap sessions (served as the "sessions" table)
+    """
+    # Deferred so importing data_utils alone stays light; unpickling a snapshot and the server's
+    # tools still import these modules, so this does not take them off the server's startup path
+    from cohort_utils import build_cohorts
+    from funnel_utils import build_event_index
+    from session_utils import build_sessions
+
+    timestamps: Dict[str, Dict[str, pd.Series]] = {}
+    days: Dict[str, Dict[str, pd.Series]] = {}
+    for tbl, df in dfs.items():
+        for col in df.columns:
+            if not is_time_column(col):
+                continue
+            parsed = pd.to_datetime(df[col], errors="coerce", utc=True)
+            timestamps.setdefault(tbl, {})[col] = parsed
+            days.setdefault(tbl, {})[col] = parsed.dt.strftime("%Y-%m-%d").fillna("NaT")
+
+    users = dfs.get("users")
+    user_pos: Dict[str, int] = {}
+    if users is not None and "id" in users.columns:
+        user_pos = {str(uid): i for i, uid in enumerate(users["id"].tolist())}
+
+    aggregates: Dict[str, pd.DataFrame] = {}
+    p = dfs.get("purchases")
+    if p is not None and not p.empty and {"user_id", "total_amount"} <= set(p.columns):
+        aggregates["revenue_by_user"] = _top_by_user(p, "total_amount", users)
+    e = dfs.get("events")
+    if e is not None and not e.empty and {"user_id", "clicks"} <= set(e.columns):
+        aggregates["clicks_by_user"] = _top_by_user(e, "clicks", users)
+
+    event_index: Optional[Dict[str, Any]] = None
+    if e is not None and {"user_id", "event_type"} <= set(e.columns) and "timestamp" in timestamps.get("events", {}):
+        event_index = build_event_index(e, timestamps["events"]["timestamp"])
+
+    return {
+        "timestamps": timestamps,
+        "days": days,
+        "user_pos": user_pos,
+        "aggregates": aggregates,
+        "event_index": event_index,
+        "cohorts": build_cohorts(dfs),
+        "sessions": build_sessions(dfs, timestamps.get("events", {}).get("timestamp"), event_index),
+    }
+
+
+def source_fingerprint() -> Dict[str, Tuple[float, int]]:
+    out: Dict[str, Tuple[float, int]] = {}
+    for tbl, path in SOURCE_PATHS.items():
+        st = os.stat(path)
+        out[tbl] = (st.st_mtime, st.st_size)
+    return out
+
+
+def session_settings() -> Dict[str, Any]:
+    """Settings baked into the derived sessions table; a snapshot built under others is stale."""
+    import session_utils
+
+    return {"gap_minutes": session_utils.SESSION_GAP_MINUTES, "conversion_event": session_utils.SESSION_CONVERSION_EVENT}
+
+
+def save_snapshot(dfs: Dict[str, pd.DataFrame], derived: Dict[str, Any], path: str = SNAPSHOT_PATH) -> None:
+    payload = {
+        "version": SNAPSHOT_VERSION,
+        "pandas": pd.__version__,
+        "sources": source_fingerprint(),
+        "sessions": session_settings(),
+        "dfs": dfs,
+        "derived": derived,
+    }
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        pickle.dump(payload, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_path, path)
+
+
+def load_snapshot(path: str = SNAPSHOT_PATH) -> Optional[Tuple[Dict[str, pd.DataFrame], Dict[str, Any]]]:
+    """Return (dfs, derived) from a snapshot written by this code against the current source files."""
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, "rb") as f:
+            payload = pickle.load(f)
+    except Exception:
+        return None
+    if payload.get("version") != SNAPSHOT_VERSION or payload.get("pandas") != pd.__version__:
+        return None
+    if payload.get("sessions") != session_settings():
+        return None
+    try:
+        if payload.get("sources") != source_fingerprint():
+            return None
+    except OSError:
+        return None
+    return payload["dfs"], payload["derived"]
+
 
+def load_state(snapshot_mode: str = "auto", path: str = SNAPSHOT_PATH) -> Tuple[Dict[str, pd.DataFrame], Dict[str, Any], Dict[str, Any]]:
+    """Load frames and derived state, going through the snapshot when `snapshot_mode` allows.
 
+    Modes: "off" always parses the JSON sources; "auto" loads a fresh snapshot
+    or rebuilds and rewrites it. Returns (dfs, derived, report) where report
+    holds the load and derived-state build times in milliseconds.
+    """
+    report: Dict[str, Any] = {"snapshot_mode": snapshot_mode, "snapshot_hit": False}
+    t0 = time.perf_counter()
+    if snapshot_mode == "auto":
+        loaded = load_snapshot(path)
+        if loaded is not None:
+            report["snapshot_hit"] = True
+            report["load_ms"] = round((time.perf_counter() - t0) * 1000, 1)
+            report["derived_ms"] = 0.0
+            return loaded[0], loaded[1], report
 
+    generate_fake_data()
+    dfs = load_dataframes()
+    t1 = time.perf_counter()
+    derived = build_derived_state(dfs)
+    t2 = time.perf_counter()
+    report["load_ms"] = round((t1 - t0) * 1000, 1)
+    report["derived_ms"] = round((t2 - t1) * 1000, 1)
+    if snapshot_mode == "auto":
+        try:
+            save_snapshot(dfs, derived, path)
+            report["snapshot_write_ms"] = round((time.perf_counter() - t2) * 1000, 1)
+        except Exception as e:
+            report["snapshot_error"] = str(e)
+    return dfs, derived, report
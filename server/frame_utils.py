@@ -0,0 +1,124 @@
+import json
+import math
+import datetime as dt
+from decimal import Decimal
+from typing import Any, Dict, Iterable, Iterator, Optional, Union
+
+import numpy as np
+import pandas as pd
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - stdlib fallback keeps the server working without orjson
+    orjson = None
+
+
+def _default(obj: Any) -> Any:
+    """Types neither encoder knows: NumPy/pandas scalars and arrays, missing values, decimals, sets."""
+    if obj is pd.NaT or obj is pd.NA or obj is None:
+        return None
+    if isinstance(obj, (pd.Timestamp, dt.datetime, dt.date, dt.time)):
+        return obj.isoformat()
+    if isinstance(obj, np.datetime64):
+        return None if np.isnat(obj) else pd.Timestamp(obj).isoformat()
+    if isinstance(obj, (pd.Timedelta, dt.timedelta, np.timedelta64)):
+        return pd.Timedelta(obj).total_seconds()
+    if isinstance(obj, np.bool_):
+        return bool(obj)
+    if isinstance(obj, np.integer):
+        return int(obj)
+    if isinstance(obj, np.floating):
+        return _finite(float(obj))
+    if isinstance(obj, np.ndarray):
+        return [_default(v) if isinstance(v, np.generic) else v for v in obj.tolist()]
+    if isinstance(obj, (pd.Series, pd.Index)):
+        return _default(obj.to_numpy())
+    if isinstance(obj, Decimal):
+        return _finite(float(obj))
+    if isinstance(obj, (set, frozenset)):
+        return list(obj)
+    return str(obj)
+
+
+def _finite(value: float) -> Any:
+    return value if math.isfinite(value) else None
+
+
+def _sanitize(obj: Any) -> Any:
+    # The stdlib encoder writes NaN/Infinity literals, which JSON.parse rejects
+    if isinstance(obj, float):
+        return _finite(obj)
+    if isinstance(obj, dict):
+        return {(k if isinstance(k, str) else str(_default(k))): _sanitize(v) for k, v in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return [_sanitize(v) for v in obj]
+    if isinstance(obj, (str, int, bool)) or obj is None:
+        return obj
+    return _sanitize(_default(obj))
+
+
+def encode(obj: Any) -> bytes:
+    """Compact JSON bytes for tool results and stream frames.
+
+    NumPy and pandas scalars, timestamps and missing values (NaN, NaT, NA)
+    are encoded natively, with missing values as null. The output never
+    contains a raw newline, so it fits in a single SSE data line.
+    """
+    if orjson is not None:
+        try:
+            return orjson.dumps(obj, default=_default, option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS)
+        except TypeError:
+            # e.g. integers beyond 64 bits; the slower path below handles them
+            pass
+    return json.dumps(_sanitize(obj), separators=(",", ":"), ensure_ascii=False, allow_nan=False).encode()
+
+
+class Encoded:
+    """A value serialized once; `raw` is spliced into frames and `text` feeds the model history.
+
+    For dicts each top-level value is encoded separately and kept in `parts`,
+    so a frame that repeats one field (e.g. a chart spec) reuses its bytes.
+    """
+
+    __slots__ = ("raw", "parts", "_text")
+
+    def __init__(self, value: Any):
+        self.parts: Dict[str, Encoded] = {}
+        self._text: Optional[str] = None
+        if isinstance(value, dict) and all(isinstance(k, str) for k in value):
+            self.parts = {k: Encoded.of_raw(encode(v)) for k, v in value.items()}
+            self.raw = b"{" + b",".join(encode(k) + b":" + part.raw for k, part in self.parts.items()) + b"}"
+        else:
+            self.raw = encode(value)
+
+    @classmethod
+    def of_raw(cls, raw: bytes) -> "Encoded":
+        enc = cls.__new__(cls)
+        enc.raw, enc.parts, enc._text = raw, {}, None
+        return enc
+
+    @property
+    def text(self) -> str:
+        if self._text is None:
+            self._text = self.raw.decode()
+        return self._text
+
+
+def frame(type_: str, **fields: Any) -> bytes:
+    """One event frame; Encoded field values are spliced in as-is instead of being re-encoded."""
+    parts = [b'{"type":', encode(type_)]
+    for key, value in fields.items():
+        parts.append(b"," + encode(key) + b":")
+        parts.append(value.raw if isinstance(value, Encoded) else encode(value))
+    parts.append(b"}")
+    return b"".join(parts)
+
+
+def sse_frames(frames: Iterable[Union[bytes, str]]) -> Iterator[bytes]:
+    """Write each JSON frame as a single `data:` line; encoded frames have no newlines to split."""
+    for payload in frames:
+        if payload is None:
+            continue
+        if isinstance(payload, str):
+            payload = payload.encode()
+        yield b"data: " + payload + b"\n\n"
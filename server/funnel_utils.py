@@ -0,0 +1,182 @@
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+
+DEFAULT_FUNNEL_STEPS = ["page_view", "product_click", "add_to_cart", "checkout_start", "purchase"]
+DEFAULT_WINDOW_HOURS = 7 * 24
+MAX_BREAKDOWN_GROUPS = 20
+OTHER_GROUP = "(other)"
+
+
+def build_event_index(events: pd.DataFrame, ts: pd.Series) -> Dict[str, Any]:
+    """Events as NumPy arrays sorted by (user, time), for per-user sequence analysis.
+
+    Users, event types and pages are dictionary-encoded, and `by_type` holds
+    the sorted positions of each event type so a funnel step only touches
+    the events of its own type. Events without a timestamp or user are
+    dropped.
+    """
+    ts_ns = ts.to_numpy(dtype="datetime64[ns]").view("int64")
+    keep = ~pd.isna(ts).to_numpy() & events["user_id"].notna().to_numpy()
+    user_codes, users = pd.factorize(events["user_id"].to_numpy()[keep])
+    type_codes, event_types = pd.factorize(events["event_type"].to_numpy()[keep])
+    ts_ns = ts_ns[keep]
+    order = np.lexsort((ts_ns, user_codes))
+    index: Dict[str, Any] = {
+        "users": np.asarray(users, dtype=object),
+        "event_types": [str(t) for t in event_types],
+        "user_codes": user_codes[order].astype(np.int64),
+        "ts": ts_ns[order],
+        "type_codes": type_codes[order].astype(np.int32),
+    }
+    if "page" in events.columns:
+        page_codes, pages = pd.factorize(events["page"].to_numpy()[keep])
+        index["page_codes"] = page_codes[order].astype(np.int32)
+        index["pages"] = [str(p) for p in pages]
+    by_type = np.argsort(index["type_codes"], kind="stable")
+    bounds = np.searchsorted(index["type_codes"][by_type], np.arange(len(event_types) + 1))
+    index["by_type"] = [by_type[bounds[i]:bounds[i + 1]] for i in range(len(event_types))]
+    return index
+
+
+def _user_groups(
+    index: Dict[str, Any], breakdown: Optional[str], entry_pos: np.ndarray, users: Optional[pd.DataFrame]
+) -> Optional[pd.Series]:
+    """Breakdown label per user code: the page of the user's first step, or a users-table attribute."""
+    if not breakdown:
+        return None
+    if breakdown == "page":
+        if "page_codes" not in index:
+            raise ValueError("events have no page column")
+        labels = np.full(len(index["users"]), None, dtype=object)
+        entered = entry_pos >= 0
+        pages = np.asarray(index["pages"], dtype=object)
+        labels[entered] = pages[index["page_codes"][entry_pos[entered]]]
+        return pd.Series(labels)
+    if users is None or breakdown not in users.columns or "id" not in users.columns:
+        raise ValueError(f"Unknown breakdown: {breakdown}")
+    attr = users.drop_duplicates("id").set_index("id")[breakdown]
+    return pd.Series(index["users"]).map(attr)
+
+
+def compute_funnel(
+    index: Dict[str, Any],
+    steps: List[str],
+    window_hours: float = DEFAULT_WINDOW_HOURS,
+    since: Optional[str] = None,
+    until: Optional[str] = None,
+    breakdown: Optional[str] = None,
+    users: Optional[pd.DataFrame] = None,
+    max_groups: int = MAX_BREAKDOWN_GROUPS,
+) -> Dict[str, Any]:
+    """Ordered funnel conversion per user.
+
+    A user enters on their first `steps[0]` event in [since, until); each
+    later step counts at its first event that comes after the previous step
+    and within `window_hours` of entry. Every step is a masked gather over
+    that event type's positions plus a first-per-user pick on the sorted
+    user codes, so the cost is linear in the events of the requested types.
+    """
+    if not steps:
+        raise ValueError("steps must not be empty")
+    type_lookup = {t: i for i, t in enumerate(index["event_types"])}
+    unknown = [s for s in steps if s not in type_lookup]
+    if unknown:
+        raise ValueError(f"Unknown event_type(s): {', '.join(unknown)}")
+    n_users = len(index["users"])
+    user_codes = index["user_codes"]
+    ts = index["ts"]
+    window_ns = int(float(window_hours) * 3600 * 1e9)
+    lo = pd.Timestamp(since, tz="UTC").value if since else None
+    hi = pd.Timestamp(until, tz="UTC").value if until else None
+
+    reached = np.full(n_users, -1, dtype=np.int64)
+    start_ts = np.zeros(n_users, dtype=np.int64)
+    reached_by_step: List[np.ndarray] = []
+    elapsed_by_step: List[np.ndarray] = []
+    for k, step in enumerate(steps):
+        cand = index["by_type"][type_lookup[step]]
+        cand_ts = ts[cand]
+        ok = np.ones(len(cand), dtype=bool)
+        if lo is not None:
+            ok &= cand_ts >= lo
+        if hi is not None:
+            ok &= cand_ts < hi
+        u = user_codes[cand]
+        if k:
+            prev = reached[u]
+            ok &= (prev >= 0) & (cand > prev) & (cand_ts - start_ts[u] <= window_ns)
+        cand, u = cand[ok], u[ok]
+        # Positions are user-major, so the first candidate of each run of user codes is that user's earliest
+        first = np.ones(len(u), dtype=bool)
+        first[1:] = u[1:] != u[:-1]
+        step_users, step_pos = u[first], cand[first]
+        reached = np.full(n_users, -1, dtype=np.int64)
+        reached[step_users] = step_pos
+        if k == 0:
+            start_ts[step_users] = ts[step_pos]
+            entry_pos = reached.copy()
+        reached_by_step.append(step_users)
+        elapsed_by_step.append((ts[step_pos] - start_ts[step_users]) / 1e9)
+
+    groups = _user_groups(index, breakdown, entry_pos, users)
+    if groups is None:
+        group_codes = np.zeros(n_users, dtype=np.int64)
+        group_names: List[Any] = ["all"]
+    else:
+        # Keep the largest groups by entrants; the rest are folded together
+        entrants = groups.iloc[reached_by_step[0]]
+        top = entrants.value_counts(dropna=False).index[:max(1, max_groups)].tolist()
+        labels = groups.where(groups.isin(top), OTHER_GROUP) if len(top) < entrants.nunique(dropna=False) else groups
+        codes, uniques = pd.factorize(labels.to_numpy(), use_na_sentinel=False)
+        group_codes = codes.astype(np.int64)
+        group_names = [None if pd.isna(g) else (g.item() if isinstance(g, np.generic) else g) for g in uniques]
+
+    n_groups = len(group_names)
+    counts = np.zeros((len(steps), n_groups), dtype=np.int64)
+    medians = np.full((len(steps), n_groups), np.nan)
+    for k, step_users in enumerate(reached_by_step):
+        g = group_codes[step_users]
+        counts[k] = np.bincount(g, minlength=n_groups)[:n_groups]
+        if len(g):
+            med = pd.Series(elapsed_by_step[k]).groupby(g).median()
+            medians[k, med.index.to_numpy()] = med.to_numpy()
+
+    rows: List[Dict[str, Any]] = []
+    for gi in np.argsort(-counts[0], kind="stable"):
+        if not counts[0, gi]:
+            continue
+        for k, step in enumerate(steps):
+            users_k = int(counts[k, gi])
+            row: Dict[str, Any] = {}
+            if breakdown:
+                row[breakdown] = group_names[gi]
+            row.update({
+                "step": k + 1,
+                "event_type": step,
+                "users": users_k,
+                "conversion_from_prev": round(users_k / int(counts[k - 1, gi]), 4) if k and counts[k - 1, gi] else (1.0 if k == 0 else 0.0),
+                "conversion_from_start": round(users_k / int(counts[0, gi]), 4),
+                "median_time_from_start_sec": None if np.isnan(medians[k, gi]) else round(float(medians[k, gi]), 1),
+            })
+            rows.append(row)
+
+    entered = int(len(reached_by_step[0]))
+    completed = int(len(reached_by_step[-1]))
+    columns = ([breakdown] if breakdown else []) + [
+        "step", "event_type", "users", "conversion_from_prev", "conversion_from_start", "median_time_from_start_sec",
+    ]
+    return {
+        "columns": columns,
+        "rows": rows,
+        "summary": {
+            "steps": steps,
+            "entered": entered,
+            "completed": completed,
+            "overall_conversion": round(completed / entered, 4) if entered else 0.0,
+            "window_hours": window_hours,
+            "events_indexed": int(len(ts)),
+        },
+    }
@@ -1,18 +1,29 @@
 import os
 import json
+import time
+import atexit
+import hashlib
+import threading
+from collections import OrderedDict
 from datetime import datetime
-from typing import Any, Dict, List
+from typing import Any, Dict, List, Optional, Set
 
 from flask import Blueprint, jsonify, request
 
 
-def ensure_memory_file(memory_path: str) -> None:
-    data_dir = os.path.dirname(memory_path)
-    if not os.path.exists(data_dir):
-        os.makedirs(data_dir, exist_ok=True)
-    if not os.path.exists(memory_path):
-        with open(memory_path, "w") as f:
-            json.dump({"sessions": {}}, f)
+MAX_ENTITIES_PER_SESSION = 500
+MAX_FACTS_PER_SESSION = 200
+FLUSH_INTERVAL_SEC = float(os.getenv("MEMORY_FLUSH_INTERVAL_SEC", "2.0"))
+FLUSH_DIRTY_THRESHOLD = int(os.getenv("MEMORY_FLUSH_DIRTY_THRESHOLD", "50"))
+SESSION_TTL_SEC = float(os.getenv("MEMORY_SESSION_TTL_SEC", str(7 * 24 * 3600)))
+SESSION_IDLE_UNLOAD_SEC = float(os.getenv("MEMORY_SESSION_IDLE_UNLOAD_SEC", "600"))
+COMPACT_INTERVAL_SEC = float(os.getenv("MEMORY_COMPACT_INTERVAL_SEC", "300"))
+MIGRATED_MARKER = ".migrated"
+
+
+def ensure_memory_dir(memory_dir: str) -> None:
+    if not os.path.exists(memory_dir):
+        os.makedirs(memory_dir, exist_ok=True)
 
 
 def _load_memory(memory_path: str) -> Dict[str, Any]:
@@ -24,66 +35,344 @@ def _load_memory(memory_path: str) -> Dict[str, Any]:
 
 
 def _save_memory(memory_path: str, mem: Dict[str, Any]) -> None:
+    tmp_path = memory_path + ".tmp"
     try:
-        with open(memory_path, "w") as f:
+        os.makedirs(os.path.dirname(memory_path), exist_ok=True)
+        with open(tmp_path, "w") as f:
             json.dump(mem, f, indent=2)
+        os.replace(tmp_path, memory_path)
     except Exception:
         pass
 
 
-def _get_session_mem(mem: Dict[str, Any], session_id: str) -> Dict[str, Any]:
-    sessions = mem.setdefault("sessions", {})
-    sess = sessions.setdefault(session_id, {})
-    entities = sess.setdefault("entities", {})
-    entities.setdefault("users_by_id", {})
-    entities.setdefault("users_by_name", {})
-    sess.setdefault("facts", [])
-    return sess
+def session_path(memory_dir: str, session_id: str) -> str:
+    """Shard file for a session: <memory_dir>/<2 hex chars>/<sha1 of session id>.json"""
+    digest = hashlib.sha1(session_id.encode("utf-8")).hexdigest()
+    return os.path.join(memory_dir, digest[:2], digest + ".json")
 
 
 def _normalize_name(name: str) -> str:
     return (name or "").strip().lower()
 
 
-def remember_users(memory_path: str, session_id: str, rows: List[Dict[str, Any]]) -> None:
+class EntityLRU:
+    """Per-session user entities with O(1) touch/evict and consistent id/name indexes."""
+
+    def __init__(self, capacity: int = MAX_ENTITIES_PER_SESSION):
+        self.capacity = capacity
+        self.by_id: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self.by_name: Dict[str, str] = {}
+
+    @classmethod
+    def from_dict(cls, entities: Dict[str, Any], capacity: int = MAX_ENTITIES_PER_SESSION) -> "EntityLRU":
+        lru = cls(capacity)
+        # users_by_id is stored least- to most-recently used; the name index is rebuilt from it
+        for uid, entry in (entities.get("users_by_id") or {}).items():
+            lru.put(uid, entry)
+        return lru
+
+    def _unindex_name(self, uid: str, entry: Dict[str, Any]) -> None:
+        key = _normalize_name(entry.get("name") or "")
+        if key and self.by_name.get(key) == uid:
+            del self.by_name[key]
+
+    def put(self, uid: str, entry: Dict[str, Any]) -> None:
+        old = self.by_id.get(uid)
+        if old is not None:
+            self._unindex_name(uid, old)
+            self.by_id.move_to_end(uid)
+        self.by_id[uid] = entry
+        key = _normalize_name(entry.get("name") or "")
+        if key:
+            self.by_name[key] = uid
+        while len(self.by_id) > self.capacity:
+            evicted_id, evicted = self.by_id.popitem(last=False)
+            self._unindex_name(evicted_id, evicted)
+
+    def get(self, uid: str) -> Optional[Dict[str, Any]]:
+        entry = self.by_id.get(uid)
+        if entry is not None:
+            self.by_id.move_to_end(uid)
+        return entry
+
+    def get_by_name(self, name: str) -> Optional[Dict[str, Any]]:
+        uid = self.by_name.get(_normalize_name(name))
+        return self.get(uid) if uid else None
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"users_by_id": dict(self.by_id), "users_by_name": dict(self.by_name)}
+
+
+class MemoryStore:
+    """Session memory sharded into one file per session under `memory_dir`.
+
+    Sessions are loaded on first access and looked up by id, so the cost of a
+    lookup does not depend on how many sessions exist. Mutations only mark a
+    session dirty; a background thread writes dirty sessions every
+    `flush_interval` seconds, sooner once `dirty_threshold` changes have
+    accumulated, and once more at interpreter shutdown.
+
+    The same thread periodically compacts storage: sessions not accessed for
+    `ttl` seconds are deleted (ttl <= 0 disables expiry), clean sessions idle
+    for `idle_unload` seconds are dropped from RAM, and empty shard
+    directories are removed.
+    """
+
+    def __init__(
+        self,
+        memory_dir: str,
+        legacy_path: Optional[str] = None,
+        flush_interval: float = FLUSH_INTERVAL_SEC,
+        dirty_threshold: int = FLUSH_DIRTY_THRESHOLD,
+        ttl: float = SESSION_TTL_SEC,
+        idle_unload: float = SESSION_IDLE_UNLOAD_SEC,
+        compact_interval: float = COMPACT_INTERVAL_SEC,
+    ):
+        self.memory_dir = memory_dir
+        self.flush_interval = flush_interval
+        self.dirty_threshold = max(1, dirty_threshold)
+        self.ttl = ttl
+        self.idle_unload = idle_unload
+        self.compact_interval = compact_interval
+        self._lock = threading.RLock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopped = threading.Event()
+        self._dirty_count = 0
+        self._dirty: Set[str] = set()
+        self._touched: Set[str] = set()
+        self._sessions: Dict[str, Dict[str, Any]] = {}
+        self._last_compact = time.time()
+        ensure_memory_dir(memory_dir)
+        if legacy_path:
+            self._migrate_legacy(legacy_path)
+        self._thread = threading.Thread(target=self._run, name="memory-flush", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def _migrate_legacy(self, legacy_path: str) -> None:
+        """Split a single-document memory.json into per-session shards, once."""
+        marker = os.path.join(self.memory_dir, MIGRATED_MARKER)
+        if os.path.exists(marker) or not os.path.exists(legacy_path):
+            return
+        now = time.time()
+        for session_id, sess in (_load_memory(legacy_path).get("sessions") or {}).items():
+            path = session_path(self.memory_dir, session_id)
+            if os.path.exists(path):
+                continue
+            _save_memory(path, {
+                "session_id": session_id,
+                "last_access": now,
+                "entities": EntityLRU.from_dict(sess.get("entities") or {}).to_dict(),
+                "facts": list(sess.get("facts") or []),
+            })
+        with open(marker, "w") as f:
+            f.write(datetime.utcnow().isoformat() + "Z")
+
+    def _load_session(self, session_id: str) -> Optional[Dict[str, Any]]:
+        path = session_path(self.memory_dir, session_id)
+        if not os.path.exists(path):
+            return None
+        data = _load_memory(path)
+        last_access = max(float(data.get("last_access") or 0.0), os.path.getmtime(path))
+        if self.ttl > 0 and time.time() - last_access > self.ttl:
+            return None
+        return {
+            "entities": EntityLRU.from_dict(data.get("entities") or {}),
+            "facts": list(data.get("facts") or []),
+            "last_access": last_access,
+        }
+
+    def _preload(self, session_id: str) -> None:
+        """Read a session's shard into memory if it is not loaded, with the disk read outside the lock."""
+        with self._lock:
+            if session_id in self._sessions:
+                return
+        loaded = self._load_session(session_id)
+        if loaded is None:
+            return
+        with self._lock:
+            # A racing load or create may have inserted (and changed) the session meanwhile; keep it
+            self._sessions.setdefault(session_id, loaded)
+
+    def _session(self, session_id: str, create: bool = True) -> Optional[Dict[str, Any]]:
+        """The loaded session; called with the lock held, normally after `_preload`."""
+        sess = self._sessions.get(session_id)
+        if sess is None:
+            # Only when compaction unloaded it since the preload
+            sess = self._load_session(session_id)
+            if sess is None:
+                if not create:
+                    return None
+                sess = {"entities": EntityLRU(), "facts": [], "last_access": time.time()}
+            self._sessions[session_id] = sess
+        sess["last_access"] = time.time()
+        self._touched.add(session_id)
+        return sess
+
+    def _mark_dirty(self, session_id: str, n: int = 1) -> None:
+        self._dirty.add(session_id)
+        self._dirty_count += n
+        if self._dirty_count >= self.dirty_threshold:
+            self._wake.set()
+
+    def remember_users(self, session_id: str, rows: List[Dict[str, Any]]) -> None:
+        self._preload(session_id)
+        with self._lock:
+            entities: EntityLRU = self._session(session_id)["entities"]
+            changed = 0
+            for row in rows:
+                uid = str(row.get("id") or row.get("user_id") or "")
+                if not uid:
+                    continue
+                entities.put(uid, {
+                    "id": uid,
+                    "name": row.get("name"),
+                    "email": row.get("email"),
+                    "location": row.get("location"),
+                    "age": row.get("age"),
+                })
+                changed += 1
+            if changed:
+                self._mark_dirty(session_id, changed)
+
+    def add_fact(self, session_id: str, fact: Any) -> None:
+        self._preload(session_id)
+        with self._lock:
+            sess = self._session(session_id)
+            sess["facts"].append({"ts": datetime.utcnow().isoformat() + "Z", "fact": fact})
+            if len(sess["facts"]) > MAX_FACTS_PER_SESSION:
+                sess["facts"] = sess["facts"][-MAX_FACTS_PER_SESSION:]
+            self._mark_dirty(session_id)
+
+    def get_session(self, session_id: str) -> Dict[str, Any]:
+        self._preload(session_id)
+        with self._lock:
+            sess = self._session(session_id, create=False)
+            if sess is None:
+                return {}
+            return {"entities": sess["entities"].to_dict(), "facts": list(sess["facts"])}
+
+    def _serialize(self, session_id: str, sess: Dict[str, Any]) -> Dict[str, Any]:
+        return {
+            "session_id": session_id,
+            "last_access": sess["last_access"],
+            "entities": sess["entities"].to_dict(),
+            "facts": list(sess["facts"]),
+        }
+
+    def flush(self) -> None:
+        with self._flush_lock:
+            with self._lock:
+                pending = {sid: self._serialize(sid, self._sessions[sid]) for sid in self._dirty if sid in self._sessions}
+                touched = [(sid, self._sessions[sid]["last_access"]) for sid in self._touched - self._dirty if sid in self._sessions]
+                self._dirty.clear()
+                self._touched.clear()
+                self._dirty_count = 0
+            for sid, data in pending.items():
+                _save_memory(session_path(self.memory_dir, sid), data)
+            # Read-only access only bumps the shard's mtime, which compaction uses as last access
+            for sid, last_access in touched:
+                try:
+                    os.utime(session_path(self.memory_dir, sid), (last_access, last_access))
+                except OSError:
+                    pass
+
+    def compact(self) -> Dict[str, int]:
+        """Expire sessions past the TTL, unload idle ones from RAM and prune empty shards."""
+        now = time.time()
+        stats = {"expired": 0, "unloaded": 0, "shards_removed": 0}
+        self.flush()
+        expired_loaded: Set[str] = set()
+        with self._lock:
+            for sid in list(self._sessions):
+                idle = now - self._sessions[sid]["last_access"]
+                if self.ttl > 0 and idle > self.ttl:
+                    del self._sessions[sid]
+                    self._dirty.discard(sid)
+                    self._touched.discard(sid)
+                    expired_loaded.add(session_path(self.memory_dir, sid))
+                    stats["expired"] += 1
+                elif idle > self.idle_unload and sid not in self._dirty:
+                    del self._sessions[sid]
+                    stats["unloaded"] += 1
+            loaded = {session_path(self.memory_dir, sid) for sid in self._sessions}
+        with os.scandir(self.memory_dir) as shards:
+            shard_dirs = [e.path for e in shards if e.is_dir()]
+        for shard in shard_dirs:
+            # Shard files are only written under the flush lock, so holding it here means an
+            # empty directory cannot be removed from under a write into it
+            with self._flush_lock:
+                if self.ttl > 0:
+                    with os.scandir(shard) as files:
+                        for entry in files:
+                            if not entry.name.endswith(".json") or entry.path in loaded:
+                                continue
+                            try:
+                                if entry.path in expired_loaded:
+                                    # Already counted when it expired in memory
+                                    os.remove(entry.path)
+                                elif now - entry.stat().st_mtime > self.ttl:
+                                    os.remove(entry.path)
+                                    stats["expired"] += 1
+                            except OSError:
+                                continue
+                try:
+                    os.rmdir(shard)
+                    stats["shards_removed"] += 1
+                except OSError:
+                    # Not empty
+                    continue
+        return stats
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"loaded_sessions": len(self._sessions), "dirty_sessions": len(self._dirty), "ttl_sec": self.ttl}
+
+    def _run(self) -> None:
+        while not self._stopped.is_set():
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            self.flush()
+            if time.time() - self._last_compact >= self.compact_interval:
+                self._last_compact = time.time()
+                try:
+                    self.compact()
+                except Exception:
+                    pass
+
+    def close(self) -> None:
+        self._stopped.set()
+        self._wake.set()
+        self.flush()
+
+
+_stores: Dict[str, MemoryStore] = {}
+_stores_lock = threading.Lock()
+
+
+def get_memory_store(memory_dir: str, legacy_path: Optional[str] = None) -> MemoryStore:
+    with _stores_lock:
+        store = _stores.get(memory_dir)
+        if store is None:
+            store = MemoryStore(memory_dir, legacy_path=legacy_path)
+            _stores[memory_dir] = store
+        return store
+
+
+def remember_users(memory_dir: str, session_id: str, rows: List[Dict[str, Any]]) -> None:
     if not rows:
         return
-    mem = _load_memory(memory_path)
-    sess = _get_session_mem(mem, session_id)
-    users_by_id = sess["entities"]["users_by_id"]
-    users_by_name = sess["entities"]["users_by_name"]
-    for row in rows:
-        uid = str(row.get("id") or row.get("user_id") or "")
-        if not uid:
-            continue
-        entry = {
-            "id": uid,
-            "name": row.get("name"),
-            "email": row.get("email"),
-            "location": row.get("location"),
-            "age": row.get("age"),
-        }
-        users_by_id[uid] = entry
-        if entry.get("name"):
-            users_by_name[_normalize_name(entry["name"]) ] = uid
-    if len(users_by_id) > 500:
-        drop_n = len(users_by_id) - 500
-        for i, k in enumerate(list(users_by_id.keys())):
-            if i >= drop_n:
-                break
-            users_by_name.pop(_normalize_name(users_by_id[k].get("name") or ""), None)
-            users_by_id.pop(k, None)
-    _save_memory(memory_path, mem)
-
-
-def create_memory_blueprint(memory_path: str) -> Blueprint:
+    get_memory_store(memory_dir).remember_users(session_id, rows)
+
+
+def create_memory_blueprint(memory_dir: str) -> Blueprint:
     bp = Blueprint("memory", __name__)
 
     @bp.get("/memory")
     def get_memory():
         session_id = request.args.get("session_id", "default")
-        mem = _load_memory(memory_path)
-        sess = mem.get("sessions", {}).get(session_id) or {}
+        sess = get_memory_store(memory_dir).get_session(session_id)
         return jsonify({"session_id": session_id, "memory": sess})
 
     @bp.post("/memory")
@@ -93,15 +382,7 @@ def create_memory_blueprint(memory_path: str) -> Blueprint:
         fact = data.get("fact")
         if not fact:
             return jsonify({"error": "fact is required"}), 400
-        mem = _load_memory(memory_path)
-        sess = _get_session_mem(mem, session_id)
-        facts = sess.setdefault("facts", [])
-        facts.append({"ts": datetime.utcnow().isoformat() + "Z", "fact": fact})
-        if len(facts) > 200:
-            sess["facts"] = facts[-200:]
-        _save_memory(memory_path, mem)
+        get_memory_store(memory_dir).add_fact(session_id, fact)
         return jsonify({"ok": True})
 
     return bp
-
-
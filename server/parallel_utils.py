@@ -0,0 +1,361 @@
+import os
+import atexit
+import weakref
+import threading
+import multiprocessing as mp
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+import numpy as np
+import pandas as pd
+
+
+# Worker processes for partitioned aggregation; defaults to one per core
+AGG_WORKERS = int(os.getenv("AGG_WORKERS", str(os.cpu_count() or 1)))
+# Below this many rows the pool round trip (a few ms) is a large share of a pandas groupby
+AGG_PARALLEL_MIN_ROWS = int(os.getenv("AGG_PARALLEL_MIN_ROWS", "500000"))
+# forkserver avoids forking the threaded server process itself
+AGG_START_METHOD = os.getenv("AGG_START_METHOD", "forkserver" if "forkserver" in mp.get_all_start_methods() else "spawn")
+# Cached key encodings (sorted codes per full-table column), so repeat queries skip rehashing keys
+AGG_KEY_CACHE_SIZE = int(os.getenv("AGG_KEY_CACHE_SIZE", "4"))
+PARALLEL_OPS = ("size", "count", "sum", "mean", "min", "max")
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_workers = 0
+_pool_lock = threading.Lock()
+_stats = {"serial": 0, "parallel": 0, "parallel_rows": 0, "key_cache_hits": 0}
+_cache_lock = threading.Lock()
+_code_cache: "OrderedDict[Tuple[int, str], Tuple[weakref.ref, np.ndarray, pd.Index]]" = OrderedDict()
+
+
+def _get_pool(workers: int) -> ProcessPoolExecutor:
+    global _pool, _pool_workers
+    with _pool_lock:
+        if _pool is None or _pool_workers != workers:
+            if _pool is not None:
+                _pool.shutdown(wait=False)
+            ctx = mp.get_context(AGG_START_METHOD)
+            if AGG_START_METHOD == "forkserver":
+                # The fork server preloads __main__ by default, i.e. the whole server; workers only need this module
+                ctx.set_forkserver_preload([__name__])
+            _pool = ProcessPoolExecutor(max_workers=workers, mp_context=ctx)
+            _pool_workers = workers
+        return _pool
+
+
+@atexit.register
+def shutdown_pool() -> None:
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=True, cancel_futures=True)
+            _pool = None
+
+
+def _share(arr: np.ndarray) -> Tuple[shared_memory.SharedMemory, Tuple[str, Tuple[int, ...], str]]:
+    shm = shared_memory.SharedMemory(create=True, size=max(1, arr.nbytes))
+    np.ndarray(arr.shape, dtype=arr.dtype, buffer=shm.buf)[...] = arr
+    return shm, (shm.name, arr.shape, arr.dtype.str)
+
+
+def _attach(ref: Tuple[str, Tuple[int, ...], str]) -> Tuple[shared_memory.SharedMemory, np.ndarray]:
+    name, shape, dtype = ref
+    shm = shared_memory.SharedMemory(name=name)
+    return shm, np.ndarray(shape, dtype=np.dtype(dtype), buffer=shm.buf)
+
+
+def _partial_aggregate(task: Dict[str, Any]) -> Tuple[np.ndarray, Dict[str, np.ndarray]]:
+    """Aggregate the groups of one hash partition (group code % parts == part).
+
+    Runs in a worker against the shared buffers. The parent has already
+    ordered the row positions and their group codes by partition, so this
+    worker reads only its own [start, stop) slice of both, then gathers its
+    rows from the shared value columns. The partition's groups get dense
+    local ids (code // parts) and are reduced with unbuffered ufunc.at
+    scatters, so no further sort is needed; integer sums
+    stay exact and min/max skip NaN like pandas. Float sums are plain float64
+    additions in row order, not pandas' compensated (Kahan) summation, so
+    float sum/mean can differ from the serial result in the last bits.
+    Returns the row count per group (zero for codes with no rows here) and
+    the named partials.
+    """
+    part, parts, n_groups = task["part"], task["parts"], task["n_groups"]
+    start, stop = task["bounds"]
+    handles = []
+    try:
+        shm, positions = _attach(task["rows"])
+        handles.append(shm)
+        rows = positions[start:stop]
+        shm, codes = _attach(task["codes"])
+        handles.append(shm)
+        local = codes[start:stop] // parts
+        n_local = len(range(part, n_groups, parts))
+        size = np.bincount(local, minlength=n_local)
+        out: Dict[str, np.ndarray] = {}
+        values: Dict[str, np.ndarray] = {}
+        for name, (col, op) in task["aggs"].items():
+            if op == "size":
+                out[name] = size
+                continue
+            if col not in values:
+                shm, arr = _attach(task["columns"][col])
+                handles.append(shm)
+                values[col] = arr[rows]
+            v = values[col]
+            floating = v.dtype.kind == "f"
+            if op in ("min", "max"):
+                ufunc = np.fmin if op == "min" else np.fmax
+                if floating:
+                    acc = np.full(n_local, np.nan, dtype=v.dtype)
+                else:
+                    info = np.iinfo(v.dtype)
+                    acc = np.full(n_local, info.max if op == "min" else info.min, dtype=v.dtype)
+                ufunc.at(acc, local, v)
+                out[name] = acc
+                continue
+            present = ~np.isnan(v) if floating else None
+            count = np.bincount(local[present], minlength=n_local) if floating else size
+            if op == "count":
+                out[name] = count
+                continue
+            summed = np.zeros(n_local, dtype=np.float64 if floating else np.int64)
+            np.add.at(summed, local, np.where(present, v, 0.0) if floating else v)
+            if op == "sum":
+                out[name] = summed
+            else:
+                with np.errstate(invalid="ignore", divide="ignore"):
+                    out[name] = summed / count
+        return size, out
+    finally:
+        for shm in handles:
+            shm.close()
+
+
+def _factorize_sorted(values: pd.Series) -> Tuple[np.ndarray, pd.Index]:
+    codes, uniques = pd.factorize(values, sort=True)
+    # int32 halves the footprint of cached encodings; group codes are widened when combined
+    return codes.astype(np.int32 if len(uniques) < np.iinfo(np.int32).max else np.int64), uniques
+
+
+KeySource = Union[pd.DataFrame, pd.Series]
+
+
+def _key_codes(df: pd.DataFrame, key: str, source: Optional[KeySource]) -> Tuple[np.ndarray, pd.Index]:
+    """Sorted codes of one key column for the rows of `df` (-1 where the key is missing).
+
+    `source` is the long-lived full table (or full column) `df[key]` was
+    sliced from, on a 0..n-1 RangeIndex. Its factorization is cached per
+    source object and the codes of `df`'s rows are gathered by row label
+    instead of rehashing every key.
+    """
+    index = source.index if source is not None else None
+    if not isinstance(index, pd.RangeIndex) or index.start != 0 or index.step != 1:
+        return _factorize_sorted(df[key])
+    cache_key = (id(source), key)
+    with _cache_lock:
+        hit = _code_cache.get(cache_key)
+        if hit is not None and hit[0]() is not source:
+            hit = None
+        if hit is not None:
+            _code_cache.move_to_end(cache_key)
+            _stats["key_cache_hits"] += 1
+    if hit is None:
+        column = source[key] if isinstance(source, pd.DataFrame) else source
+        hit = (weakref.ref(source), *_factorize_sorted(column))
+        with _cache_lock:
+            _code_cache[cache_key] = hit
+            while len(_code_cache) > AGG_KEY_CACHE_SIZE:
+                _code_cache.popitem(last=False)
+    _, codes, uniques = hit
+    if len(df) == len(index) and df.index.equals(index):
+        return codes, uniques
+    positions = df.index.to_numpy()
+    if positions.dtype.kind not in "iu" or (len(positions) and (positions.min() < 0 or positions.max() >= len(codes))):
+        # Labels the source doesn't cover, e.g. rows appended after `source` was captured
+        return _factorize_sorted(df[key])
+    return codes[positions], uniques
+
+
+def _group_codes(
+    df: pd.DataFrame, keys: List[str], sources: Dict[str, KeySource]
+) -> Tuple[np.ndarray, int, List[pd.Index], Optional[np.ndarray]]:
+    """Group codes ordered like the sorted keys; -1 marks rows with a missing key.
+
+    Multiple keys combine into one code in their product space. When that
+    space is much larger than the row count it is compacted with a sorted
+    factorize of the combined codes, whose values are returned so the key
+    labels can be recovered. Returns (codes, number of codes, per-key uniques,
+    combined values or None).
+    """
+    codes = None
+    space = 1
+    levels: List[pd.Index] = []
+    for key in keys:
+        c, uniques = _key_codes(df, key, sources.get(key))
+        n = max(1, len(uniques))
+        if space > np.iinfo(np.int64).max // n:
+            raise OverflowError("group key space exceeds int64")
+        c = c.astype(np.int64)
+        codes = c if codes is None else np.where((codes < 0) | (c < 0), -1, codes * n + c)
+        space *= n
+        levels.append(uniques)
+    if len(keys) == 1 or space <= 2 * len(df) + 1024:
+        return codes, space, levels, None
+    valid = np.flatnonzero(codes >= 0)
+    dense, combined = pd.factorize(codes[valid], sort=True)
+    compact = np.full(len(codes), -1, dtype=np.int64)
+    compact[valid] = dense
+    return compact, max(1, len(combined)), levels, np.asarray(combined, dtype=np.int64)
+
+
+def _parallel_ok(df: pd.DataFrame, aggs: Dict[str, Tuple[Optional[str], str]]) -> bool:
+    for col, op in aggs.values():
+        if op not in PARALLEL_OPS:
+            return False
+        if op == "size":
+            continue
+        # NumPy-backed numeric or bool columns only; extension dtypes keep pandas' NA handling
+        dtype = df[col].dtype if col in df.columns else None
+        if not isinstance(dtype, np.dtype) or dtype.kind not in "biuf":
+            return False
+    return True
+
+
+def _serial_aggregate(df: pd.DataFrame, keys: List[str], aggs: Dict[str, Tuple[Optional[str], str]]) -> pd.DataFrame:
+    grouped = df.groupby(keys)
+    out = {}
+    for name, (col, op) in aggs.items():
+        out[name] = grouped.size() if op == "size" else grouped[col].agg(op)
+    return pd.DataFrame(out)
+
+
+def group_aggregate(
+    df: pd.DataFrame,
+    keys: List[str],
+    aggs: Dict[str, Tuple[Optional[str], str]],
+    sources: Optional[Dict[str, KeySource]] = None,
+    parallel: Optional[bool] = None,
+    workers: Optional[int] = None,
+) -> pd.DataFrame:
+    """`df.groupby(keys).agg(**aggs)` with a hash-partitioned parallel path for large inputs.
+
+    `aggs` maps output name -> (column, op) with op in size/count/sum/mean/min/max
+    (size counts rows and ignores the column). Rows are assigned to
+    partitions by group code, so each worker owns whole groups and the
+    partials only need to be placed, not combined. The parent sorts the row
+    positions by partition once and hands each worker a contiguous slice. Group codes and value
+    columns go to the workers through shared memory.
+
+    `sources` maps a key to the full table (or full column) `df`'s rows were
+    taken from, by row label. Its key encoding is then cached across calls,
+    which keeps the serial part of the parallel path to a gather.
+
+    `parallel=None` picks the parallel path for inputs of at least
+    AGG_PARALLEL_MIN_ROWS rows when more than one worker is available;
+    `parallel=True` forces it (with one worker it is a single partition,
+    useful as a scaling baseline). Unsupported ops, non-numeric columns or
+    unsortable keys run serially in pandas. The result is sorted by the
+    keys, like groupby. Float sums and means are not compensated, so they
+    may differ from pandas by a few ulps (around 1e-12 relative on large
+    groups); counts, min/max and integer sums match exactly.
+    """
+    workers = max(1, workers or AGG_WORKERS)
+    if parallel is None:
+        parallel = workers > 1 and len(df) >= AGG_PARALLEL_MIN_ROWS
+    if parallel and _parallel_ok(df, aggs):
+        try:
+            result = _parallel_aggregate(df, keys, aggs, sources or {}, workers)
+        except (TypeError, OverflowError, IndexError):
+            # Mixed-type keys that don't sort, a key product beyond int64, or a
+            # source table swapped by a concurrent append mid-gather
+            result = None
+        if result is not None:
+            _stats["parallel"] += 1
+            _stats["parallel_rows"] += int(len(df))
+            return result
+    _stats["serial"] += 1
+    return _serial_aggregate(df, keys, aggs)
+
+
+def _parallel_aggregate(
+    df: pd.DataFrame, keys: List[str], aggs: Dict[str, Tuple[Optional[str], str]], sources: Dict[str, KeySource], workers: int
+) -> pd.DataFrame:
+    codes, space, levels, combined = _group_codes(df, keys, sources)
+    parts = min(workers, space)
+
+    # Split the rows by partition once: a stable counting sort on code % parts
+    # (row order within a partition is kept, so float sums add in row order)
+    valid = np.flatnonzero(codes >= 0)
+    bucket = (codes[valid] % parts).astype(np.min_scalar_type(parts))
+    order = np.argsort(bucket, kind="stable")
+    rows = valid[order]
+    bounds = np.concatenate(([0], np.cumsum(np.bincount(bucket, minlength=parts))))
+
+    shms: List[shared_memory.SharedMemory] = []
+    try:
+        shm, rows_ref = _share(np.ascontiguousarray(rows))
+        shms.append(shm)
+        shm, codes_ref = _share(np.ascontiguousarray(codes[rows]))
+        shms.append(shm)
+        columns: Dict[str, Any] = {}
+        for col, op in aggs.values():
+            if op != "size" and col not in columns:
+                arr = df[col].to_numpy()
+                if arr.dtype.kind == "b":
+                    arr = arr.astype(np.int64)
+                shm, columns[col] = _share(np.ascontiguousarray(arr))
+                shms.append(shm)
+        tasks = [
+            {
+                "part": p, "parts": parts, "n_groups": space, "bounds": (int(bounds[p]), int(bounds[p + 1])),
+                "rows": rows_ref, "codes": codes_ref, "columns": columns, "aggs": aggs,
+            }
+            for p in range(parts)
+        ]
+        partials = list(_get_pool(workers).map(_partial_aggregate, tasks))
+    finally:
+        for shm in shms:
+            shm.close()
+            shm.unlink()
+
+    # Partition p holds codes p, p + parts, ...; keep only codes that had rows
+    size = np.empty(space, dtype=np.int64)
+    for p, (part_size, _) in enumerate(partials):
+        size[p::parts] = part_size
+    present = np.flatnonzero(size > 0)
+    out: Dict[str, np.ndarray] = {}
+    for name, (col, op) in aggs.items():
+        dtype = np.result_type(*[partial[name].dtype for _, partial in partials])
+        merged = np.empty(space, dtype=dtype)
+        for p, (_, partial) in enumerate(partials):
+            merged[p::parts] = partial[name]
+        merged = merged[present]
+        if op in ("min", "max") and pd.api.types.is_bool_dtype(df[col]):
+            merged = merged.astype(bool)
+        out[name] = merged
+
+    if len(keys) == 1:
+        index = pd.Index(levels[0].take(present), name=keys[0])
+    else:
+        level_codes = []
+        rest = present if combined is None else combined[present]
+        for lvl in reversed(levels):
+            n = max(1, len(lvl))
+            level_codes.append(rest % n)
+            rest = rest // n
+        index = pd.MultiIndex(levels=levels, codes=level_codes[::-1], names=keys)
+    return pd.DataFrame(out, index=index)
+
+
+def aggregation_stats() -> Dict[str, Any]:
+    with _cache_lock:
+        cached = len(_code_cache)
+    return {
+        "workers": AGG_WORKERS,
+        "parallel_min_rows": AGG_PARALLEL_MIN_ROWS,
+        "start_method": AGG_START_METHOD,
+        "cached_key_columns": cached,
+        **_stats,
+    }
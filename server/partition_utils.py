@@ -0,0 +1,267 @@
+import os
+import json
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from time_utils import as_utc
+
+
+PARTITION_DIR = os.getenv("PARTITION_DIR", os.path.join(os.path.dirname(__file__), "data", "partitions"))
+PARTITION_GRANULARITY = os.getenv("PARTITION_GRANULARITY", "day").lower()
+PARTITIONED_TABLES = {"events": "timestamp", "purchases": "purchased_at"}
+MANIFEST_VERSION = 2
+_KEY_FORMATS = {"day": "%Y-%m-%d", "month": "%Y-%m"}
+# Partition for rows whose timestamp does not parse; never pruned by time
+NULL_PARTITION = "null"
+
+
+def partition_keys(ts: pd.Series, granularity: str) -> pd.Series:
+    fmt = _KEY_FORMATS.get(granularity, _KEY_FORMATS["day"])
+    return ts.dt.strftime(fmt).fillna(NULL_PARTITION)
+
+
+def cluster_by_time(df: pd.DataFrame, ts: pd.Series) -> pd.DataFrame:
+    """`df` stably sorted by its parsed time column (unparseable last) on a fresh RangeIndex.
+
+    Rows of one day or month are then contiguous, so each partition is a
+    single row range of the resident frame.
+    """
+    order = ts.reset_index(drop=True).sort_values(kind="stable", na_position="last").index.to_numpy()
+    return df.iloc[order].reset_index(drop=True)
+
+
+def _row_ranges(positions: np.ndarray) -> List[List[int]]:
+    """Sorted row positions as [start, stop) runs."""
+    if not len(positions):
+        return []
+    breaks = np.flatnonzero(np.diff(positions) != 1) + 1
+    starts = positions[np.concatenate(([0], breaks))]
+    stops = positions[np.concatenate((breaks - 1, [len(positions) - 1]))] + 1
+    return [[int(a), int(b)] for a, b in zip(starts, stops)]
+
+
+def _column_stats(df: pd.DataFrame) -> Dict[str, List[Any]]:
+    """Min/max per numeric column, used to skip partitions for range and equality filters."""
+    stats: Dict[str, List[Any]] = {}
+    for col in df.columns:
+        s = df[col]
+        if pd.api.types.is_numeric_dtype(s) and not pd.api.types.is_bool_dtype(s) and s.notna().any():
+            stats[col] = [s.min().item(), s.max().item()]
+    return stats
+
+
+class PartitionedTable:
+    """A day or month partitioning of a resident table on its time column.
+
+    The rows stay in the full in-memory frame; manifest.json records, per
+    partition, its row ranges in that frame, row count, time min/max and
+    numeric column min/max. `select` prunes partitions against the filters
+    using only the manifest and slices the surviving ranges out of the
+    frame, so a pruned scan touches only the rows of its window and reads
+    nothing from disk. The manifest is written next to the other derived
+    state and reused while the source files are unchanged.
+
+    Ranges are row positions, so they hold only for the frame they were
+    built from plus rows appended after it. Frames clustered by time
+    (`cluster_by_time`) give one range per partition.
+    """
+
+    def __init__(self, name: str, time_col: str, root: str, manifest: Dict[str, Any]):
+        self.name = name
+        self.time_col = time_col
+        self.root = root
+        self.manifest = manifest
+        self._lock = threading.Lock()
+        self.scans = 0
+        self.pruned = 0
+
+    @classmethod
+    def open_or_build(
+        cls,
+        name: str,
+        df: pd.DataFrame,
+        time_col: str,
+        ts: pd.Series,
+        fingerprint: Any = None,
+        granularity: str = PARTITION_GRANULARITY,
+        base_dir: str = PARTITION_DIR,
+    ) -> "PartitionedTable":
+        """Reuse the manifest on disk when it was written from the same source, else rebuild it."""
+        root = os.path.join(base_dir, name)
+        manifest_path = os.path.join(root, "manifest.json")
+        # JSON round trip so tuples compare equal to what the manifest stores
+        expected = json.loads(json.dumps({"version": MANIFEST_VERSION, "granularity": granularity, "fingerprint": fingerprint, "rows": int(len(df))}))
+        if fingerprint is not None and os.path.exists(manifest_path):
+            try:
+                with open(manifest_path) as f:
+                    manifest = json.load(f)
+                if all(manifest.get(k) == v for k, v in expected.items()):
+                    return cls(name, time_col, root, manifest)
+            except (OSError, ValueError):
+                pass
+        return cls.build(name, df, time_col, ts, expected, root)
+
+    @classmethod
+    def build(cls, name: str, df: pd.DataFrame, time_col: str, ts: pd.Series, header: Dict[str, Any], root: str) -> "PartitionedTable":
+        os.makedirs(root, exist_ok=True)
+        table = cls(name, time_col, root, {**header, "time_col": time_col, "partitions": {}})
+        table._add_rows(df, ts, 0)
+        # Drop partition files left over from the pickled layout
+        for fname in os.listdir(root):
+            if fname.endswith(".pkl"):
+                os.remove(os.path.join(root, fname))
+        table._write_manifest()
+        return table
+
+    def _add_rows(self, df: pd.DataFrame, ts: pd.Series, offset: int) -> None:
+        """Record `df` (rows `offset`.. of the full frame) in the partitions its timestamps fall in."""
+        keys = partition_keys(ts, self.manifest["granularity"]).to_numpy()
+        for key, idx in pd.Series(np.arange(len(keys))).groupby(keys, sort=True).groups.items():
+            positions = np.asarray(idx, dtype=np.int64)
+            part = df.iloc[positions]
+            part_ts = ts.iloc[positions]
+            with self._lock:
+                meta = self.manifest["partitions"].get(key)
+            if meta is None:
+                meta = {"rows": 0, "ranges": [], "min": None, "max": None, "stats": {}}
+            ranges = [list(r) for r in meta["ranges"]]
+            for start, stop in _row_ranges(positions + offset):
+                if ranges and ranges[-1][1] == start:
+                    ranges[-1][1] = stop
+                else:
+                    ranges.append([start, stop])
+            stats = dict(meta["stats"])
+            for col, (lo, hi) in _column_stats(part).items():
+                old = stats.get(col)
+                stats[col] = [lo, hi] if old is None else [min(old[0], lo), max(old[1], hi)]
+            updated = {"rows": meta["rows"] + int(len(part)), "ranges": ranges, "min": meta["min"], "max": meta["max"], "stats": stats}
+            if key != NULL_PARTITION:
+                lo, hi = part_ts.min(), part_ts.max()
+                updated["min"] = lo.isoformat() if meta["min"] is None else min(pd.Timestamp(meta["min"]), lo).isoformat()
+                updated["max"] = hi.isoformat() if meta["max"] is None else max(pd.Timestamp(meta["max"]), hi).isoformat()
+            with self._lock:
+                self.manifest["partitions"][key] = updated
+
+    def _write_manifest(self) -> None:
+        with self._lock:
+            text = json.dumps(self.manifest)
+        tmp = os.path.join(self.root, "manifest.json.tmp")
+        with open(tmp, "w") as f:
+            f.write(text)
+        os.replace(tmp, os.path.join(self.root, "manifest.json"))
+
+    def append(self, rows: pd.DataFrame, ts: pd.Series) -> None:
+        """Record rows appended to the end of the full frame; only the partitions they touch change."""
+        if rows.empty:
+            return
+        with self._lock:
+            offset = int(self.manifest.get("rows", 0))
+        self._add_rows(rows, ts, offset)
+        with self._lock:
+            self.manifest["rows"] = offset + int(len(rows))
+        self._write_manifest()
+
+    def _partitions(self) -> Dict[str, Dict[str, Any]]:
+        """Copy of the manifest's partition entries; appends add entries under the lock."""
+        with self._lock:
+            return dict(self.manifest["partitions"])
+
+    def prune(self, filters: Optional[List[Dict[str, Any]]]) -> List[str]:
+        """Partition keys that may hold rows matching every filter, from manifest statistics only."""
+        return self._prune(self._partitions(), filters)
+
+    def _prune(self, partitions: Dict[str, Dict[str, Any]], filters: Optional[List[Dict[str, Any]]]) -> List[str]:
+        keep: List[str] = []
+        lo, hi, lo_strict, hi_strict = self._time_bounds(filters or [])
+        for key, meta in sorted(partitions.items()):
+            if key != NULL_PARTITION and (lo is not None or hi is not None):
+                pmin, pmax = pd.Timestamp(meta["min"]), pd.Timestamp(meta["max"])
+                if lo is not None and (pmax < lo or (lo_strict and pmax == lo)):
+                    continue
+                if hi is not None and (pmin > hi or (hi_strict and pmin == hi)):
+                    continue
+            elif key == NULL_PARTITION and (lo is not None or hi is not None):
+                # NULL timestamps never satisfy a time comparison
+                continue
+            if not self._stats_match(meta.get("stats") or {}, filters or []):
+                continue
+            keep.append(key)
+        return keep
+
+    def _time_bounds(self, filters: List[Dict[str, Any]]) -> Tuple[Optional[pd.Timestamp], Optional[pd.Timestamp], bool, bool]:
+        lo = hi = None
+        lo_strict = hi_strict = False
+        for f in filters:
+            # Only the bare column name: the row filter skips columns it cannot find, so pruning
+            # on a qualified name would apply that filter at day granularity alone
+            if f.get("column") != self.time_col:
+                continue
+            op = (f.get("op") or "").lower()
+            val = as_utc(f.get("value")) if op in ("gt", "gte", "lt", "lte", "eq", "=") else None
+            if val is None:
+                continue
+            if op in ("gt", "gte", "eq", "=") and (lo is None or val > lo or (val == lo and op == "gt")):
+                lo, lo_strict = val, op == "gt"
+            if op in ("lt", "lte", "eq", "=") and (hi is None or val < hi or (val == hi and op == "lt")):
+                hi, hi_strict = val, op == "lt"
+        return lo, hi, lo_strict, hi_strict
+
+    @staticmethod
+    def _stats_match(stats: Dict[str, List[Any]], filters: List[Dict[str, Any]]) -> bool:
+        for f in filters:
+            bounds = stats.get(f.get("column"))
+            val = f.get("value")
+            if bounds is None or isinstance(val, bool) or not isinstance(val, (int, float)):
+                continue
+            op = (f.get("op") or "").lower()
+            lo, hi = bounds
+            if op in ("eq", "=") and not lo <= val <= hi:
+                return False
+            if (op == "gt" and hi <= val) or (op == "gte" and hi < val) or (op == "lt" and lo >= val) or (op == "lte" and lo > val):
+                return False
+        return True
+
+    def select(
+        self,
+        filters: Optional[List[Dict[str, Any]]],
+        full: pd.DataFrame,
+        columns: Optional[List[str]] = None,
+    ) -> Tuple[pd.DataFrame, Dict[str, Any]]:
+        """Rows of `full` in the partitions that survive pruning (filters themselves are applied by the caller).
+
+        `full` is the resident table the partitions index; it is returned as is when no partition is pruned.
+        Rows keep their order in `full`.
+        """
+        partitions = self._partitions()
+        keys = self._prune(partitions, filters)
+        total = len(partitions)
+        with self._lock:
+            self.scans += 1
+            self.pruned += total - len(keys)
+        info = {
+            "partitions_total": total,
+            "partitions_scanned": len(keys),
+            "rows_scanned": int(sum(partitions[k]["rows"] for k in keys)),
+        }
+        frame = full[columns] if columns else full
+        if len(keys) == total:
+            return frame, info
+        # Clip to `full`: an append may have recorded rows the caller's frame predates
+        ranges = sorted((a, min(b, len(full))) for k in keys for a, b in partitions[k]["ranges"] if a < len(full))
+        if len(ranges) == 1:
+            return frame.iloc[ranges[0][0]:ranges[0][1]], info
+        positions = np.concatenate([np.arange(a, b) for a, b in ranges]) if ranges else np.empty(0, dtype=np.int64)
+        return frame.iloc[positions], info
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "granularity": self.manifest.get("granularity"),
+                "partitions": len(self.manifest["partitions"]),
+                "rows": int(self.manifest.get("rows", 0)),
+                "scans": self.scans,
+                "partitions_pruned": self.pruned,
+            }
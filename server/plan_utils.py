@@ -0,0 +1,394 @@
+import weakref
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+import pandas as pd
+
+from time_utils import as_utc
+
+
+FILTER_OPS = ("eq", "=", "in", "contains", "gt", "gte", "lt", "lte")
+# Rough selectivities used for row estimates when no column statistics apply
+DEFAULT_SELECTIVITY = {"contains": 0.25, "gt": 1 / 3, "gte": 1 / 3, "lt": 1 / 3, "lte": 1 / 3}
+
+# Distinct counts per (frame, column). Frames are replaced on every append, so entries are
+# bounded LRU and hold a weak reference that stops a recycled id() from matching.
+NDISTINCT_CACHE_SIZE = 64
+_ndistinct_lock = threading.Lock()
+_ndistinct_cache: "OrderedDict[Tuple[int, str], Tuple[weakref.ref, int]]" = OrderedDict()
+
+
+class PlanFallback(Exception):
+    """The plan uses a shape the optimizer does not model; run it unoptimized."""
+
+
+def _ndistinct(df: pd.DataFrame, col: str) -> int:
+    key = (id(df), col)
+    with _ndistinct_lock:
+        hit = _ndistinct_cache.get(key)
+        if hit is not None and hit[0]() is df:
+            _ndistinct_cache.move_to_end(key)
+            return hit[1]
+    try:
+        n = max(1, int(df[col].nunique(dropna=False)))
+    except Exception:
+        n = max(1, len(df))
+    with _ndistinct_lock:
+        _ndistinct_cache[key] = (weakref.ref(df), n)
+        while len(_ndistinct_cache) > NDISTINCT_CACHE_SIZE:
+            _ndistinct_cache.popitem(last=False)
+    return n
+
+
+def _resolve_column(col: str, tables: Dict[str, pd.DataFrame]) -> str:
+    parts = col.split(".")
+    if len(parts) == 2 and parts[0] in tables:
+        return parts[1]
+    for df in tables.values():
+        if col in df.columns:
+            return col
+    raise KeyError(f"Unknown column: {col}")
+
+
+def apply_filter(df: pd.DataFrame, f: Dict[str, Any], col: str, parsed: Optional[pd.Series] = None) -> Tuple[pd.DataFrame, bool]:
+    """Apply one plan filter to `col`; returns (frame, applied). Invalid filters are no-ops.
+
+    `parsed` holds the column's parsed UTC timestamps (indexed like the full
+    table); when given, range filters compare instants rather than strings,
+    the same way partition pruning does.
+    """
+    op = (f.get("op") or "").lower()
+    val = f.get("value")
+    try:
+        if op in ("eq", "="):
+            return df[df[col] == val], True
+        if op == "in" and isinstance(val, list):
+            return df[df[col].isin(val)], True
+        if op == "contains" and isinstance(val, str) and df[col].dtype == object:
+            return df[df[col].str.contains(val, case=False, na=False)], True
+        lhs = df[col]
+        if op in ("gt", "gte", "lt", "lte") and parsed is not None:
+            lhs = parsed.loc[df.index]
+            val = as_utc(val)
+            if val is None:
+                return df, False
+        if op == "gt":
+            return df[lhs > val], True
+        if op == "gte":
+            return df[lhs >= val], True
+        if op == "lt":
+            return df[lhs < val], True
+        if op == "lte":
+            return df[lhs <= val], True
+    except Exception:
+        pass
+    return df, False
+
+
+def _selectivity(df: pd.DataFrame, col: str, f: Dict[str, Any]) -> float:
+    op = (f.get("op") or "").lower()
+    if op in ("eq", "="):
+        return 1.0 / _ndistinct(df, col)
+    if op == "in" and isinstance(f.get("value"), list):
+        return min(1.0, len(f["value"]) / _ndistinct(df, col))
+    return DEFAULT_SELECTIVITY.get(op, 1.0)
+
+
+def build_plan(args: Dict[str, Any], tables: Dict[str, pd.DataFrame]) -> Dict[str, Any]:
+    """Turn an analysis-plan request into an optimized scan/join plan.
+
+    The unoptimized plan joins full tables, filters the joined frame and
+    aggregates last. Here every filter is pushed onto the input table its
+    column comes from (a filter on a joined table turns that left join into
+    an inner join, since the filter rejects the NULL rows the left join would
+    add). Each input is pruned to the columns referenced downstream. Left joins
+    that contribute no referenced column and cannot fan out are dropped.
+    Inputs are renamed up front to the names the naive merge would produce
+    (id_x/id_y, ...) so later steps see an identical schema.
+
+    Raises PlanFallback for anything it does not model exactly.
+    """
+    source = args.get("source")
+    inputs: List[Dict[str, Any]] = [{"table": source, "how": None}]
+    cols: List[str] = list(tables[source].columns)
+    origin: Dict[str, Tuple[int, str]] = {c: (0, c) for c in cols}
+
+    # Simulate the naive join sequence to learn the merged schema
+    for j in (args.get("joins") or []):
+        jtable = j.get("table")
+        if jtable not in tables:
+            continue
+        right_cols = list(tables[jtable].columns)
+        left_on = right_on = None
+        on = j.get("on") or {}
+        if on:
+            lk, rk = next(iter(on.items()))
+            left_on, right_on = lk.split(".")[-1], rk.split(".")[-1]
+        elif "user_id" in cols and "id" in right_cols:
+            left_on, right_on = "user_id", "id"
+        if not (left_on and right_on):
+            continue
+        if left_on not in cols or right_on not in right_cols:
+            raise PlanFallback("join key missing")
+        idx = len(inputs)
+        shared_key = left_on == right_on
+        overlap = (set(cols) & set(right_cols)) - ({left_on} if shared_key else set())
+        renamed_left = [c + "_x" if c in overlap else c for c in cols]
+        new_right = [(c + "_y" if c in overlap else c) for c in right_cols if not (shared_key and c == right_on)]
+        merged = renamed_left + new_right
+        if len(set(merged)) != len(merged):
+            raise PlanFallback("ambiguous merge suffixes")
+        origin = {(c + "_x" if c in overlap else c): origin[c] for c in cols}
+        for c in right_cols:
+            if shared_key and c == right_on:
+                continue
+            origin[c + "_y" if c in overlap else c] = (idx, c)
+        inputs.append({
+            "table": jtable,
+            "how": "left",
+            "left_on": left_on + "_x" if left_on in overlap else left_on,
+            "right_on": right_on,
+            "right_name": None if shared_key else (right_on + "_y" if right_on in overlap else right_on),
+            "key_origin": origin[left_on + "_x" if left_on in overlap else left_on],
+        })
+        cols = merged
+
+    # Inputs are renamed once, so a key must keep the same name through every later join
+    final_name = {v: k for k, v in origin.items()}
+    for idx, inp in enumerate(inputs[1:], start=1):
+        if final_name.get(inp["key_origin"]) != inp["left_on"]:
+            raise PlanFallback("join key renamed by a later join")
+        if inp["right_name"] and final_name.get((idx, inp["right_on"])) != inp["right_name"]:
+            raise PlanFallback("join key renamed by a later join")
+
+    # Filters resolve against the merged schema exactly as the naive path does
+    filters: List[Tuple[Dict[str, Any], str]] = []
+    for f in (args.get("filters") or []):
+        col = f.get("column")
+        if col not in cols:
+            cname = _resolve_column(col, tables)
+            col = cname if cname in cols else None
+        if not col or (f.get("op") or "").lower() not in FILTER_OPS:
+            continue
+        filters.append((f, col))
+
+    # Columns needed after the joins
+    metrics = args.get("metrics") or []
+    group_by = args.get("group_by") or []
+    if metrics:
+        if any(g not in cols for g in group_by):
+            raise PlanFallback("unknown group_by column")
+        needed = list(group_by) + [m.get("column") for m in metrics if m.get("column") in cols]
+    else:
+        keep = [c for c in (args.get("select") or []) if c in cols]
+        needed = keep or list(cols)
+    needed_set = set(needed)
+
+    for i, inp in enumerate(inputs):
+        inp["columns"] = []
+        inp["rename"] = {}
+        inp["filters"] = []
+    # Keys used by later joins must survive on whichever input owns them
+    for inp in inputs[1:]:
+        needed_set.add(inp["left_on"])
+    for merged_name in cols:
+        i, orig = origin[merged_name]
+        if merged_name in needed_set:
+            inputs[i]["columns"].append(orig)
+            if merged_name != orig:
+                inputs[i]["rename"][orig] = merged_name
+    for f, col in filters:
+        i, orig = origin[col]
+        if i and (f.get("op") or "").lower() == "in" and isinstance(f.get("value"), list) and any(v is None for v in f["value"]):
+            # Matches the NULL padding of a left join, so it cannot become an inner join
+            raise PlanFallback("filter is not NULL-rejecting")
+        inputs[i]["filters"].append((f, orig))
+
+    # Join elimination: a left join nobody reads from and that cannot fan out
+    for i, inp in enumerate(inputs[1:], start=1):
+        right = tables[inp["table"]]
+        inp["unique_right"] = bool(right[inp["right_on"]].is_unique)
+        inp["eliminated"] = not inp["columns"] and not inp["filters"] and inp["unique_right"]
+        if not inp["eliminated"] and inp["right_on"] not in inp["columns"]:
+            inp["columns"].append(inp["right_on"])
+        if not inp["eliminated"] and inp["right_name"] and inp["right_name"] != inp["right_on"]:
+            inp["rename"][inp["right_on"]] = inp["right_name"]
+    for inp in inputs[1:]:
+        if inp["eliminated"]:
+            continue
+        owner, key_col = inp["key_origin"]
+        if key_col not in inputs[owner]["columns"]:
+            inputs[owner]["columns"].append(key_col)
+        if inputs[owner]["rename"].get(key_col, key_col) != inp["left_on"]:
+            inputs[owner]["rename"][key_col] = inp["left_on"]
+    for inp in inputs:
+        # Keep the table's column order; filter-only columns are dropped after filtering
+        table_cols = list(tables[inp["table"]].columns)
+        filter_cols = {c for _, c in inp["filters"]}
+        inp["columns"] = [c for c in table_cols if c in set(inp["columns"])]
+        inp["scan_columns"] = [c for c in table_cols if c in set(inp["columns"]) | filter_cols]
+
+    return {"source": source, "inputs": inputs, "merged_columns": cols, "needed": needed}
+
+
+def estimate_plan(plan: Dict[str, Any], tables: Dict[str, pd.DataFrame], args: Dict[str, Any]) -> None:
+    """Annotate inputs and post-join stages with estimated row counts."""
+    rows = 0.0
+    for i, inp in enumerate(plan["inputs"]):
+        df = tables[inp["table"]]
+        est = float(len(df))
+        inp["est_scan_rows"] = int(est)
+        for f, col in inp["filters"]:
+            est *= _selectivity(df, col, f)
+        inp["est_rows"] = max(1, int(round(est))) if len(df) else 0
+        if i == 0:
+            rows = est
+        elif not inp["eliminated"]:
+            # Matches per key on the right, scaled by the right side's filter selectivity for inner joins
+            fanout = len(df) / _ndistinct(df, inp["right_on"]) if len(df) else 0.0
+            if inp["filters"]:
+                rows *= fanout * (est / len(df) if len(df) else 0.0)
+            else:
+                rows *= max(1.0, fanout)
+            inp["est_join_rows"] = int(round(rows))
+    stages: Dict[str, int] = {"joined": int(round(rows))}
+    if args.get("metrics"):
+        group_by = args.get("group_by") or []
+        groups = 1.0
+        for g in group_by:
+            owner_i, orig = None, None
+            for inp in plan["inputs"]:
+                renamed = {v: k for k, v in inp["rename"].items()}
+                candidate = renamed.get(g, g)
+                if candidate in tables[inp["table"]].columns:
+                    owner_i, orig = inp, candidate
+                    break
+            groups *= _ndistinct(tables[owner_i["table"]], orig) if owner_i else 10
+        rows = min(rows, groups) if group_by else 1.0
+        stages["aggregated"] = int(round(rows))
+    if args.get("limit"):
+        try:
+            rows = min(rows, max(1, min(int(args["limit"]), 1000)))
+        except Exception:
+            pass
+        stages["limited"] = int(round(rows))
+    plan["estimates"] = stages
+
+
+def execute_plan(
+    plan: Dict[str, Any],
+    tables: Dict[str, pd.DataFrame],
+    timestamps: Optional[Dict[str, Dict[str, pd.Series]]] = None,
+) -> pd.DataFrame:
+    """Scan, filter, prune and join the inputs; returns the frame the aggregation step consumes.
+
+    `timestamps` maps table -> column -> parsed UTC timestamps (DERIVED["timestamps"]),
+    so time range filters match the partitions pruned for them.
+    """
+    timestamps = timestamps or {}
+    actual: Dict[str, Any] = {}
+    frames: List[pd.DataFrame] = []
+    inner: List[bool] = []
+    for i, inp in enumerate(plan["inputs"]):
+        if i and inp["eliminated"]:
+            frames.append(pd.DataFrame())
+            inner.append(False)
+            continue
+        df = tables[inp["table"]][inp["scan_columns"]]
+        applied = False
+        for f, col in inp["filters"]:
+            df, ok = apply_filter(df, f, col, timestamps.get(inp["table"], {}).get(col))
+            applied = applied or ok
+        if inp["scan_columns"] != inp["columns"]:
+            df = df[inp["columns"]]
+        if inp["rename"]:
+            df = df.rename(columns=inp["rename"])
+        inp["rows"] = int(len(df))
+        frames.append(df)
+        # A filter that actually ran on the joined table rejects the rows a left join would pad with NULLs
+        inner.append(applied and i > 0)
+
+    out = frames[0]
+    for i, inp in enumerate(plan["inputs"][1:], start=1):
+        if inp["eliminated"]:
+            continue
+        right_on = inp["rename"].get(inp["right_on"], inp["right_on"])
+        how = "inner" if inner[i] else "left"
+        inp["executed_how"] = how
+        if inp["left_on"] == right_on:
+            out = out.merge(frames[i], on=right_on, how=how)
+        else:
+            out = out.merge(frames[i], left_on=inp["left_on"], right_on=right_on, how=how)
+        inp["join_rows"] = int(len(out))
+    # Match the naive column order for the columns that survived pruning
+    order = [c for c in plan["merged_columns"] if c in out.columns]
+    actual["joined"] = int(len(out))
+    plan["actual"] = actual
+    return out[order]
+
+
+def apply_top_k(out: pd.DataFrame, order_by: List[Dict[str, Any]], limit: int) -> Optional[pd.DataFrame]:
+    """nlargest/nsmallest for a single numeric, NULL-free sort key; None when a full sort is required."""
+    applied = [ob for ob in order_by if ob.get("column") in out.columns]
+    if len(applied) != 1:
+        return None
+    col = applied[0]["column"]
+    series = out[col]
+    if not pd.api.types.is_numeric_dtype(series) or pd.api.types.is_bool_dtype(series) or series.hasnans:
+        return None
+    if (applied[0].get("dir") or "desc").lower() == "asc":
+        return out.nsmallest(limit, col)
+    return out.nlargest(limit, col)
+
+
+def explain_plan(plan: Dict[str, Any], args: Dict[str, Any]) -> Dict[str, Any]:
+    """Readable optimized plan with estimated (and, once executed, actual) rows per stage."""
+    lines: List[str] = []
+    est = plan.get("estimates", {})
+    act = plan.get("actual", {})
+    if args.get("limit"):
+        top_k = plan.get("top_k")
+        lines.append(f"Limit {args['limit']}{' (top-K)' if top_k else ''}  est_rows={est.get('limited')}" + (f" rows={act['limited']}" if "limited" in act else ""))
+    if args.get("order_by") and not plan.get("top_k"):
+        lines.append(f"Sort {[ob.get('column') for ob in args['order_by']]}")
+    if args.get("select") and not args.get("metrics"):
+        lines.append(f"Project {args['select']}")
+    if args.get("metrics"):
+        lines.append(f"Aggregate group_by={args.get('group_by') or []} metrics={[m.get('alias') or (m.get('op', '') + '_' + m.get('column', '')) for m in args['metrics']]}  est_rows={est.get('aggregated')}" + (f" rows={act['aggregated']}" if "aggregated" in act else ""))
+    depth = 1 if lines else 0
+    for i in range(len(plan["inputs"]) - 1, 0, -1):
+        inp = plan["inputs"][i]
+        if inp["eliminated"]:
+            lines.append(f"{'  ' * depth}-- join {inp['table']} eliminated (unused, unique key {inp['right_on']})")
+            continue
+        how = inp.get("executed_how") or ("inner" if inp["filters"] else "left")
+        lines.append(f"{'  ' * depth}Join[{how}] {inp['left_on']} = {inp['table']}.{inp['right_on']}  est_rows={inp.get('est_join_rows')}" + (f" rows={inp['join_rows']}" if "join_rows" in inp else ""))
+        lines.append(f"{'  ' * (depth + 1)}{_scan_line(inp)}")
+        depth += 1
+    lines.append(f"{'  ' * depth}{_scan_line(plan['inputs'][0])}")
+    stages = [
+        {
+            "table": inp["table"],
+            "columns": inp["columns"],
+            "filters": [f for f, _ in inp["filters"]],
+            "eliminated": bool(inp.get("eliminated")),
+            "est_rows": inp.get("est_rows"),
+            "rows": inp.get("rows"),
+            **({"partitions": inp["partitions"]} if "partitions" in inp else {}),
+        }
+        for inp in plan["inputs"]
+    ]
+    return {"plan": "\n".join(lines), "inputs": stages, "estimates": est, "actual": act}
+
+
+def _scan_line(inp: Dict[str, Any]) -> str:
+    line = f"Scan {inp['table']} columns={inp['columns']}"
+    if inp["filters"]:
+        line += " filters=[" + ", ".join(f"{c} {(f.get('op') or '').lower()} {f.get('value')!r}" for f, c in inp["filters"]) + "]"
+    line += f"  est_rows={inp.get('est_rows')}"
+    if "rows" in inp:
+        line += f" rows={inp['rows']}"
+    if "partitions" in inp:
+        line += f" partitions={inp['partitions']['partitions_scanned']}/{inp['partitions']['partitions_total']}"
+    return line
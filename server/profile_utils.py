@@ -0,0 +1,126 @@
+import os
+import sys
+import hmac
+import time
+import threading
+from collections import Counter
+from typing import Any, Dict, Iterable, List, Optional
+
+from flask import Blueprint, Response, jsonify, request
+
+
+# Admin endpoints are disabled unless a token is configured
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "")
+DEFAULT_INTERVAL_MS = 10.0
+MIN_INTERVAL_MS = 1.0
+MAX_PROFILE_SEC = 60.0
+
+
+def is_admin(req: Any) -> bool:
+    """True when the request carries the configured admin token (X-Admin-Token or Bearer)."""
+    if not ADMIN_TOKEN:
+        return False
+    token = req.headers.get("X-Admin-Token", "")
+    auth = req.headers.get("Authorization", "")
+    if not token and auth.startswith("Bearer "):
+        token = auth[len("Bearer "):]
+    return hmac.compare_digest(token.encode(), ADMIN_TOKEN.encode())
+
+
+def _frame_label(frame: Any) -> str:
+    code = frame.f_code
+    return f"{os.path.basename(code.co_filename)}:{code.co_name}"
+
+
+class SamplingProfiler:
+    """Wall-clock sampling profiler over live threads.
+
+    A daemon thread wakes every `interval_ms`, reads every thread's current
+    frame via sys._current_frames() and counts the root-to-leaf stack. Nothing
+    is installed in the profiled threads, so overhead is one stack walk per
+    thread per sample. Output is collapsed-stack text ("a;b;c 12"), which
+    flamegraph.pl, speedscope and inferno read directly.
+    """
+
+    def __init__(self, interval_ms: float = DEFAULT_INTERVAL_MS, thread_ids: Optional[Iterable[int]] = None):
+        self.interval = max(MIN_INTERVAL_MS, float(interval_ms)) / 1000.0
+        self.thread_ids = set(thread_ids) if thread_ids is not None else None
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self.started_at = 0.0
+        self.duration = 0.0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> "SamplingProfiler":
+        self.started_at = time.perf_counter()
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> "SamplingProfiler":
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.duration = time.perf_counter() - self.started_at
+        return self
+
+    def _run(self) -> None:
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            names = {t.ident: t.name for t in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == own or (self.thread_ids is not None and ident not in self.thread_ids):
+                    continue
+                labels: List[str] = []
+                while frame is not None:
+                    labels.append(_frame_label(frame))
+                    frame = frame.f_back
+                labels.append(names.get(ident, f"thread-{ident}"))
+                self.stacks[";".join(reversed(labels))] += 1
+            self.samples += 1
+
+    def collapsed(self) -> str:
+        return "\n".join(f"{stack} {count}" for stack, count in self.stacks.most_common())
+
+    def summary(self, top: int = 15) -> Dict[str, Any]:
+        """Sample counts, duration and the functions with the most self samples."""
+        leaf: Counter = Counter()
+        for stack, count in self.stacks.items():
+            leaf[stack.rsplit(";", 1)[-1]] += count
+        total = sum(self.stacks.values())
+        return {
+            "samples": self.samples,
+            "stack_samples": total,
+            "interval_ms": round(self.interval * 1000, 3),
+            "duration_ms": round(self.duration * 1000, 1),
+            "top_self": [
+                {"frame": name, "samples": n, "share": round(n / total, 4) if total else 0.0}
+                for name, n in leaf.most_common(top)
+            ],
+        }
+
+
+def create_debug_blueprint() -> Blueprint:
+    bp = Blueprint("debug", __name__)
+
+    @bp.route("/debug/profile", methods=["GET", "POST"])
+    def debug_profile():
+        if not is_admin(request):
+            return jsonify({"error": "forbidden"}), 403
+        data = request.get_json(silent=True) or {}
+        params = {**data, **request.args.to_dict()}
+        try:
+            seconds = max(0.1, min(float(params.get("seconds", 5)), MAX_PROFILE_SEC))
+            interval_ms = float(params.get("interval_ms", DEFAULT_INTERVAL_MS))
+        except (TypeError, ValueError) as e:
+            return jsonify({"error": str(e)}), 400
+        prof = SamplingProfiler(interval_ms)
+        prof.start()
+        time.sleep(seconds)
+        prof.stop()
+        if params.get("format") == "json":
+            return jsonify({**prof.summary(), "collapsed": prof.collapsed()})
+        return Response(prof.collapsed() + "\n", mimetype="text/plain")
+
+    return bp
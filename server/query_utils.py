@@ -0,0 +1,179 @@
+import json
+import time
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional
+
+import pandas as pd
+from flask import Blueprint, jsonify, request
+
+
+DEFAULT_MAX_ROWS = 100
+MAX_ROWS_LIMIT = 1000
+DEFAULT_TIMEOUT_SEC = 5.0
+MAX_TIMEOUT_SEC = 30.0
+
+
+def _normalize_sql(sql: str) -> str:
+    # Only the ends are trimmed: inner whitespace can sit inside string literals, so it is part of the query
+    return (sql or "").strip().rstrip(";").rstrip()
+
+
+def validate_read_only(sql: str) -> Optional[str]:
+    """Return an error message unless `sql` is exactly one SELECT statement."""
+    if not sql:
+        return "sql is required"
+    import duckdb
+
+    try:
+        statements = duckdb.extract_statements(sql)
+    except Exception as e:
+        return f"SQL parse error: {e}"
+    if len(statements) != 1:
+        return "Only a single statement is allowed"
+    if statements[0].type != duckdb.StatementType.SELECT:
+        return "Only read-only SELECT queries are allowed"
+    return None
+
+
+def _render_plan(node: Dict[str, Any], depth: int = 0) -> List[str]:
+    lines: List[str] = []
+    name = node.get("operator_name") or node.get("operator_type")
+    if name:
+        timing_ms = float(node.get("operator_timing") or 0.0) * 1000
+        extra = node.get("extra_info") or {}
+        detail = "; ".join(
+            f"{k}: {', '.join(v) if isinstance(v, list) else v}" for k, v in extra.items() if k != "Estimated Cardinality"
+        )
+        line = f"{'  ' * depth}{name}  rows={node.get('operator_cardinality', 0)}"
+        if "Estimated Cardinality" in extra:
+            line += f" (est {extra['Estimated Cardinality']})"
+        line += f"  time={timing_ms:.2f}ms"
+        if detail:
+            line += f"  [{detail}]"
+        lines.append(line)
+        depth += 1
+    for child in node.get("children") or []:
+        lines.extend(_render_plan(child, depth))
+    return lines
+
+
+class QueryProfiler:
+    """Runs read-only DuckDB SQL over the in-memory tables and reports how it executed.
+
+    A single connection is shared behind a lock with profiling enabled, so
+    each query yields its own EXPLAIN ANALYZE operator tree and rows scanned
+    without being executed a second time. `process_peak_buffer_bytes` is
+    DuckDB's process-wide buffer high-water mark, not the query's own usage:
+    it only grows, and many queries report the same value. Parsed relations
+    are kept in a small LRU so repeated queries skip parsing and binding.
+    """
+
+    def __init__(self, tables: Dict[str, pd.DataFrame], cache_size: int = 64):
+        # duckdb is imported on first use so it stays off the startup path
+        import duckdb
+
+        self._duckdb = duckdb
+        self._lock = threading.Lock()
+        self._con = duckdb.connect()
+        self._con.execute("PRAGMA enable_profiling='no_output'")
+        # User SQL must not reach the filesystem (read_csv, COPY, ATTACH, ...)
+        self._con.execute("SET enable_external_access=false")
+        self._cache: "OrderedDict[str, Any]" = OrderedDict()
+        self._cache_size = max(1, int(cache_size))
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.register_tables(tables)
+
+    def register_tables(self, tables: Dict[str, pd.DataFrame]) -> None:
+        with self._lock:
+            for name, df in tables.items():
+                self._con.register(name, df)
+            self._cache.clear()
+
+    def _relation(self, sql: str, max_rows: int) -> Any:
+        sql = _normalize_sql(sql)
+        key = f"{max_rows}:{sql}"
+        rel = self._cache.get(key)
+        if rel is not None:
+            self._cache.move_to_end(key)
+            self.cache_hits += 1
+            return rel
+        self.cache_misses += 1
+        # The newline keeps a trailing `-- comment` from swallowing the closing parenthesis
+        rel = self._con.sql(f"SELECT * FROM ({sql}\n) AS q LIMIT {max_rows + 1}")
+        self._cache[key] = rel
+        while len(self._cache) > self._cache_size:
+            self._cache.popitem(last=False)
+        return rel
+
+    def profile(self, sql: str, max_rows: int = DEFAULT_MAX_ROWS, timeout_sec: float = DEFAULT_TIMEOUT_SEC) -> Dict[str, Any]:
+        err = validate_read_only(sql)
+        if err:
+            return {"error": err}
+        max_rows = max(1, min(int(max_rows), MAX_ROWS_LIMIT))
+        timeout_sec = max(0.1, min(float(timeout_sec), MAX_TIMEOUT_SEC))
+
+        with self._lock:
+            timer = threading.Timer(timeout_sec, self._con.interrupt)
+            started = time.perf_counter()
+            timer.start()
+            try:
+                rel = self._relation(sql, max_rows)
+                out = rel.df()
+            except self._duckdb.InterruptException:
+                return {"error": f"Query exceeded timeout of {timeout_sec:g}s"}
+            except Exception as e:
+                return {"error": f"SQL error: {e}"}
+            finally:
+                timer.cancel()
+            wall_ms = (time.perf_counter() - started) * 1000
+            try:
+                prof = json.loads(self._con.get_profiling_information(format="json"))
+            except Exception:
+                prof = {}
+
+        truncated = len(out) > max_rows
+        out = out.head(max_rows)
+        plan_lines: List[str] = []
+        for child in prof.get("children") or []:
+            plan_lines.extend(_render_plan(child))
+        return {
+            "columns": list(out.columns),
+            "rows": json.loads(out.to_json(orient="records", date_format="iso")),
+            "row_count": int(len(out)),
+            "truncated": truncated,
+            "max_rows": max_rows,
+            "explain_analyze": "\n".join(plan_lines),
+            "stats": {
+                "wall_time_ms": round(wall_ms, 3),
+                "engine_latency_ms": round(float(prof.get("latency") or 0.0) * 1000, 3),
+                "cpu_time_ms": round(float(prof.get("cpu_time") or 0.0) * 1000, 3),
+                "rows_scanned": int(prof.get("cumulative_rows_scanned") or 0),
+                # Process-wide and monotonic: the largest buffer footprint since the connection opened
+                "process_peak_buffer_bytes": int(prof.get("system_peak_buffer_memory") or 0),
+                "statement_cache": {"hits": self.cache_hits, "misses": self.cache_misses},
+            },
+        }
+
+
+def create_query_blueprint(get_profiler: Callable[[], QueryProfiler]) -> Blueprint:
+    bp = Blueprint("query", __name__)
+
+    @bp.post("/sql/profile")
+    def post_sql_profile():
+        data = request.get_json(silent=True) or {}
+        sql = data.get("sql")
+        if not sql:
+            return jsonify({"error": "sql is required"}), 400
+        try:
+            result = get_profiler().profile(
+                sql,
+                max_rows=data.get("max_rows", DEFAULT_MAX_ROWS),
+                timeout_sec=data.get("timeout_sec", DEFAULT_TIMEOUT_SEC),
+            )
+        except (TypeError, ValueError) as e:
+            return jsonify({"error": str(e)}), 400
+        return jsonify(result), (400 if "error" in result else 200)
+
+    return bp
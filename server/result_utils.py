@@ -0,0 +1,84 @@
+import os
+import time
+import uuid
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+from flask import Blueprint, Response, jsonify, request
+
+from frame_utils import encode
+
+
+# Rows sent inline with a tool result; the rest are paged from /results/<id>
+RESULT_INLINE_ROWS = int(os.getenv("RESULT_INLINE_ROWS", "200"))
+RESULT_STORE_SIZE = int(os.getenv("RESULT_STORE_SIZE", "32"))
+RESULT_TTL_SEC = int(os.getenv("RESULT_TTL_SEC", "3600"))
+MAX_PAGE_ROWS = 2000
+
+
+class ResultStore:
+    """Recent large row sets kept server-side so clients can page through them.
+
+    Bounded by count (LRU) and age; an expired id simply returns 404.
+    """
+
+    def __init__(self, max_results: int = RESULT_STORE_SIZE, ttl: float = RESULT_TTL_SEC, inline_rows: int = RESULT_INLINE_ROWS):
+        self.max_results = max(1, max_results)
+        self.ttl = ttl
+        self.inline_rows = max(1, inline_rows)
+        self._lock = threading.Lock()
+        self._results: "OrderedDict[str, Tuple[float, List[str], List[Any]]]" = OrderedDict()
+
+    def truncate(self, result: Any) -> Any:
+        """Keep the first page of a large `rows` result inline and store the full rows under a result_id."""
+        if not isinstance(result, dict):
+            return result
+        rows = result.get("rows")
+        if not isinstance(rows, list) or len(rows) <= self.inline_rows:
+            return result
+        result_id = uuid.uuid4().hex
+        with self._lock:
+            self._results[result_id] = (time.time(), list(result.get("columns") or []), rows)
+            while len(self._results) > self.max_results:
+                self._results.popitem(last=False)
+        return {**result, "rows": rows[: self.inline_rows], "total_rows": len(rows), "result_id": result_id}
+
+    def page(self, result_id: str, offset: int, limit: int) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            entry = self._results.get(result_id)
+            if entry is None:
+                return None
+            if time.time() - entry[0] > self.ttl:
+                del self._results[result_id]
+                return None
+            self._results.move_to_end(result_id)
+        _, columns, rows = entry
+        offset = max(0, offset)
+        limit = max(1, min(limit, MAX_PAGE_ROWS))
+        return {
+            "result_id": result_id,
+            "columns": columns,
+            "offset": offset,
+            "rows": rows[offset: offset + limit],
+            "total_rows": len(rows),
+        }
+
+
+def create_results_blueprint(store: ResultStore) -> Blueprint:
+    bp = Blueprint("results", __name__)
+
+    @bp.get("/results/<result_id>")
+    def get_result_page(result_id: str):
+        try:
+            offset = int(request.args.get("offset", 0))
+            limit = int(request.args.get("limit", store.inline_rows))
+        except ValueError:
+            return jsonify({"error": "offset and limit must be integers"}), 400
+        page = store.page(result_id, offset, limit)
+        if page is None:
+            return jsonify({"error": "result not found or expired"}), 404
+        # Stored rows may hold NumPy/pandas values, so use the frame encoder rather than jsonify
+        return Response(encode(page), mimetype="application/json")
+
+    return bp
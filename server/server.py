@@ -1,6 +1,10 @@
 import os
 import json
 import time
+
+_IMPORT_STARTED = time.perf_counter()
+
+import threading
 from datetime import datetime, timedelta
 from typing import Dict, Any, Generator, List, Tuple, Optional
 import pandas as pd
@@ -9,8 +13,30 @@ from flask import Flask, Response, jsonify, request, stream_with_context
 from flask_cors import CORS
 from dotenv import load_dotenv
 
-from data_utils import ensure_data_dir, generate_fake_data, load_dataframes
-from memory_utils import ensure_memory_file, remember_users, create_memory_blueprint
+from data_utils import ensure_data_dir, is_time_column, load_state, source_fingerprint
+from chart_utils import bucket_labels, bucket_timestamps, lttb_indices, minmax_indices
+from memory_utils import ensure_memory_dir, get_memory_store, remember_users, create_memory_blueprint
+from cache_utils import CompletionCache, cached_chat_completion
+from query_utils import QueryProfiler, create_query_blueprint
+from cohort_utils import COHORT_GRANULARITIES, DEFAULT_MAX_PERIODS, build_cohorts, heatmap_spec, update_cohorts
+from funnel_utils import DEFAULT_FUNNEL_STEPS, DEFAULT_WINDOW_HOURS, MAX_BREAKDOWN_GROUPS, build_event_index, compute_funnel
+from profile_utils import SamplingProfiler, create_debug_blueprint, is_admin
+from session_utils import Sessionizer
+from parallel_utils import aggregation_stats, group_aggregate
+from partition_utils import PARTITIONED_TABLES, PartitionedTable
+from time_utils import as_utc
+from frame_utils import Encoded, frame, sse_frames
+from result_utils import ResultStore, create_results_blueprint
+from plan_utils import PlanFallback, apply_top_k, build_plan, estimate_plan, execute_plan, explain_plan
+from admission_utils import (
+    MAX_CONCURRENT_MODEL_CALLS,
+    MAX_CONCURRENT_TOOL_WORK,
+    MAX_QUEUED_REQUESTS,
+    FairLimiter,
+    QueueFullError,
+    Ticket,
+    render_prometheus,
+)
 
 
 load_dotenv()
@@ -18,25 +44,231 @@ load_dotenv()
 app = Flask(__name__)
 CORS(app, resources={r"/*": {"origins": "*"}})
 
-DATA_DIR = os.path.join(os.path.dirname(__file__), "data")
+DATA_DIR = os.getenv("DATA_DIR", os.path.join(os.path.dirname(__file__), "data"))
 MEMORY_PATH = os.path.join(DATA_DIR, "memory.json")
+MEMORY_DIR = os.getenv("MEMORY_DIR", os.path.join(DATA_DIR, "memory"))
+SNAPSHOT_PATH = os.getenv("DATA_SNAPSHOT_PATH", os.path.join(DATA_DIR, "snapshot.pkl"))
+PARTITION_DIR = os.getenv("PARTITION_DIR", os.path.join(DATA_DIR, "partitions"))
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY", "")
 OPENAI_MODEL = os.getenv("OPENAI_MODEL", "gpt-4o-mini")
+LLM_CACHE_DIR = os.getenv("LLM_CACHE_DIR", os.path.join(DATA_DIR, "llm_cache"))
+# Built on first use: opening the cache lists and evicts files, which worker imports must not do
+_llm_cache_instance: Optional[CompletionCache] = None
+_llm_cache_lock = threading.Lock()
+
+
+def _llm_cache() -> CompletionCache:
+    global _llm_cache_instance
+    with _llm_cache_lock:
+        if _llm_cache_instance is None:
+            _llm_cache_instance = CompletionCache(
+                LLM_CACHE_DIR,
+                mode=os.getenv("LLM_CACHE_MODE", "readwrite"),
+                max_entries=int(os.getenv("LLM_CACHE_MAX_ENTRIES", "2000")),
+                max_bytes=int(os.getenv("LLM_CACHE_MAX_MB", "64")) * 1024 * 1024,
+            )
+        return _llm_cache_instance
+
+RESULT_STORE = ResultStore()
+
+# Admission control: model calls and CPU-bound tool work have separate concurrency limits.
+# New chats that cannot get a model slot wait in a bounded queue shared fairly across sessions.
+MODEL_LIMITER = FairLimiter("model", MAX_CONCURRENT_MODEL_CALLS, MAX_QUEUED_REQUESTS)
+TOOL_LIMITER = FairLimiter("tool", MAX_CONCURRENT_TOOL_WORK, MAX_QUEUED_REQUESTS)
+QUEUE_POLL_SEC = 0.5
 
 def ensure_memory_file_local() -> None:
-    ensure_memory_file(MEMORY_PATH)
+    ensure_memory_dir(MEMORY_DIR)
+    # Sessions from the legacy single-file memory.json are split into shards once
+    get_memory_store(MEMORY_DIR, legacy_path=MEMORY_PATH)
 
 def ensure_data_dir():
     from data_utils import ensure_data_dir as _edd
     _edd()
-    
-ensure_data_dir()
-ensure_memory_file_local()
-generate_fake_data()
-dfs = load_dataframes()
+
+# Data is loaded in the background so /health answers immediately; /ready flips once it is in place.
+# DATA_SNAPSHOT_MODE=auto loads the preprocessed snapshot (or rebuilds it), off always parses the JSON.
+DATA_SNAPSHOT_MODE = os.getenv("DATA_SNAPSHOT_MODE", "auto").lower()
+DATA_LOAD_ASYNC = os.getenv("DATA_LOAD_ASYNC", "1") not in ("0", "false", "no")
+dfs: Dict[str, pd.DataFrame] = {}
+DERIVED: Dict[str, Any] = {}
+# Day/month partitions of the time-keyed tables, read by the filter and chart paths. Each one
+# is a set of row ranges of the resident frame in dfs, so a pruned scan slices only its window.
+PARTITIONS: Dict[str, PartitionedTable] = {}
+DATA_READY = threading.Event()
+STARTUP_REPORT: Dict[str, Any] = {}
+
+
+def _load_data_state() -> None:
+    started = time.perf_counter()
+    try:
+        loaded_dfs, derived, report = load_state(DATA_SNAPSHOT_MODE, SNAPSHOT_PATH)
+        dfs.update(loaded_dfs)
+        DERIVED.update(derived)
+        STARTUP_REPORT.update(report)
+        _attach_derived_tables()
+    except Exception as e:
+        STARTUP_REPORT["error"] = f"data load error: {e}"
+        app.logger.exception("data load failed")
+        return
+    _build_partitions()
+    STARTUP_REPORT["state_ms"] = round((time.perf_counter() - started) * 1000, 1)
+    STARTUP_REPORT["ready_after_ms"] = round((time.perf_counter() - _IMPORT_STARTED) * 1000, 1)
+    DATA_READY.set()
+    app.logger.info("startup report: %s", STARTUP_REPORT)
+
+
+# Tables computed from the source tables; served like any other table but never appended to directly
+DERIVED_TABLES = {"sessions"}
+
+
+def _sessions() -> Optional[Sessionizer]:
+    sessions = DERIVED.get("sessions")
+    if sessions is None and "events" in dfs:
+        ts = DERIVED.get("timestamps", {}).get("events", {}).get("timestamp")
+        if ts is not None and "user_id" in dfs["events"].columns:
+            sessions = DERIVED["sessions"] = Sessionizer.build(dfs["events"], ts, DERIVED.get("event_index"))
+    return sessions
+
+
+def _attach_derived_tables() -> None:
+    sessions = _sessions()
+    if sessions is not None:
+        dfs["sessions"] = sessions.table
+
+
+def _build_partitions() -> None:
+    """Open (or write) the partitions of each time-keyed table; failures fall back to the full frames."""
+    started = time.perf_counter()
+    try:
+        fingerprint = source_fingerprint()
+    except OSError:
+        fingerprint = {}
+    for table, time_col in PARTITIONED_TABLES.items():
+        ts = DERIVED.get("timestamps", {}).get(table, {}).get(time_col)
+        if table not in dfs or ts is None:
+            continue
+        try:
+            part = PartitionedTable.open_or_build(
+                table, dfs[table], time_col, ts, fingerprint=fingerprint.get(table), base_dir=PARTITION_DIR
+            )
+            PARTITIONS[table] = part
+        except Exception as e:
+            STARTUP_REPORT.setdefault("partition_errors", {})[table] = str(e)
+            app.logger.exception("partitioning %s failed", table)
+    STARTUP_REPORT["partitions_ms"] = round((time.perf_counter() - started) * 1000, 1)
+
+
+def wait_until_ready(timeout: Optional[float] = None) -> bool:
+    return DATA_READY.wait(timeout)
+
+
+_APPEND_LOCK = threading.Lock()
+
+
+def append_rows(table: str, rows: List[Dict[str, Any]]) -> int:
+    """Append rows to an in-memory table and bring derived state up to date.
+
+    Cohort matrices, sessions, partitions and parsed timestamps are updated incrementally;
+    per-user aggregates and the funnel index are dropped and rebuilt on next use.
+    Appended rows live in memory only; the JSON sources and snapshot are untouched.
+    """
+    if table not in dfs or table in DERIVED_TABLES:
+        raise KeyError(f"Unknown table: {table}")
+    with _APPEND_LOCK:
+        base = dfs[table]
+        new = pd.DataFrame(rows)
+        new.index = pd.RangeIndex(len(base), len(base) + len(new))
+        # Every parsed time column grows with the frame; rows without the column parse as NaT
+        tbl_ts = DERIVED.setdefault("timestamps", {}).setdefault(table, {})
+        tbl_days = DERIVED.setdefault("days", {}).setdefault(table, {})
+        for col in list(tbl_ts):
+            raw = new[col] if col in new.columns else pd.Series(None, index=new.index, dtype=object)
+            parsed = pd.to_datetime(raw, errors="coerce", utc=True)
+            tbl_ts[col] = pd.concat([tbl_ts[col], parsed])
+            tbl_days[col] = pd.concat([tbl_days[col], parsed.dt.strftime("%Y-%m-%d").fillna("NaT")])
+        update_cohorts(_cohorts(), table, new)
+        # The frame grows before the partitions record the new ranges, so a concurrent scan never
+        # sees ranges past the end of the frame it was handed
+        dfs[table] = pd.concat([base, new])
+        if table in PARTITIONS:
+            time_col = PARTITIONS[table].time_col
+            PARTITIONS[table].append(new, pd.to_datetime(new.get(time_col, pd.Series(index=new.index, dtype=object)), errors="coerce", utc=True))
+        if table == "users" and "id" in new.columns:
+            user_pos = DERIVED.setdefault("user_pos", {})
+            for i, uid in zip(new.index, new["id"].tolist()):
+                user_pos.setdefault(str(uid), int(i))
+        aggregates = DERIVED.get("aggregates", {})
+        for name, source in (("revenue_by_user", "purchases"), ("clicks_by_user", "events")):
+            if table in (source, "users"):
+                aggregates.pop(name, None)
+        if table == "events":
+            DERIVED.pop("event_index", None)
+            sessions = _sessions()
+            ts = DERIVED.get("timestamps", {}).get("events", {}).get("timestamp")
+            if sessions is not None and ts is not None and "timestamp" in new.columns:
+                sessions.update(dfs[table], ts, new, ts.loc[new.index])
+                dfs["sessions"] = sessions.table
+        if _query_profiler is not None:
+            _query_profiler.register_tables({t: dfs[t] for t in (table, "sessions") if t in dfs})
+    return len(new)
+
+
+_query_profiler: Optional[QueryProfiler] = None
+
+
+def get_query_profiler() -> QueryProfiler:
+    global _query_profiler
+    if _query_profiler is None:
+        _query_profiler = QueryProfiler(dfs)
+    return _query_profiler
+
+
+app.register_blueprint(create_memory_blueprint(MEMORY_DIR))
+app.register_blueprint(create_query_blueprint(get_query_profiler))
+app.register_blueprint(create_debug_blueprint())
+app.register_blueprint(create_results_blueprint(RESULT_STORE))
+
+STARTUP_REPORT["import_ms"] = round((time.perf_counter() - _IMPORT_STARTED) * 1000, 1)
+
+_started = False
+_start_lock = threading.Lock()
+
+
+def start() -> None:
+    """Create the data and memory directories and begin loading data, once per process.
+
+    Runs from create_app(), `python server.py` or the first request rather than
+    at import: aggregation workers started with spawn/forkserver re-import the
+    main module and must not open the memory store or load data again.
+    """
+    global _started
+    with _start_lock:
+        if _started:
+            return
+        _started = True
+    ensure_data_dir()
+    ensure_memory_file_local()
+    if DATA_LOAD_ASYNC:
+        threading.Thread(target=_load_data_state, name="data-load", daemon=True).start()
+    else:
+        _load_data_state()
 
 
-app.register_blueprint(create_memory_blueprint(MEMORY_PATH))
+_READINESS_EXEMPT = {"health", "ready", "metrics", "memory.get_memory", "memory.post_memory", "debug.debug_profile"}
+
+
+@app.before_request
+def _require_ready():
+    # Servers that import `app` directly (flask run, gunicorn server:app) start on the first request
+    if not _started:
+        start()
+    if request.method == "OPTIONS" or request.endpoint in _READINESS_EXEMPT or DATA_READY.is_set():
+        return None
+    resp = jsonify({"error": "Server is starting; data is not loaded yet.", "startup": STARTUP_REPORT})
+    resp.status_code = 503
+    resp.headers["Retry-After"] = "1"
+    return resp
 
 
 
@@ -44,17 +276,21 @@ OPENAI_TOOLS: List[Dict[str, Any]] = [
     {"type": "function",
      "function": {
          "name": "chartjs_data",
-         "description": "Return Chart.js-ready spec by aggregating a table (bar or line).",
+         "description": "Return Chart.js-ready spec by aggregating a table (bar or line). Optionally split into one dataset per value of a series column. Line charts over a date axis are chronological and downsampled to max_points.",
          "parameters": {
              "type": "object",
              "properties": {
-                 "table": {"type": "string", "enum": ["users", "events", "purchases"]},
+                 "table": {"type": "string", "enum": ["users", "events", "purchases", "sessions"]},
                  "kind": {"type": "string", "enum": ["bar", "line"]},
                  "x": {"type": "string", "description": "Dimension on X axis (category or date)"},
                  "y": {"type": "string", "description": "Numeric value column to aggregate"},
                  "op": {"type": "string", "enum": ["count", "sum", "mean", "max", "min"]},
-                 "filters": {"type": "array", "items": {"type": "object"}},
-                 "limit": {"type": "integer", "minimum": 1, "maximum": 200}
+                 "series": {"type": "string", "description": "Optional column to split into multiple datasets (e.g. event_type, product)"},
+                 "bucket": {"type": "string", "enum": ["minute", "hour", "day", "week", "month"], "description": "Time bucket when x is a date/time column"},
+                 "filters": {"type": "array", "items": {"type": "object"}, "description": "[{column, op: eq|in|contains|gt|gte|lt|lte, value}]; time ranges on timestamp/purchased_at only read the matching partitions"},
+                 "limit": {"type": "integer", "minimum": 1, "maximum": 200, "description": "Top-N x values for bar/category charts"},
+                 "max_points": {"type": "integer", "minimum": 10, "maximum": 5000, "description": "Point budget for time-series line charts"},
+                 "max_series": {"type": "integer", "minimum": 1, "maximum": 12}
              },
              "required": ["table", "kind", "x", "y", "op"]
          }
@@ -63,7 +299,7 @@ OPENAI_TOOLS: List[Dict[str, Any]] = [
     {"type": "function",
      "function": {
          "name": "sql_tutor",
-         "description": "Provide SQL guidance and example queries over users/events/purchases (DuckDB-compatible).",
+         "description": "Provide SQL guidance and example queries over users/events/purchases/sessions (DuckDB-compatible).",
          "parameters": {
              "type": "object",
              "properties": {
@@ -73,6 +309,56 @@ OPENAI_TOOLS: List[Dict[str, Any]] = [
          }
      }
     },
+    {"type": "function",
+     "function": {
+         "name": "sql_profile",
+         "description": "Execute a read-only DuckDB SELECT over users/events/purchases/sessions and return a capped preview with EXPLAIN ANALYZE output, wall time, rows scanned and the process-wide peak buffer memory.",
+         "parameters": {
+             "type": "object",
+             "properties": {
+                 "sql": {"type": "string", "description": "A single SELECT statement"},
+                 "max_rows": {"type": "integer", "minimum": 1, "maximum": 1000},
+                 "timeout_sec": {"type": "number", "minimum": 0.1, "maximum": 30}
+             },
+             "required": ["sql"]
+         }
+     }
+    },
+    {"type": "function",
+     "function": {
+         "name": "funnel_analysis",
+         "description": "Ordered funnel conversion over events.event_type per user (default page_view -> product_click -> add_to_cart -> checkout_start -> purchase), within a conversion window from the first step. Optionally broken down by entry page or a users attribute.",
+         "parameters": {
+             "type": "object",
+             "properties": {
+                 "steps": {"type": "array", "items": {"type": "string"}, "description": "Ordered event_type values; defaults to the purchase funnel"},
+                 "window_hours": {"type": "number", "minimum": 0, "description": "Max time from the first step to each later step (default 168)"},
+                 "since": {"type": "string", "description": "Only events at or after this ISO date/time"},
+                 "until": {"type": "string", "description": "Only events before this ISO date/time"},
+                 "breakdown": {"type": "string", "description": "'page' (page of the first step) or a users column such as location or age"},
+                 "max_groups": {"type": "integer", "minimum": 1, "maximum": 50}
+             }
+         }
+     }
+    },
+    {"type": "function",
+     "function": {
+         "name": "cohort_analysis",
+         "description": "Signup-cohort matrices (users grouped by week/month of users.signup_date): retention share or active users per period since signup, or cumulative purchase revenue. Returns rows or a heatmap-style Chart.js spec.",
+         "parameters": {
+             "type": "object",
+             "properties": {
+                 "metric": {"type": "string", "enum": ["retention", "active", "revenue"]},
+                 "granularity": {"type": "string", "enum": ["week", "month"]},
+                 "since": {"type": "string", "description": "First signup cohort to include (ISO date)"},
+                 "until": {"type": "string", "description": "Last signup cohort to include (ISO date)"},
+                 "max_periods": {"type": "integer", "minimum": 1, "maximum": 52},
+                 "per_user": {"type": "boolean", "description": "Revenue per cohort user instead of the cohort total"},
+                 "format": {"type": "string", "enum": ["rows", "heatmap"]}
+             }
+         }
+     }
+    },
     {"type": "function",
      "function": {
          "name": "business_insight",
@@ -126,10 +412,25 @@ def _stabilize_tool_args(name: str, args: Dict[str, Any]) -> Dict[str, Any]:
             except Exception:
                 lim = 20
             updated["limit"] = max(1, min(lim, 200))
+        if "max_points" in updated:
+            try:
+                updated["max_points"] = max(10, min(int(updated["max_points"]), 5000))
+            except Exception:
+                updated["max_points"] = 500
+        if updated.get("series") and updated["series"] not in dfs[updated["table"]].columns:
+            updated.pop("series")
     return updated
 
 
-def _apply_simple_filters(df: pd.DataFrame, filters: Optional[List[Dict[str, Any]]]) -> pd.DataFrame:
+def _scan_table(table: str, filters: Optional[List[Dict[str, Any]]]) -> Tuple[pd.DataFrame, Optional[Dict[str, Any]]]:
+    """Rows of `table` that may match `filters`, reading only unpruned partitions when it is partitioned."""
+    part = PARTITIONS.get(table)
+    if part is None:
+        return dfs[table], None
+    return part.select(filters, full=dfs[table])
+
+
+def _apply_simple_filters(df: pd.DataFrame, filters: Optional[List[Dict[str, Any]]], table: Optional[str] = None) -> pd.DataFrame:
     if not filters:
         return df
     out = df.copy()
@@ -146,11 +447,31 @@ def _apply_simple_filters(df: pd.DataFrame, filters: Optional[List[Dict[str, Any
                 out = out[out[col].isin(val)]
             elif op == "contains" and isinstance(val, str) and out[col].dtype == object:
                 out = out[out[col].str.contains(val, case=False, na=False)]
+            elif op in ("gt", "gte", "lt", "lte"):
+                lhs = out[col]
+                if is_time_column(col):
+                    # Time columns compare as instants, not as strings
+                    parsed = DERIVED.get("timestamps", {}).get(table, {}).get(col)
+                    lhs = parsed.loc[out.index] if parsed is not None else pd.to_datetime(lhs, errors="coerce", utc=True)
+                    val = as_utc(val)
+                    if val is None:
+                        continue
+                if op == "gt": out = out[lhs > val]
+                if op == "gte": out = out[lhs >= val]
+                if op == "lt": out = out[lhs < val]
+                if op == "lte": out = out[lhs <= val]
         except Exception:
             continue
     return out
 
 
+CHART_PALETTE = ["#6C5CE7", "#00B894", "#0984E3", "#E17055", "#E84393", "#FDCB6E", "#00CEC9", "#636E72"]
+
+
+def _chart_values(values: Any) -> List[Any]:
+    return [None if pd.isna(v) else v for v in values.tolist()]
+
+
 def tool_chartjs_data(args: Dict[str, Any]) -> Dict[str, Any]:
     table = args["table"]
     kind = args.get("kind", "bar").lower()
@@ -158,49 +479,99 @@ def tool_chartjs_data(args: Dict[str, Any]) -> Dict[str, Any]:
     y = args["y"]
     op = args.get("op", "sum").lower()
     limit = max(1, min(int(args.get("limit", 20)), 200))
+    series = args.get("series")
+    bucket = (args.get("bucket") or "day").lower()
+    max_points = max(10, min(int(args.get("max_points", 500)), 5000))
+    max_series = max(1, min(int(args.get("max_series", 6)), 12))
 
-    df = _apply_simple_filters(dfs[table], args.get("filters"))
+    scanned, scan_info = _scan_table(table, args.get("filters"))
+    df = _apply_simple_filters(scanned, args.get("filters"), table)
 
     # Ensure numeric for y unless op is count
     if op != "count" and not (y in df.columns and pd.api.types.is_numeric_dtype(df[y])):
         return {"error": f"Column {y} is not numeric for op {op}"}
+    if series and series not in df.columns:
+        return {"error": f"Unknown series column {series}"}
+
+    # Group keys are row-label subsets of these full columns, whose key encodings are cached
+    sources: Dict[str, Any] = {x: dfs[table]}
+    if series:
+        sources[series] = dfs[table]
 
     # Handle time x axis
-    if x in df.columns and ("date" in x or "time" in x or x.endswith("_at") or x.endswith("timestamp")):
-        x_series = pd.to_datetime(df[x], errors="coerce", utc=True).dt.date.astype(str)
+    is_time = x in df.columns and is_time_column(x)
+    if is_time:
+        days = DERIVED.get("days", {}).get(table, {}).get(x)
+        parsed = DERIVED.get("timestamps", {}).get(table, {}).get(x)
+        sources.pop(x)
+        if bucket == "day" and days is not None:
+            x_series = days.loc[df.index]
+            sources["_x"] = days
+        else:
+            ts = parsed.loc[df.index] if parsed is not None else pd.to_datetime(df[x], errors="coerce", utc=True)
+            x_series = bucket_timestamps(ts, bucket)
         df = df.assign(_x=x_series)
         xcol = "_x"
     else:
         xcol = x
 
-    if op == "count":
-        grouped = df.groupby(xcol).size().reset_index(name="value")
-        label = f"count({y})"
+    # One groupby over (x[, series]) pivoted into an x-by-series matrix
+    keys = [xcol, series] if series else [xcol]
+    label = f"{op}({y})"
+    agg = group_aggregate(df, keys, {label: (y, "size" if op == "count" else op)}, sources)[label]
+    if series:
+        matrix = agg.unstack(series, fill_value=0 if op in ("count", "sum") else None)
+        totals = matrix.sum(axis=0, skipna=True).sort_values(ascending=False)
+        matrix = matrix[totals.index[:max_series]]
     else:
-        grouped = getattr(df.groupby(xcol)[y], op)().reset_index(name="value")
-        label = f"{op}({y})"
-
-    grouped = grouped.sort_values("value", ascending=False).head(limit)
-    labels = grouped[xcol].astype(str).tolist()
-    values = grouped["value"].tolist()
+        matrix = agg.to_frame(label)
+
+    downsample: Dict[str, Any] = {"original_points": int(len(matrix))}
+    if kind == "line" and is_time:
+        # Time series keep chronological order and are thinned to max_points instead of top-N
+        matrix = matrix.sort_index()
+        if len(matrix) > max_points:
+            values = matrix.to_numpy(dtype=float)
+            if values.shape[1] == 1:
+                idx = lttb_indices(values[:, 0], max_points)
+                downsample["method"] = "lttb"
+            else:
+                idx = minmax_indices(values, max_points)
+                downsample["method"] = "minmax"
+            matrix = matrix.iloc[idx]
+    else:
+        order = matrix.sum(axis=1, skipna=True) if series else matrix[label]
+        matrix = matrix.loc[order.sort_values(ascending=False).index[:limit]]
+    downsample["points"] = int(len(matrix))
+
+    labels = bucket_labels(matrix.index, bucket)
+    datasets = []
+    for i, col in enumerate(matrix.columns):
+        color = CHART_PALETTE[i % len(CHART_PALETTE)]
+        datasets.append({
+            "label": f"{col}" if series else label,
+            "data": _chart_values(matrix[col]),
+            "backgroundColor": color if kind == "bar" else (f"{color}33" if series else "rgba(108,92,231,0.2)"),
+            "borderColor": color,
+            "fill": False if kind == "line" else True,
+            "tension": 0.25 if kind == "line" else 0,
+        })
 
-    palette = ["#6C5CE7", "#00B894", "#0984E3", "#E17055", "#E84393"]
     spec = {
         "type": kind,
         "data": {
             "labels": labels,
-            "datasets": [
-                {
-                    "label": label,
-                    "data": values,
-                    "backgroundColor": palette[0] if kind == "bar" else "rgba(108,92,231,0.2)",
-                    "borderColor": palette[0],
-                    "fill": False if kind == "line" else True,
-                    "tension": 0.25 if kind == "line" else 0,
-                }
-            ],
+            "datasets": datasets,
         },
         "options": {"responsive": True, "plugins": {"legend": {"display": True}}},
+        "meta": {
+            "series": series,
+            "bucket": bucket if is_time else None,
+            "original_points": downsample["original_points"],
+            "points": downsample["points"],
+            "downsample": downsample.get("method"),
+            **({"partitions": scan_info} if scan_info else {}),
+        },
     }
     return {"chartjs": spec}
 
@@ -270,6 +641,17 @@ LIMIT 10;
     return {"tips": tips, "schema": schema_cols, "examples": examples}
 
 
+def tool_sql_profile(args: Dict[str, Any]) -> Dict[str, Any]:
+    try:
+        return get_query_profiler().profile(
+            args.get("sql") or "",
+            max_rows=args.get("max_rows", 100),
+            timeout_sec=args.get("timeout_sec", 5.0),
+        )
+    except Exception as e:
+        return {"error": str(e)}
+
+
 def _resolve_table_column(col: str) -> Tuple[pd.DataFrame, str]:
     # Support qualified columns like users.name; otherwise search source-then-joins context later
     parts = col.split(".")
@@ -283,56 +665,87 @@ def _resolve_table_column(col: str) -> Tuple[pd.DataFrame, str]:
     raise KeyError(f"Unknown column: {col}")
 
 
+def _run_plan_joins_naive(args: Dict[str, Any]) -> pd.DataFrame:
+    """Unoptimized joins and filters: full-table left joins, then filters on the joined frame."""
+    source = args.get("source")
+    df = dfs[source].copy()
+
+    # joins (only safe join supported: events/purchases.user_id -> users.id)
+    for j in (args.get("joins") or []):
+        jtable = j.get("table")
+        if jtable not in dfs:
+            continue
+        left_on = right_on = None
+        on = j.get("on") or {}
+        # Accept either explicit mapping or implicit by convention
+        if on:
+            # pick first pair
+            lk, rk = next(iter(on.items()))
+            left_on = lk.split(".")[-1]
+            right_on = rk.split(".")[-1]
+        else:
+            # conventions
+            if "user_id" in df.columns and "id" in dfs[jtable].columns:
+                left_on, right_on = "user_id", "id"
+        if left_on and right_on:
+            df = df.merge(dfs[jtable], left_on=left_on, right_on=right_on, how="left")
+
+    # filters
+    for f in (args.get("filters") or []):
+        col = f.get("column"); op = (f.get("op") or "").lower(); val = f.get("value")
+        if col not in df.columns:
+            # try qualified resolution
+            _, cname = _resolve_table_column(col)
+            col = cname if cname in df.columns else None
+        if not col:
+            continue
+        try:
+            if op in ("eq","="):
+                df = df[df[col] == val]
+            elif op == "in" and isinstance(val, list):
+                df = df[df[col].isin(val)]
+            elif op == "contains" and isinstance(val, str) and df[col].dtype == object:
+                df = df[df[col].str.contains(val, case=False, na=False)]
+            elif op in ("gt","gte","lt","lte"):
+                lhs = df[col]
+                if is_time_column(col):
+                    # Compare instants, as the optimized path and partition pruning do
+                    lhs = pd.to_datetime(lhs, errors="coerce", utc=True)
+                    val = as_utc(val)
+                    if val is None:
+                        continue
+                if op == "gt": df = df[lhs > val]
+                if op == "gte": df = df[lhs >= val]
+                if op == "lt": df = df[lhs < val]
+                if op == "lte": df = df[lhs <= val]
+        except Exception:
+            continue
+    return df
+
+
 def tool_run_analysis_plan(args: Dict[str, Any]) -> Dict[str, Any]:
     try:
         source = args.get("source")
         if source not in dfs:
             return {"error": f"Unknown source table: {source}"}
-        df = dfs[source].copy()
-
-        # joins (only safe join supported: events/purchases.user_id -> users.id)
-        for j in (args.get("joins") or []):
-            jtable = j.get("table")
-            if jtable not in dfs:
-                continue
-            left_on = right_on = None
-            on = j.get("on") or {}
-            # Accept either explicit mapping or implicit by convention
-            if on:
-                # pick first pair
-                lk, rk = next(iter(on.items()))
-                left_on = lk.split(".")[-1]
-                right_on = rk.split(".")[-1]
-            else:
-                # conventions
-                if "user_id" in df.columns and "id" in dfs[jtable].columns:
-                    left_on, right_on = "user_id", "id"
-            if left_on and right_on:
-                df = df.merge(dfs[jtable], left_on=left_on, right_on=right_on, how="left")
-
-        # filters
-        for f in (args.get("filters") or []):
-            col = f.get("column"); op = (f.get("op") or "").lower(); val = f.get("value")
-            if col not in df.columns:
-                # try qualified resolution
-                _, cname = _resolve_table_column(col)
-                col = cname if cname in df.columns else None
-            if not col:
-                continue
+        # Optimized path: filters pushed to their tables, pruned inputs, unused joins dropped
+        plan = None
+        if args.get("optimize", True):
             try:
-                if op in ("eq","="):
-                    df = df[df[col] == val]
-                elif op == "in" and isinstance(val, list):
-                    df = df[df[col].isin(val)]
-                elif op == "contains" and isinstance(val, str) and df[col].dtype == object:
-                    df = df[df[col].str.contains(val, case=False, na=False)]
-                elif op in ("gt","gte","lt","lte"):
-                    if op == "gt": df = df[df[col] > val]
-                    if op == "gte": df = df[df[col] >= val]
-                    if op == "lt": df = df[df[col] < val]
-                    if op == "lte": df = df[df[col] <= val]
-            except Exception:
-                continue
+                plan = build_plan(args, dfs)
+                estimate_plan(plan, dfs, args)
+            except PlanFallback:
+                plan = None
+        if plan:
+            # Each partitioned input reads only the partitions its pushed-down filters can match
+            scan_tables = dict(dfs)
+            for inp in plan["inputs"]:
+                if inp["table"] in PARTITIONS and inp["filters"] and sum(i["table"] == inp["table"] for i in plan["inputs"]) == 1:
+                    filters = [dict(f, column=c) for f, c in inp["filters"]]
+                    scan_tables[inp["table"]], inp["partitions"] = PARTITIONS[inp["table"]].select(filters, full=dfs[inp["table"]])
+            df = execute_plan(plan, scan_tables, DERIVED.get("timestamps"))
+        else:
+            df = _run_plan_joins_naive(args)
 
         # group & metrics
         group_by = args.get("group_by") or []
@@ -346,7 +759,7 @@ def tool_run_analysis_plan(args: Dict[str, Any]) -> Dict[str, Any]:
                 name = alias or f"{op}_{col}"
                 agg_kwargs[name] = (col, op)
             if group_by:
-                out = df.groupby(group_by).agg(**agg_kwargs).reset_index()
+                out = group_aggregate(df, group_by, agg_kwargs).reset_index()
             else:
                 out = df.agg({v[0]: v[1] for v in agg_kwargs.values()}).to_frame().T
                 out.columns = list(agg_kwargs.keys())
@@ -360,19 +773,35 @@ def tool_run_analysis_plan(args: Dict[str, Any]) -> Dict[str, Any]:
             if keep:
                 out = out[keep]
 
-        # order & limit
-        for ob in (args.get("order_by") or []):
-            col = ob.get("column"); direction = (ob.get("dir") or "desc").lower()
-            if col in out.columns:
-                out = out.sort_values(col, ascending=(direction == "asc"))
-        if args.get("limit"):
+        if plan:
+            plan["actual"]["aggregated"] = int(len(out))
+
+        # order & limit (a single numeric key with a limit is a top-K selection, not a full sort)
+        top = None
+        if plan and args.get("limit") and args.get("order_by"):
             try:
-                lim = int(args.get("limit"))
-                out = out.head(max(1, min(lim, 1000)))
-            except Exception:
-                pass
+                top = apply_top_k(out, args["order_by"], max(1, min(int(args["limit"]), 1000)))
+            except (TypeError, ValueError):
+                top = None
+        if top is not None:
+            out = top
+            plan["top_k"] = True
+        else:
+            for ob in (args.get("order_by") or []):
+                col = ob.get("column"); direction = (ob.get("dir") or "desc").lower()
+                if col in out.columns:
+                    out = out.sort_values(col, ascending=(direction == "asc"))
+            if args.get("limit"):
+                try:
+                    lim = int(args.get("limit"))
+                    out = out.head(max(1, min(lim, 1000)))
+                except Exception:
+                    pass
 
         result = {"columns": list(out.columns), "rows": out.to_dict(orient="records")}
+        if plan and args.get("explain"):
+            plan["actual"]["limited"] = int(len(out))
+            result["explain"] = explain_plan(plan, args)
 
         # Optional: emit Python code
         if args.get("include_code"):
@@ -423,6 +852,84 @@ def tool_stakeholder_suggest(args: Dict[str, Any]) -> Dict[str, Any]:
 
 
 
+def _event_index() -> Optional[Dict[str, Any]]:
+    index = DERIVED.get("event_index")
+    if index is None and "events" in dfs and {"user_id", "event_type", "timestamp"} <= set(dfs["events"].columns):
+        ts = DERIVED.get("timestamps", {}).get("events", {}).get("timestamp")
+        if ts is None:
+            ts = pd.to_datetime(dfs["events"]["timestamp"], errors="coerce", utc=True)
+        index = DERIVED["event_index"] = build_event_index(dfs["events"], ts)
+    return index
+
+
+def tool_funnel_analysis(args: Dict[str, Any]) -> Dict[str, Any]:
+    index = _event_index()
+    if index is None:
+        return {"error": "events table with user_id, event_type and timestamp is required"}
+    steps = [str(s) for s in (args.get("steps") or DEFAULT_FUNNEL_STEPS)]
+    try:
+        # 0 is a valid window (later steps at the entry timestamp), so only a missing value takes the default
+        window_hours = args.get("window_hours")
+        window_hours = float(DEFAULT_WINDOW_HOURS if window_hours is None else window_hours)
+        max_groups = max(1, min(int(args.get("max_groups") or MAX_BREAKDOWN_GROUPS), 50))
+        return compute_funnel(
+            index,
+            steps,
+            window_hours=window_hours,
+            since=args.get("since"),
+            until=args.get("until"),
+            breakdown=args.get("breakdown"),
+            users=dfs.get("users"),
+            max_groups=max_groups,
+        )
+    except (TypeError, ValueError) as e:
+        return {"error": f"funnel error: {e}"}
+
+
+def _cohorts() -> Dict[str, Any]:
+    cohorts = DERIVED.get("cohorts")
+    if cohorts is None:
+        cohorts = DERIVED["cohorts"] = build_cohorts(dfs)
+    return cohorts
+
+
+def tool_cohort_analysis(args: Dict[str, Any]) -> Dict[str, Any]:
+    metric = (args.get("metric") or "retention").lower()
+    granularity = (args.get("granularity") or "week").lower()
+    if granularity not in COHORT_GRANULARITIES:
+        return {"error": f"granularity must be one of {', '.join(COHORT_GRANULARITIES)}"}
+    matrix = _cohorts().get(granularity)
+    if matrix is None:
+        return {"error": "users table with id and signup_date is required"}
+    try:
+        max_periods = max(1, min(int(args.get("max_periods") or DEFAULT_MAX_PERIODS), 52))
+        res = matrix.query(metric, since=args.get("since"), until=args.get("until"), max_periods=max_periods, per_user=bool(args.get("per_user")))
+    except (TypeError, ValueError) as e:
+        return {"error": f"cohort error: {e}"}
+    meta = {"metric": metric, "granularity": granularity, "per_user": bool(args.get("per_user"))}
+    if (args.get("format") or "rows").lower() == "heatmap":
+        return {"chartjs": heatmap_spec(res, metric), "meta": meta}
+    columns = ["cohort", "cohort_size"] + [f"p{p}" for p in res["periods"]]
+    rows = [
+        {"cohort": c, "cohort_size": n, **{f"p{p}": v for p, v in zip(res["periods"], vals)}}
+        for c, n, vals in zip(res["cohorts"], res["sizes"], res["matrix"])
+    ]
+    return {"columns": columns, "rows": rows, "meta": meta}
+
+
+def _user_aggregate(name: str, table: str, value_col: str) -> pd.DataFrame:
+    """Per-user sum of `value_col` joined to user names, from derived state when available."""
+    agg = DERIVED.get("aggregates", {}).get(name)
+    if agg is not None:
+        return agg
+    grp = group_aggregate(dfs[table], ["user_id"], {value_col: (value_col, "sum")}, {"user_id": dfs[table]})
+    grp = grp.reset_index().sort_values(value_col, ascending=False)
+    if "users" in dfs:
+        keep = [c for c in ("id", "name", "email") if c in dfs["users"].columns]
+        grp = grp.merge(dfs["users"][keep], left_on="user_id", right_on="id", how="left")
+    return grp
+
+
 def tool_business_insight(args: Dict[str, Any]) -> Dict[str, Any]:
     """Summarize an analysis result into a concise narrative and optional direct answer.
 
@@ -514,11 +1021,7 @@ def tool_business_insight(args: Dict[str, Any]) -> Dict[str, Any]:
 
         if question and ("purchase" in question or "revenue" in question or "amount" in question or "buyer" in question or (wants_top and "users" in question)):
             if "purchases" in dfs and not dfs["purchases"].empty:
-                p = dfs["purchases"].copy()
-                grp = p.groupby("user_id")["total_amount"].sum().reset_index().sort_values("total_amount", ascending=False)
-                if "users" in dfs:
-                    keep = [c for c in ("id", "name", "email") if c in dfs["users"].columns]
-                    grp = grp.merge(dfs["users"][keep], left_on="user_id", right_on="id", how="left").drop(columns=[c for c in ("id",) if c in grp.columns])
+                grp = _user_aggregate("revenue_by_user", "purchases", "total_amount")
                 # Determine how many rows to show: explicit 'top N' overrides; if asking 'who' without N, return 1; else default 5
                 top_n = requested_n if requested_n is not None else (1 if asks_who and not wants_top else 5)
                 top_rows = grp.head(top_n)
@@ -540,10 +1043,7 @@ def tool_business_insight(args: Dict[str, Any]) -> Dict[str, Any]:
                 if metric is None:
                     insight_text = "Events data available, but no clicks column found."
                 else:
-                    grp = e.groupby("user_id")[metric].sum().reset_index().sort_values(metric, ascending=False)
-                    if "users" in dfs:
-                        keep = [c for c in ("id", "name", "email") if c in dfs["users"].columns]
-                        grp = grp.merge(dfs["users"][keep], left_on="user_id", right_on="id", how="left").drop(columns=[c for c in ("id",) if c in grp.columns])
+                    grp = _user_aggregate("clicks_by_user", "events", metric)
                     top_n = requested_n if requested_n is not None else (1 if asks_who and not wants_top else 5)
                     top_rows = grp.head(top_n)
                     table_cols = list(top_rows.columns)
@@ -585,6 +1085,9 @@ def tool_business_insight(args: Dict[str, Any]) -> Dict[str, Any]:
 TOOLS_IMPL: Dict[str, Any] = {
     "chartjs_data": tool_chartjs_data,
     "sql_tutor": tool_sql_tutor,
+    "sql_profile": tool_sql_profile,
+    "funnel_analysis": tool_funnel_analysis,
+    "cohort_analysis": tool_cohort_analysis,
     "stakeholder_suggest": tool_stakeholder_suggest,
     "business_insight": tool_business_insight,
 }
@@ -598,41 +1101,35 @@ def build_data_context(max_rows_per_table: int = 25, top_k: int = 10) -> Dict[st
         ctx["samples"] = {tbl: df.head(max_rows_per_table).to_dict(orient="records") for tbl, df in dfs.items()}
         # Helpful aggregates commonly requested
         if "purchases" in dfs and not dfs["purchases"].empty:
-            p = dfs["purchases"][[c for c in ["user_id", "total_amount"] if c in dfs["purchases"].columns]].copy()
-            if not p.empty and "total_amount" in p.columns:
-                top_buyers = p.groupby("user_id")["total_amount"].sum().reset_index().sort_values("total_amount", ascending=False)
-                if "users" in dfs:
-                    keep = [c for c in ("id", "name", "email") if c in dfs["users"].columns]
-                    top_buyers = top_buyers.merge(dfs["users"][keep], left_on="user_id", right_on="id", how="left").drop(columns=[c for c in ("id",) if c in top_buyers.columns])
+            if "total_amount" in dfs["purchases"].columns:
+                top_buyers = _user_aggregate("revenue_by_user", "purchases", "total_amount")
                 ctx["top_buyers_by_revenue"] = top_buyers.head(top_k).to_dict(orient="records")
         if "events" in dfs and not dfs["events"].empty and "clicks" in dfs["events"].columns:
-            e = dfs["events"][[c for c in ["user_id", "clicks"] if c in dfs["events"].columns]].copy()
-            top_clicks = e.groupby("user_id")["clicks"].sum().reset_index().sort_values("clicks", ascending=False)
-            if "users" in dfs:
-                keep = [c for c in ("id", "name", "email") if c in dfs["users"].columns]
-                top_clicks = top_clicks.merge(dfs["users"][keep], left_on="user_id", right_on="id", how="left").drop(columns=[c for c in ("id",) if c in top_clicks.columns])
+            top_clicks = _user_aggregate("clicks_by_user", "events", "clicks")
             ctx["top_users_by_clicks"] = top_clicks.head(top_k).to_dict(orient="records")
     except Exception as e:
         ctx["error"] = f"context build error: {e}"
     return ctx
 
-def as_sse(text_chunks: Generator[str, None, None]) -> Generator[str, None, None]:
-    """Wrap plain text chunks as Server-Sent Events (SSE)."""
-    for chunk in text_chunks:
-        if chunk is None:
-            continue
-        lines = str(chunk).splitlines() or [""]
-        for line in lines:
-            yield f"data: {line}\n"
-        yield "\n"
+def _wait_for_slot(ticket: Ticket) -> Generator[bytes, None, None]:
+    """Block until `ticket` is granted, emitting a queue frame whenever its position changes."""
+    last_pos: Optional[int] = None
+    while not ticket.granted.is_set():
+        pos = ticket.position()
+        if pos and pos != last_pos:
+            last_pos = pos
+            yield frame("queue", stage=ticket.limiter.name, position=pos)
+        ticket.wait(QUEUE_POLL_SEC)
 
 
-def _agent_loop_stream(messages: List[Dict[str, str]], session_id: str = "default") -> Generator[str, None, None]:
+def _agent_loop_stream(messages: List[Dict[str, str]], session_id: str = "default", model_ticket: Optional[Ticket] = None) -> Generator[bytes, None, None]:
     try:
-        from openai import OpenAI
-        client = OpenAI(api_key=OPENAI_API_KEY)
+        client = None
+        if _llm_cache().mode != "replay":
+            from openai import OpenAI
+            client = OpenAI(api_key=OPENAI_API_KEY)
     except Exception as e:
-        yield json.dumps({"type": "final", "text": f"OpenAI init error: {e}"})
+        yield frame("final", text=f"OpenAI init error: {e}")
         return
 
     system_prompt = (
@@ -640,6 +1137,10 @@ def _agent_loop_stream(messages: List[Dict[str, str]], session_id: str = "defaul
 - business_insight: Prefer calling this directly with {question} to compute a quick summary and direct answer from in-memory data (users/events/purchases).
 - chartjs_data: Only when the user explicitly asks for a chart/graph/visualization; returns Chart.js-ready spec.
 - sql_tutor: Only if the user asks how to write SQL.
+- sql_profile: When the user wants to run a SQL query or see how expensive it is.
+- funnel_analysis: For conversion/drop-off questions across event steps (page_view -> purchase), optionally by page or user attribute.
+- cohort_analysis: For retention or revenue of users grouped by signup week/month.
+- The sessions table (session_id, user_id, started_at, ended_at, duration_sec, event_count, page_path_length, entry_page, exit_page, converted) groups each user's events by inactivity gap; use it with chartjs_data or sql_profile for sessions per user, pages per session or drop-off (exit) page.
 - stakeholder_suggest: Optionally after you've answered, if follow-ups make sense.
 Do not use or request 'run_analysis_plan'. Keep answers short and final after one or two tool calls.
 """
@@ -653,8 +1154,14 @@ Do not use or request 'run_analysis_plan'. Keep answers short and final after on
 
     max_steps = 10
     for _ in range(max_steps):
+        # The first step reuses the ticket taken at admission; later steps are in-flight work and always queue
+        ticket = model_ticket or MODEL_LIMITER.enqueue(session_id, force=True)
+        model_ticket = None
         try:
-            completion = client.chat.completions.create(
+            yield from _wait_for_slot(ticket)
+            msg = cached_chat_completion(
+                _llm_cache(),
+                client,
                 model=OPENAI_MODEL,
                 messages=chat_history,
                 tools=OPENAI_TOOLS,
@@ -662,11 +1169,11 @@ Do not use or request 'run_analysis_plan'. Keep answers short and final after on
                 temperature=0.1,
             )
         except Exception as e:
-            yield json.dumps({"type": "final", "text": f"Model error: {e}"})
+            yield frame("final", text=f"Model error: {e}")
             return
+        finally:
+            ticket.release()
 
-        choice = completion.choices[0]
-        msg = choice.message
         tool_calls = msg.tool_calls or []
 
         if tool_calls:
@@ -692,16 +1199,11 @@ Do not use or request 'run_analysis_plan'. Keep answers short and final after on
                     args = json.loads(tc.function.arguments or "{}")
                 except Exception:
                     args = {}
-                yield json.dumps({"type": "tool_call", "name": name, "args": args})
+                yield frame("tool_call", name=name, args=args)
                 
                 stabilized_args = _stabilize_tool_args(name, args)
                 if stabilized_args != args:
-                    yield json.dumps({
-                        "type": "query_update",
-                        "tool": name,
-                        "original_args": args,
-                        "updated_args": stabilized_args,
-                    })
+                    yield frame("query_update", tool=name, original_args=args, updated_args=stabilized_args)
                 if name == "chartjs_data":
                     last_user_msg = next((m.get("content", "") for m in reversed(messages) if m.get("role") == "user"), "").lower()
                     viz_markers = ["chart", "graph", "plot", "visual", "visualize", "visualise", "bar chart", "line chart", "trend", "timeseries", "show a chart", "draw"]
@@ -711,12 +1213,13 @@ Do not use or request 'run_analysis_plan'. Keep answers short and final after on
                             "skipped": True,
                             "reason": "Charts are generated on request. Say 'show a chart' or specify a chart type to visualize this.",
                         }
-                        yield json.dumps({"type": "tool_result", "name": name, "result": tool_result})
+                        encoded = Encoded(tool_result)
+                        yield frame("tool_result", name=name, result=encoded)
                         # Must still append a tool message for this tool_call_id to satisfy API contract
                         chat_history.append({
                             "role": "tool",
                             "tool_call_id": tc.id,
-                            "content": json.dumps(tool_result),
+                            "content": encoded.text,
                         })
                         continue
                 # Track for simple de-duplication
@@ -730,16 +1233,25 @@ Do not use or request 'run_analysis_plan'. Keep answers short and final after on
                 if not impl:
                     tool_result = {"error": f"Unknown tool {name}"}
                 else:
+                    ticket = TOOL_LIMITER.enqueue(session_id, force=True)
                     try:
+                        yield from _wait_for_slot(ticket)
                         tool_result = impl(stabilized_args)
                     except Exception as e:
                         tool_result = {"error": str(e)}
-                yield json.dumps({"type": "tool_result", "name": name, "result": tool_result})
-                
+                    finally:
+                        ticket.release()
+                # Serialized once: the same bytes go to the client frame and the model history
+                encoded = Encoded(tool_result)
+                # The client gets the first page of a large row set and pages the rest from GET /results/<id>;
+                # the model history keeps every row
+                client_result = RESULT_STORE.truncate(tool_result)
+                yield frame("tool_result", name=name, result=encoded if client_result is tool_result else Encoded(client_result))
+
                 if name == "lookup_users" and isinstance(tool_result, dict):
                     rows = tool_result.get("rows")
                     if isinstance(rows, list):
-                        remember_users(MEMORY_PATH, session_id, rows)
+                        remember_users(MEMORY_DIR, session_id, rows)
 
                 # Update loop guard state
                 last_tool_name = name
@@ -747,32 +1259,30 @@ Do not use or request 'run_analysis_plan'. Keep answers short and final after on
                 chat_history.append({
                     "role": "tool",
                     "tool_call_id": tc.id,
-                    "content": json.dumps(tool_result),
+                    "content": encoded.text,
                 })
 
                 # Immediately finalize after returning a chart spec to avoid extra streaming
                 if name == "chartjs_data":
-                    try:
-                        chart_spec = tool_result.get("chartjs") if isinstance(tool_result, dict) else None
-                    except Exception:
-                        chart_spec = None
-                    final_payload: Dict[str, Any] = {"type": "final", "text": "Chart ready."}
+                    # Reuse the spec bytes already encoded for the tool_result frame
+                    chart_spec = encoded.parts.get("chartjs")
                     if chart_spec is not None:
-                        final_payload["chartjs"] = chart_spec
-                    yield json.dumps(final_payload)
+                        yield frame("final", text="Chart ready.", chartjs=chart_spec)
+                    else:
+                        yield frame("final", text="Chart ready.")
                     return
             
             continue
 
         
         final_text = msg.content or ""
-        yield json.dumps({"type": "final", "text": final_text})
+        yield frame("final", text=final_text)
         return
 
-    yield json.dumps({"type": "final", "text": "Max steps reached. Refine your question."})
+    yield frame("final", text="Max steps reached. Refine your question.")
 
 
-def _agent_loop(messages: List[Dict[str, str]], session_id: str = "default") -> Generator[str, None, None]:
+def _agent_loop(messages: List[Dict[str, str]], session_id: str = "default") -> Generator[bytes, None, None]:
     """Alias for compatibility with references to `_agent_loop`.
 
     Delegates to `_agent_loop_stream` to preserve existing behavior.
@@ -787,30 +1297,94 @@ def agent_chat() -> Response:
     session_id = data.get("session_id", "default")
     if not isinstance(messages, list) or not messages:
         return jsonify({"error": "messages is required"}), 400
+    # Per-request profiling is admin-only: stacks reveal server internals
+    profile = bool(data.get("profile"))
+    if profile and not is_admin(request):
+        return jsonify({"error": "profile requires an admin token"}), 403
 
-    def stream_json_events() -> Generator[str, None, None]:
-        for frame in _agent_loop_stream(messages, session_id=session_id):
-            yield frame
-
-    return Response(stream_with_context(as_sse(stream_json_events())), mimetype="text/event-stream")
+    try:
+        model_ticket = MODEL_LIMITER.enqueue(session_id)
+    except QueueFullError as e:
+        resp = jsonify({"error": "Server is busy, please retry shortly.", "retry_after": e.retry_after})
+        resp.status_code = 429
+        resp.headers["Retry-After"] = str(e.retry_after)
+        return resp
+
+    def stream_json_events() -> Generator[bytes, None, None]:
+        # Only the thread serving this stream is sampled, so the profile covers just this request
+        prof = SamplingProfiler(thread_ids=[threading.get_ident()]).start() if profile else None
+        try:
+            for chunk in _agent_loop_stream(messages, session_id=session_id, model_ticket=model_ticket):
+                yield chunk
+            if prof is not None:
+                prof.stop()
+                yield frame("profile", **prof.summary(), collapsed=prof.collapsed())
+        finally:
+            if prof is not None:
+                prof.stop()
+            model_ticket.release()
+
+    resp = Response(stream_with_context(sse_frames(stream_json_events())), mimetype="text/event-stream")
+    # Covers clients that disconnect before the stream starts; release is idempotent
+    resp.call_on_close(model_ticket.release)
+    return resp
+
+
+@app.post("/data/append")
+def data_append() -> Response:
+    # Appends change state every session reads (tables, cohorts, sessions, partitions)
+    if not is_admin(request):
+        return jsonify({"error": "forbidden"}), 403
+    data = request.get_json(silent=True) or {}
+    table = data.get("table")
+    rows = data.get("rows")
+    if table not in dfs or table in DERIVED_TABLES:
+        return jsonify({"error": f"Unknown table: {table}"}), 400
+    if not isinstance(rows, list) or not rows or not all(isinstance(r, dict) for r in rows):
+        return jsonify({"error": "rows must be a non-empty list of objects"}), 400
+    try:
+        appended = append_rows(table, rows)
+    except (ValueError, TypeError) as e:
+        return jsonify({"error": f"invalid rows: {e}"}), 400
+    return jsonify({"table": table, "appended": appended, "rows": len(dfs[table])})
 
 
 @app.get("/health")
 def health() -> Response:
     return jsonify({
         "status": "ok",
-        "users": len(dfs["users"]),
-        "events": len(dfs["events"]),
+        "ready": DATA_READY.is_set(),
+        "users": len(dfs["users"]) if "users" in dfs else None,
+        "events": len(dfs["events"]) if "events" in dfs else None,
         "gpt_enabled": bool(OPENAI_API_KEY),
+        "llm_cache": _llm_cache().stats(),
+        "partitions": {t: p.stats() for t, p in PARTITIONS.items()},
+        **({"sessions": DERIVED["sessions"].stats()} if DERIVED.get("sessions") is not None else {}),
+        "aggregation": aggregation_stats(),
     })
 
 
 
+@app.get("/metrics")
+def metrics() -> Response:
+    return Response(render_prometheus([MODEL_LIMITER, TOOL_LIMITER]), mimetype="text/plain; version=0.0.4")
+
+
+@app.get("/ready")
+def ready() -> Response:
+    if DATA_READY.is_set():
+        return jsonify({"ready": True, "startup": STARTUP_REPORT})
+    status = 500 if "error" in STARTUP_REPORT else 503
+    return jsonify({"ready": False, "startup": STARTUP_REPORT}), status
+
+
 def create_app() -> Flask:
+    start()
     return app
 
 
 if __name__ == "__main__":
+    start()
     port = int(os.getenv("PORT", "5001"))
     app.run(host="0.0.0.0", port=port, debug=True)
 
@@ -0,0 +1,203 @@
+import os
+import threading
+from typing import Any, Dict, Optional
+
+import numpy as np
+import pandas as pd
+
+
+# A user's events more than this far apart fall in different sessions
+SESSION_GAP_MINUTES = float(os.getenv("SESSION_GAP_MINUTES", "30"))
+# Event type that marks a session as converted
+SESSION_CONVERSION_EVENT = os.getenv("SESSION_CONVERSION_EVENT", "purchase")
+SESSION_COLUMNS = [
+    "session_id", "user_id", "started_at", "ended_at", "duration_sec",
+    "event_count", "page_path_length", "entry_page", "exit_page", "converted",
+]
+
+
+def _ts_ns(ts: pd.Series) -> np.ndarray:
+    # NaT becomes int64 min, which every cutoff comparison excludes
+    return ts.to_numpy(dtype="datetime64[ns]").view("int64")
+
+
+def _sessions_from_sorted(
+    user_codes: np.ndarray,
+    users: np.ndarray,
+    ts_ns: np.ndarray,
+    page_codes: Optional[np.ndarray],
+    page_labels: Optional[np.ndarray],
+    is_conversion: Optional[np.ndarray],
+    gap_sec: float,
+    first_id: int,
+) -> pd.DataFrame:
+    """Session rows from events already sorted by (user, time): a new session starts
+    at each new user or after an inactivity gap longer than `gap_sec`."""
+    n = len(ts_ns)
+    if n == 0:
+        return _empty_sessions()
+    starts_mask = np.ones(n, dtype=bool)
+    starts_mask[1:] = (user_codes[1:] != user_codes[:-1]) | (np.diff(ts_ns) > int(gap_sec * 1e9))
+    starts = np.flatnonzero(starts_mask)
+    ends = np.append(starts[1:] - 1, n - 1)
+
+    if page_codes is not None:
+        # Page path length counts page changes, so repeated hits on one page count once
+        changed = starts_mask.copy()
+        changed[1:] |= page_codes[1:] != page_codes[:-1]
+        path_length = np.add.reduceat(changed.astype(np.int64), starts)
+        entry_page, exit_page = page_labels[page_codes[starts]], page_labels[page_codes[ends]]
+    else:
+        path_length = ends - starts + 1
+        entry_page = exit_page = np.full(len(starts), None, dtype=object)
+    if is_conversion is not None:
+        converted = np.logical_or.reduceat(is_conversion, starts)
+    else:
+        converted = np.zeros(len(starts), dtype=bool)
+
+    started, ended = ts_ns[starts], ts_ns[ends]
+    return pd.DataFrame({
+        "session_id": np.arange(first_id, first_id + len(starts), dtype=np.int64),
+        "user_id": users[user_codes[starts]],
+        "started_at": pd.to_datetime(started, utc=True),
+        "ended_at": pd.to_datetime(ended, utc=True),
+        "duration_sec": (ended - started) / 1e9,
+        "event_count": (ends - starts + 1).astype(np.int64),
+        "page_path_length": path_length.astype(np.int64),
+        "entry_page": entry_page,
+        "exit_page": exit_page,
+        "converted": converted,
+    })
+
+
+def sessionize(events: pd.DataFrame, ts: pd.Series, gap_sec: float, conversion_event: str, first_id: int = 0) -> pd.DataFrame:
+    """Group events into sessions: one row per session with its start/end, event count,
+    page path length, entry and exit page and whether it contains `conversion_event`.
+    Events without a user or timestamp are skipped.
+    """
+    keep = ~pd.isna(ts).to_numpy() & events["user_id"].notna().to_numpy()
+    user_codes, users = pd.factorize(events["user_id"].to_numpy()[keep])
+    ts_ns = _ts_ns(ts)[keep]
+    order = np.lexsort((ts_ns, user_codes))
+    page_codes = page_labels = is_conversion = None
+    if "page" in events.columns:
+        page_codes, pages = pd.factorize(events["page"].to_numpy()[keep], use_na_sentinel=False)
+        page_codes, page_labels = page_codes[order], np.asarray(pages, dtype=object)
+    if "event_type" in events.columns:
+        is_conversion = (events["event_type"].to_numpy()[keep] == conversion_event)[order]
+    return _sessions_from_sorted(
+        user_codes[order], np.asarray(users, dtype=object), ts_ns[order], page_codes, page_labels, is_conversion, gap_sec, first_id
+    )
+
+
+def sessionize_index(index: Dict[str, Any], gap_sec: float, conversion_event: str) -> pd.DataFrame:
+    """`sessionize` over the funnel event index, which is already (user, time)-sorted."""
+    page_codes = page_labels = None
+    if "page_codes" in index:
+        # The index codes missing pages as -1; give them a trailing None label
+        page_codes = np.where(index["page_codes"] < 0, len(index["pages"]), index["page_codes"])
+        page_labels = np.asarray(index["pages"] + [None], dtype=object)
+    if conversion_event in index["event_types"]:
+        is_conversion = index["type_codes"] == index["event_types"].index(conversion_event)
+    else:
+        # Missing event types are coded -1 too, so an absent event must not be compared by code
+        is_conversion = np.zeros(len(index["ts"]), dtype=bool)
+    return _sessions_from_sorted(
+        index["user_codes"], index["users"], index["ts"], page_codes, page_labels, is_conversion, gap_sec, 0
+    )
+
+
+def _empty_sessions() -> pd.DataFrame:
+    out = pd.DataFrame({c: pd.Series(dtype=object) for c in SESSION_COLUMNS})
+    return out.astype({
+        "session_id": "int64", "started_at": "datetime64[ns, UTC]", "ended_at": "datetime64[ns, UTC]",
+        "duration_sec": "float64", "event_count": "int64", "page_path_length": "int64", "converted": "bool",
+    })
+
+
+class Sessionizer:
+    """The sessions table derived from events, kept current as events are appended.
+
+    Appends only re-sessionize the affected users from the earliest session
+    the new events can touch (the first one ending within the gap of the
+    earliest new event); older sessions keep their rows and ids.
+    """
+
+    def __init__(self, gap_minutes: float = SESSION_GAP_MINUTES, conversion_event: str = SESSION_CONVERSION_EVENT):
+        self.gap_sec = float(gap_minutes) * 60
+        self.conversion_event = conversion_event
+        self.table = _empty_sessions()
+        self._next_id = 0
+        self._lock = threading.Lock()
+        self.rebuilt_sessions = 0
+
+    @classmethod
+    def build(cls, events: pd.DataFrame, ts: pd.Series, index: Optional[Dict[str, Any]] = None, **kwargs: Any) -> "Sessionizer":
+        """Sessionize all events, reusing the sorted funnel event index when one is at hand."""
+        sessions = cls(**kwargs)
+        if index is not None:
+            sessions.table = sessionize_index(index, sessions.gap_sec, sessions.conversion_event)
+        else:
+            sessions.table = sessionize(events, ts, sessions.gap_sec, sessions.conversion_event)
+        sessions._next_id = len(sessions.table)
+        return sessions
+
+    def update(self, events: pd.DataFrame, ts: pd.Series, new_rows: pd.DataFrame, new_ts: pd.Series) -> None:
+        """Fold appended events in; `events`/`ts` are the full table including `new_rows`."""
+        valid = new_rows["user_id"].notna() & new_ts.notna() if "user_id" in new_rows.columns else None
+        if valid is None or not valid.any():
+            return
+        with self._lock:
+            gap_ns = int(self.gap_sec * 1e9)
+            earliest = pd.Series(_ts_ns(new_ts[valid]), index=new_rows.loc[valid, "user_id"].to_numpy()).groupby(level=0).min()
+
+            # Per affected user, re-sessionize from the first session that ends within the gap of the earliest new event
+            table = self.table
+            affected = table["user_id"].isin(earliest.index).to_numpy()
+            old = table[affected]
+            old_start, old_end = _ts_ns(old["started_at"]), _ts_ns(old["ended_at"])
+            user_earliest = old["user_id"].map(earliest).to_numpy(dtype=np.int64)
+            touched = old_end >= user_earliest - gap_ns
+            cutoff = earliest.copy()
+            if touched.any():
+                first_touched = pd.Series(old_start[touched], index=old["user_id"].to_numpy()[touched]).groupby(level=0).min()
+                cutoff.loc[first_touched.index] = np.minimum(cutoff.loc[first_touched.index], first_touched)
+
+            # Candidate events: a cheap time bound first, then the per-user cutoff on the survivors
+            all_ns = _ts_ns(ts)
+            candidates = np.flatnonzero(all_ns >= cutoff.min())
+            candidates = candidates[events["user_id"].iloc[candidates].isin(cutoff.index).to_numpy()]
+            sub = events.iloc[candidates]
+            pick = all_ns[candidates] >= sub["user_id"].map(cutoff).to_numpy(dtype=np.int64)
+            fresh = sessionize(sub[pick], ts.iloc[candidates][pick], self.gap_sec, self.conversion_event, self._next_id)
+
+            drop = np.zeros(len(table), dtype=bool)
+            drop[np.flatnonzero(affected)[old_start >= old["user_id"].map(cutoff).to_numpy(dtype=np.int64)]] = True
+            self.table = pd.concat([table[~drop], fresh], ignore_index=True)
+            self._next_id += len(fresh)
+            self.rebuilt_sessions += len(fresh)
+
+    def __getstate__(self) -> Dict[str, Any]:
+        # Pickled into the data snapshot; locks don't pickle
+        state = dict(self.__dict__)
+        state.pop("_lock", None)
+        return state
+
+    def __setstate__(self, state: Dict[str, Any]) -> None:
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "sessions": int(len(self.table)),
+            "gap_minutes": self.gap_sec / 60,
+            "conversion_event": self.conversion_event,
+            "rebuilt_on_append": self.rebuilt_sessions,
+        }
+
+
+def build_sessions(dfs: Dict[str, pd.DataFrame], ts: Optional[pd.Series], index: Optional[Dict[str, Any]] = None) -> Optional[Sessionizer]:
+    e = dfs.get("events")
+    if e is None or ts is None or "user_id" not in e.columns:
+        return None
+    return Sessionizer.build(e, ts, index)
@@ -0,0 +1,45 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+# The server modules import each other as top-level modules
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Read at import time by the server modules, so set before any test module imports them
+ADMIN_TOKEN = "test-admin-token"
+os.environ.update({
+    "ADMIN_TOKEN": ADMIN_TOKEN,
+    "DATA_LOAD_ASYNC": "0",
+    "OPENAI_API_KEY": "",
+    # Replay never builds an OpenAI client; tests stub the completion call instead
+    "LLM_CACHE_MODE": "replay",
+    "LLM_CACHE_DIR": tempfile.mkdtemp(prefix="llm_cache_"),
+})
+
+
+@pytest.fixture(scope="session")
+def server(tmp_path_factory):
+    # Keep memory shards, the snapshot and partitions out of the source tree; the
+    # committed JSON sources under data/ are only read
+    state_dir = tmp_path_factory.mktemp("server_state")
+    os.environ.update({
+        "MEMORY_DIR": str(state_dir / "memory"),
+        "DATA_SNAPSHOT_PATH": str(state_dir / "snapshot.pkl"),
+        "PARTITION_DIR": str(state_dir / "partitions"),
+    })
+    import server as server_module
+
+    server_module.create_app()
+    return server_module
+
+
+@pytest.fixture
+def client(server):
+    return server.app.test_client()
+
+
+@pytest.fixture
+def admin_headers():
+    return {"X-Admin-Token": ADMIN_TOKEN}
@@ -0,0 +1,115 @@
+import threading
+
+import pytest
+
+from admission_utils import QUEUE_RETRY_AFTER_SEC, WAIT_BUCKETS, FairLimiter, QueueFullError, render_prometheus
+
+
+def test_grants_immediately_under_the_limit():
+    lim = FairLimiter("t", limit=2, max_queue=4)
+    a, b = lim.enqueue("s1"), lim.enqueue("s1")
+    assert a.granted.is_set() and b.granted.is_set()
+    assert a.position() == 0
+    assert lim.stats()["active"] == 2
+
+
+def test_full_queue_rejects_with_retry_after():
+    lim = FairLimiter("t", limit=1, max_queue=1)
+    lim.enqueue("s1")
+    lim.enqueue("s1")
+    with pytest.raises(QueueFullError) as exc:
+        lim.enqueue("s2")
+    assert exc.value.retry_after == QUEUE_RETRY_AFTER_SEC
+    assert exc.value.limiter == "t"
+    assert lim.stats()["rejected_total"] == 1
+    # In-flight work is never rejected
+    assert not lim.enqueue("s2", force=True).granted.is_set()
+    assert lim.stats()["queued"] == 2
+
+
+def test_round_robin_across_sessions():
+    lim = FairLimiter("t", limit=1, max_queue=10)
+    held = lim.enqueue("busy")
+    a1, a2, a3 = (lim.enqueue("a") for _ in range(3))
+    b1 = lim.enqueue("b")
+    assert [t.position() for t in (a1, b1, a2, a3)] == [1, 2, 3, 4]
+
+    order = []
+    current = held
+    for _ in range(4):
+        current.release()
+        current = next(t for t in (a1, a2, a3, b1) if t.granted.is_set() and not t.done)
+        order.append(current)
+    # The chatty session does not get a second slot before the other session's first
+    assert order == [a1, b1, a2, a3]
+    current.release()
+    assert lim.stats()["active"] == 0 and lim.stats()["queued"] == 0
+
+
+def test_release_withdraws_a_waiting_ticket_and_is_idempotent():
+    lim = FairLimiter("t", limit=1, max_queue=10)
+    held = lim.enqueue("s1")
+    waiting = lim.enqueue("s2")
+    later = lim.enqueue("s3")
+    waiting.release()
+    waiting.release()
+    assert lim.stats()["queued"] == 1
+    assert later.position() == 1
+    held.release()
+    held.release()
+    assert later.granted.is_set()
+    assert lim.stats()["active"] == 1
+
+
+def test_waiter_unblocks_when_slot_frees():
+    lim = FairLimiter("t", limit=1, max_queue=10)
+    held = lim.enqueue("s1")
+    waiting = lim.enqueue("s2")
+    threading.Timer(0.05, held.release).start()
+    assert waiting.wait(5)
+    stats = lim.stats()
+    assert stats["admitted_total"] == 2 and stats["wait_seconds_max"] > 0
+
+
+def test_prometheus_exposition():
+    lim = FairLimiter("model", limit=1, max_queue=0)
+    lim.enqueue("s1")
+    with pytest.raises(QueueFullError):
+        lim.enqueue("s2")
+    text = render_prometheus([lim])
+    assert 'admission_active{limiter="model"} 1' in text
+    assert 'admission_rejected_total{limiter="model"} 1' in text
+    assert 'admission_wait_seconds_bucket{limiter="model",le="+Inf"} 1' in text
+    assert text.count("admission_wait_seconds_bucket") == len(WAIT_BUCKETS) + 1
+
+
+
+def test_prometheus_families_are_contiguous():
+    text = render_prometheus([FairLimiter("model", limit=1, max_queue=1), FairLimiter("tool", limit=2, max_queue=1)])
+    current, seen = None, []
+    for line in text.splitlines():
+        if line.startswith("# TYPE "):
+            current = line.split()[2]
+            seen.append(current)
+        elif not line.startswith("#"):
+            name = line.split("{", 1)[0]
+            # Histogram samples carry _bucket/_sum/_count suffixes on the family name
+            assert name == current or (name.rsplit("_", 1)[0] == current and name.rsplit("_", 1)[1] in ("bucket", "sum", "count")), line
+    assert len(seen) == len(set(seen)) == 5
+    assert text.count("# HELP ") == 5
+    assert text.count('admission_active{limiter="tool"} 0') == 1
+
+
+def test_chat_returns_429_with_retry_after_when_queue_is_full(server, client, monkeypatch):
+    lim = FairLimiter("model", limit=1, max_queue=0)
+    monkeypatch.setattr(server, "MODEL_LIMITER", lim)
+    held = lim.enqueue("other")
+    try:
+        resp = client.post("/agent-chat", json={"messages": [{"role": "user", "content": "hi"}], "session_id": "s1"})
+        assert resp.status_code == 429
+        assert resp.headers["Retry-After"] == str(QUEUE_RETRY_AFTER_SEC)
+        assert resp.get_json()["retry_after"] == QUEUE_RETRY_AFTER_SEC
+    finally:
+        held.release()
+    metrics = client.get("/metrics").get_data(as_text=True)
+    assert 'admission_rejected_total{limiter="model"} 1' in metrics
@@ -0,0 +1,106 @@
+import os
+from types import SimpleNamespace
+
+import pytest
+
+from cache_utils import CompletionCache, cached_chat_completion, conversation_key
+
+
+class FakeClient:
+    """Stands in for the OpenAI client; answers with a fixed message and counts calls."""
+
+    def __init__(self, content: str = "hello"):
+        self.calls = 0
+        self.content = content
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create))
+
+    def _create(self, **kwargs):
+        self.calls += 1
+        msg = SimpleNamespace(content=f"{self.content} {self.calls}", tool_calls=None)
+        return SimpleNamespace(choices=[SimpleNamespace(message=msg)])
+
+
+MESSAGES = [{"role": "system", "content": "be brief"}, {"role": "user", "content": "hi"}]
+
+
+def test_conversation_key_chains_over_messages():
+    key = conversation_key("m", None, MESSAGES)
+    assert key == conversation_key("m", None, [dict(m) for m in MESSAGES])
+    assert key != conversation_key("m", None, MESSAGES[:1])
+    assert key != conversation_key("m", None, MESSAGES + [{"role": "user", "content": "more"}])
+    assert key != conversation_key("other", None, MESSAGES)
+    assert key != conversation_key("m", None, MESSAGES, temperature=0.5)
+    assert key != conversation_key("m", None, MESSAGES, extra={"tool_choice": "auto"})
+
+
+def test_readwrite_serves_hits(tmp_path):
+    cache = CompletionCache(str(tmp_path))
+    client = FakeClient()
+    first = cached_chat_completion(cache, client, "m", MESSAGES, None)
+    second = cached_chat_completion(cache, client, "m", MESSAGES, None)
+    assert client.calls == 1
+    assert first.content == second.content == "hello 1"
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 1
+
+
+def test_record_always_calls_and_overwrites(tmp_path):
+    cache = CompletionCache(str(tmp_path), mode="record")
+    client = FakeClient()
+    cached_chat_completion(cache, client, "m", MESSAGES, None)
+    cached_chat_completion(cache, client, "m", MESSAGES, None)
+    assert client.calls == 2
+    replay = CompletionCache(str(tmp_path), mode="replay")
+    assert cached_chat_completion(replay, FakeClient(), "m", MESSAGES, None).content == "hello 2"
+
+
+def test_replay_miss_raises(tmp_path):
+    cache = CompletionCache(str(tmp_path), mode="replay")
+    client = FakeClient()
+    with pytest.raises(LookupError):
+        cached_chat_completion(cache, client, "m", MESSAGES, None)
+    assert client.calls == 0
+
+
+def test_off_never_touches_disk(tmp_path):
+    cache_dir = tmp_path / "cache"
+    cache = CompletionCache(str(cache_dir), mode="off")
+    client = FakeClient()
+    cached_chat_completion(cache, client, "m", MESSAGES, None)
+    cached_chat_completion(cache, client, "m", MESSAGES, None)
+    assert client.calls == 2
+    assert not cache_dir.exists()
+
+
+def test_lru_eviction_by_entries(tmp_path):
+    cache = CompletionCache(str(tmp_path), max_entries=2)
+    cache.put("a", {"content": "a"})
+    cache.put("b", {"content": "b"})
+    assert cache.get("a") == {"content": "a"}  # a is now most recently used
+    cache.put("c", {"content": "c"})
+    assert cache.get("b") is None
+    assert cache.get("a") is not None and cache.get("c") is not None
+    assert sorted(os.listdir(tmp_path)) == ["a.json", "c.json"]
+
+
+def test_eviction_by_bytes(tmp_path):
+    cache = CompletionCache(str(tmp_path), max_bytes=300)
+    for i in range(5):
+        cache.put(f"k{i}", {"content": "x" * 100})
+    stats = cache.stats()
+    assert stats["bytes"] <= 300
+    assert cache.get("k4") is not None and cache.get("k0") is None
+
+
+def test_index_reloads_from_disk(tmp_path):
+    CompletionCache(str(tmp_path)).put("k", {"content": "kept"})
+    reopened = CompletionCache(str(tmp_path))
+    assert reopened.stats()["entries"] == 1
+    assert reopened.get("k") == {"content": "kept"}
+
+
+def test_corrupt_entry_is_a_miss(tmp_path):
+    cache = CompletionCache(str(tmp_path))
+    cache.put("k", {"content": "x"})
+    (tmp_path / "k.json").write_text("{not json")
+    assert cache.get("k") is None
+    assert cache.stats()["entries"] == 0
@@ -0,0 +1,111 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from chart_utils import bucket_labels, bucket_timestamps, lttb_indices, minmax_indices
+
+
+def _lttb_reference(values, target):
+    """Point-by-point LTTB with the same bucket edges as lttb_indices."""
+    n = len(values)
+    y = [0.0 if np.isnan(v) else float(v) for v in values]
+    edges = [int(e) for e in np.linspace(1, n - 1, target - 1).astype(np.int64)]
+    kept = [0]
+    a = 0
+    for i in range(target - 2):
+        start, end = edges[i], max(edges[i + 1], edges[i] + 1)
+        nxt_start = edges[i + 1]
+        nxt_end = edges[i + 2] if i + 2 < len(edges) else n
+        nxt_end = max(nxt_end, nxt_start + 1)
+        avg_x = sum(range(nxt_start, nxt_end)) / (nxt_end - nxt_start)
+        avg_y = sum(y[nxt_start:nxt_end]) / (nxt_end - nxt_start)
+        best, best_area = start, -1.0
+        for j in range(start, end):
+            area = abs((a - avg_x) * (y[j] - y[a]) - (a - j) * (avg_y - y[a]))
+            if area > best_area:
+                best, best_area = j, area
+        kept.append(best)
+        a = best
+    kept.append(n - 1)
+    return kept
+
+
+@pytest.mark.parametrize("n,target", [(1000, 100), (1000, 3), (997, 50), (50, 49)])
+def test_lttb_matches_reference(n, target):
+    rng = np.random.default_rng(n + target)
+    values = np.cumsum(rng.normal(size=n))
+    values[rng.random(n) < 0.02] = np.nan
+    assert lttb_indices(values, target).tolist() == _lttb_reference(values, target)
+
+
+def test_lttb_keeps_endpoints_and_order():
+    values = np.sin(np.linspace(0, 20, 5000))
+    idx = lttb_indices(values, 200)
+    assert len(idx) == 200
+    assert idx[0] == 0 and idx[-1] == 4999
+    assert (np.diff(idx) > 0).all()
+
+
+def test_lttb_keeps_a_spike():
+    values = np.zeros(10_000)
+    values[4321] = 100.0
+    assert 4321 in lttb_indices(values, 50)
+
+
+@pytest.mark.parametrize("target", [2, 10, 20])
+def test_lttb_is_identity_when_nothing_to_drop(target):
+    values = np.arange(10, dtype=float)
+    assert lttb_indices(values, target).tolist() == list(range(10))
+
+
+def test_minmax_keeps_every_series_extremes_within_budget():
+    rng = np.random.default_rng(3)
+    matrix = rng.normal(size=(5000, 3))
+    matrix[1234, 0] = 50
+    matrix[4321, 2] = -50
+    idx = minmax_indices(matrix, 300)
+    assert len(idx) <= 300
+    assert idx[0] == 0 and idx[-1] == 4999
+    assert (np.diff(idx) > 0).all()
+    for col in range(3):
+        interior = matrix[1:-1, col]
+        assert 1 + int(interior.argmax()) in idx
+        assert 1 + int(interior.argmin()) in idx
+
+
+@pytest.mark.parametrize("target,k", [(10, 12), (20, 12), (25, 12), (10, 4)])
+def test_minmax_stays_within_budget_for_many_series(target, k):
+    matrix = np.random.default_rng(4).normal(size=(1000, k))
+    idx = minmax_indices(matrix, target)
+    assert len(idx) <= target
+    assert idx[0] == 0 and idx[-1] == 999
+    assert (np.diff(idx) > 0).all()
+
+
+def test_minmax_is_identity_when_under_budget():
+    matrix = np.ones((20, 2))
+    assert minmax_indices(matrix, 20).tolist() == list(range(20))
+
+
+def test_bucket_timestamps_floor_to_bucket_start():
+    ts = pd.Series(pd.to_datetime(["2024-03-14 15:09:26", "2024-03-17 23:59:59", "2024-03-18 00:00:00"], utc=True))
+    assert bucket_labels(pd.DatetimeIndex(bucket_timestamps(ts, "hour")), "hour") == [
+        "2024-03-14 15:00", "2024-03-17 23:00", "2024-03-18 00:00",
+    ]
+    # Weeks start on Monday: 2024-03-11 and 2024-03-18
+    assert bucket_labels(pd.DatetimeIndex(bucket_timestamps(ts, "week")), "week") == ["2024-03-11", "2024-03-11", "2024-03-18"]
+    assert bucket_labels(pd.DatetimeIndex(bucket_timestamps(ts, "month")), "month") == ["2024-03"] * 3
+    assert bucket_labels(pd.DatetimeIndex(bucket_timestamps(ts, "day")), "day") == ["2024-03-14", "2024-03-17", "2024-03-18"]
+
+
+def test_line_chart_is_downsampled_to_max_points(server):
+    out = server.tool_chartjs_data({
+        "table": "events", "kind": "line", "x": "timestamp", "y": "clicks", "op": "sum", "bucket": "minute", "max_points": 50,
+    })
+    assert "error" not in out, out
+    spec = out["chartjs"]
+    meta = spec["meta"]
+    assert meta["original_points"] > 50
+    assert meta["points"] <= 50 and meta["downsample"] == "lttb"
+    labels = spec["data"]["labels"]
+    assert len(labels) == meta["points"] and labels == sorted(labels)
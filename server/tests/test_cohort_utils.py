@@ -0,0 +1,156 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from cohort_utils import CohortMatrix, build_cohorts, period_label, period_number, update_cohorts
+
+
+@pytest.fixture(scope="module")
+def tables():
+    rng = np.random.default_rng(5)
+    n_users, n_events, n_purchases = 120, 3000, 600
+    base = pd.Timestamp("2025-01-01", tz="UTC")
+    users = pd.DataFrame({
+        "id": [f"u{i}" for i in range(n_users)],
+        "signup_date": (base + pd.to_timedelta(rng.integers(0, 90, n_users), unit="D")).astype(str),
+    })
+
+    def activity(n):
+        # Mostly after signup, some before (ignored) and some for unknown users
+        uid = rng.integers(0, n_users + 5, n)
+        return [f"u{i}" for i in uid], (base + pd.to_timedelta(rng.integers(-10, 180, n), unit="D")).astype(str)
+
+    e_users, e_ts = activity(n_events)
+    p_users, p_ts = activity(n_purchases)
+    events = pd.DataFrame({"user_id": e_users, "timestamp": e_ts})
+    purchases = pd.DataFrame({"user_id": p_users, "purchased_at": p_ts, "total_amount": rng.integers(1, 500, n_purchases).astype(float)})
+    return {"users": users, "events": events, "purchases": purchases}
+
+
+def _queries(m: CohortMatrix):
+    return [m.query(metric, max_periods=30) for metric in ("retention", "active", "revenue")]
+
+
+def _reference_active(tables, granularity):
+    users = tables["users"].assign(cohort=lambda d: period_number(pd.to_datetime(d["signup_date"], utc=True).to_numpy(dtype="datetime64[ns]"), granularity))
+    acts = pd.concat([
+        tables["events"].rename(columns={"timestamp": "ts"}),
+        tables["purchases"].rename(columns={"purchased_at": "ts"})[["user_id", "ts"]],
+    ])
+    acts = acts.merge(users, left_on="user_id", right_on="id")
+    acts["offset"] = period_number(pd.to_datetime(acts["ts"], utc=True).to_numpy(dtype="datetime64[ns]"), granularity) - acts["cohort"]
+    acts = acts[acts["offset"] >= 0].drop_duplicates(["user_id", "offset"])
+    return acts.groupby(["cohort", "offset"]).size()
+
+
+@pytest.mark.parametrize("granularity", ["week", "month"])
+def test_active_cells_match_brute_force(tables, granularity):
+    m = build_cohorts(tables)[granularity]
+    expected = _reference_active(tables, granularity)
+    for (cohort, offset), n in expected.items():
+        assert m.active[cohort - m.base, offset] == n
+    assert m.active.sum() == expected.sum()
+    assert m.sizes.sum() == len(tables["users"])
+
+
+@pytest.mark.parametrize("granularity", ["week", "month"])
+def test_incremental_updates_match_batch_build(tables, granularity):
+    batch = build_cohorts(tables)[granularity]
+    # Latest signups first, so the second batch re-anchors the matrix on earlier cohorts
+    users = tables["users"].sort_values("signup_date", ascending=False)
+    m = CohortMatrix(granularity)
+    cohorts = {granularity: m}
+    update_cohorts(cohorts, "users", users.iloc[:40])
+    update_cohorts(cohorts, "users", users.iloc[40:])
+    for table in ("events", "purchases"):
+        rows = tables[table]
+        for start in range(0, len(rows), 1000):
+            update_cohorts(cohorts, table, rows.iloc[start:start + 1000])
+    assert _queries(m) == _queries(batch)
+
+
+def test_replaying_rows_is_idempotent_for_activity(tables):
+    m = build_cohorts(tables)["week"]
+    before = _queries(m)[:2]
+    stats = m.stats()
+    assert m.add_events(tables["events"]["user_id"], tables["events"]["timestamp"]) == 0
+    assert m.add_users(tables["users"]["id"], tables["users"]["signup_date"]) == 0
+    update_cohorts({"week": m}, "users", tables["users"])
+    assert _queries(m)[:2] == before
+    assert m.stats() == stats
+
+
+def test_future_cells_are_none():
+    m = CohortMatrix("month")
+    m.add_users(pd.Series(["a", "b"]), pd.Series(["2025-01-10", "2025-03-02"]))
+    m.add_events(pd.Series(["a", "a", "b"]), pd.Series(["2025-01-11", "2025-03-05", "2025-03-06"]))
+    out = m.query("retention", max_periods=3)
+    assert out["cohorts"] == ["2025-01", "2025-03"]
+    assert out["matrix"] == [[1.0, 0.0, 1.0], [1.0, None, None]]
+
+
+@pytest.mark.parametrize("bound", ["since", "until"])
+def test_unparseable_bound_is_an_error(tables, bound):
+    m = build_cohorts(tables)["month"]
+    with pytest.raises(ValueError, match="not a valid date"):
+        m.query("retention", **{bound: "last spring"})
+
+
+def test_tool_reports_bad_bound(server):
+    out = server.tool_cohort_analysis({"since": "yesterday-ish"})
+    assert "yesterday-ish" in out["error"]
+
+
+@pytest.fixture
+def isolated_state(server, monkeypatch):
+    """Server tables and derived state that appends can change without leaking into other tests."""
+    derived = dict(server.DERIVED)
+    derived["timestamps"] = {t: dict(cols) for t, cols in derived.get("timestamps", {}).items()}
+    derived["days"] = {t: dict(cols) for t, cols in derived.get("days", {}).items()}
+    derived["aggregates"] = dict(derived.get("aggregates", {}))
+    derived["cohorts"] = None
+    monkeypatch.setattr(server, "dfs", dict(server.dfs))
+    monkeypatch.setattr(server, "DERIVED", derived)
+    monkeypatch.setattr(server, "PARTITIONS", {})
+    monkeypatch.setattr(server, "_query_profiler", None)
+    return server
+
+
+def test_append_without_timestamp_keeps_time_filters_and_charts(isolated_state):
+    server = isolated_state
+    before = len(server.dfs["events"])
+    row = {"id": "e-no-ts", "user_id": server.dfs["users"]["id"].iloc[0], "event_type": "page_view", "page": "home", "clicks": 3}
+    assert server.append_rows("events", [row]) == 1
+    for col, parsed in server.DERIVED["timestamps"]["events"].items():
+        assert len(parsed) == before + 1 and pd.isna(parsed.iloc[-1]), col
+        assert server.DERIVED["days"]["events"][col].iloc[-1] == "NaT"
+
+    since = server.DERIVED["timestamps"]["events"]["timestamp"].dropna().median()
+    filters = [{"column": "timestamp", "op": "gte", "value": since.isoformat()}]
+    filtered = server._apply_simple_filters(server.dfs["events"], filters, "events")
+    assert "e-no-ts" not in set(filtered["id"])
+    assert len(filtered) == int((server.DERIVED["timestamps"]["events"]["timestamp"] >= since).sum()) < before
+
+    args = {"table": "events", "kind": "line", "x": "timestamp", "y": "clicks", "op": "sum"}
+    for extra in ({}, {"filters": filters}):
+        out = server.tool_chartjs_data({**args, **extra})
+        assert "error" not in out, out
+
+
+def test_append_endpoint_requires_admin_and_rejects_bad_rows(isolated_state, client, admin_headers, monkeypatch):
+    body = {"table": "purchases", "rows": [{"id": "p-new", "user_id": "u0", "total_amount": 10.0, "purchased_at": "2025-07-01T00:00:00Z"}]}
+    assert client.post("/data/append", json=body).status_code == 403
+    resp = client.post("/data/append", json=body, headers=admin_headers)
+    assert resp.status_code == 200 and resp.get_json()["appended"] == 1
+
+    def bad_rows(table, rows):
+        raise ValueError("mixed types")
+
+    monkeypatch.setattr(isolated_state, "append_rows", bad_rows)
+    resp = client.post("/data/append", json=body, headers=admin_headers)
+    assert resp.status_code == 400 and "mixed types" in resp.get_json()["error"]
+
+
+def test_week_labels_start_on_monday():
+    p = period_number(np.array(["2025-03-13"], dtype="datetime64[ns]"), "week")[0]
+    assert period_label(p, "week") == "2025-03-10"
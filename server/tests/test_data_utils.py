@@ -0,0 +1,37 @@
+import pandas as pd
+
+import data_utils
+import session_utils
+
+
+def test_snapshot_is_stale_when_session_settings_change(server, tmp_path, monkeypatch):
+    # The server fixture has generated the JSON sources the snapshot is fingerprinted against
+    path = str(tmp_path / "snapshot.pkl")
+    dfs = {"users": pd.DataFrame({"id": ["u1"]})}
+    data_utils.save_snapshot(dfs, {"sessions": None}, path)
+    loaded = data_utils.load_snapshot(path)
+    assert loaded is not None and loaded[0]["users"].equals(dfs["users"])
+
+    monkeypatch.setattr(session_utils, "SESSION_GAP_MINUTES", session_utils.SESSION_GAP_MINUTES + 15)
+    assert data_utils.load_snapshot(path) is None
+    monkeypatch.undo()
+    monkeypatch.setattr(session_utils, "SESSION_CONVERSION_EVENT", "signup")
+    assert data_utils.load_snapshot(path) is None
+
+
+def test_warm_start_skips_derived_state_build(server, tmp_path, monkeypatch):
+    path = str(tmp_path / "snapshot.pkl")
+    built = []
+    real_build = data_utils.build_derived_state
+
+    def counting_build(dfs):
+        built.append(1)
+        return real_build(dfs)
+
+    monkeypatch.setattr(data_utils, "build_derived_state", counting_build)
+    _, _, cold = data_utils.load_state("auto", path)
+    assert not cold["snapshot_hit"] and len(built) == 1
+    dfs, derived, warm = data_utils.load_state("auto", path)
+    assert warm["snapshot_hit"] and warm["derived_ms"] == 0.0
+    assert len(built) == 1
+    assert set(derived) >= {"timestamps", "days", "cohorts", "sessions"} and "events" in dfs
@@ -0,0 +1,59 @@
+import json
+from types import SimpleNamespace
+
+import numpy as np
+import pandas as pd
+
+import frame_utils
+from frame_utils import Encoded, encode, frame, sse_frames
+
+
+def _events(body: bytes):
+    return [json.loads(line[len(b"data: "):]) for line in body.split(b"\n\n") if line.startswith(b"data: ")]
+
+
+def test_encode_numpy_and_missing_values():
+    value = {
+        "i": np.int64(3),
+        "f": np.float32(1.5),
+        "nan": float("nan"),
+        "inf": np.float64("inf"),
+        "nat": pd.NaT,
+        "ts": pd.Timestamp("2025-03-01T12:00:00Z"),
+        "arr": np.array([1, 2]),
+        "text": "a\nb",
+    }
+    raw = encode(value)
+    assert b"\n" not in raw
+    assert json.loads(raw) == {
+        "i": 3, "f": 1.5, "nan": None, "inf": None, "nat": None,
+        "ts": "2025-03-01T12:00:00+00:00", "arr": [1, 2], "text": "a\nb",
+    }
+
+
+def test_stdlib_fallback_matches(monkeypatch):
+    value = {"n": np.int64(7), "x": [1.0, float("nan")], 1: pd.Timestamp("2025-01-01")}
+    expected = json.loads(encode(value))
+    monkeypatch.setattr(frame_utils, "orjson", None)
+    assert json.loads(encode(value)) == expected
+
+
+def test_frame_splices_encoded_fields():
+    spec = Encoded({"type": "bar", "data": [1, 2]})
+    raw = frame("final", text="Chart ready.", chartjs=spec.parts["data"])
+    assert json.loads(raw) == {"type": "final", "text": "Chart ready.", "chartjs": [1, 2]}
+    assert json.loads(spec.text) == {"type": "bar", "data": [1, 2]}
+    assert list(sse_frames([raw, None, "{}"])) == [b"data: " + raw + b"\n\n", b"data: {}\n\n"]
+
+
+def test_profiled_chat_streams_a_profile_frame(server, client, admin_headers, monkeypatch):
+    monkeypatch.setattr(server, "cached_chat_completion", lambda *a, **kw: SimpleNamespace(content="hello", tool_calls=None))
+    body = {"messages": [{"role": "user", "content": "hi"}], "profile": True}
+    assert client.post("/agent-chat", json=body).status_code == 403
+    resp = client.post("/agent-chat", json=body, headers=admin_headers)
+    assert resp.status_code == 200
+    events = _events(resp.get_data())
+    types = [e["type"] for e in events]
+    assert "final" in types and types[-1] == "profile"
+    assert next(e for e in events if e["type"] == "final")["text"] == "hello"
+    assert "collapsed" in events[-1] and "stack_samples" in events[-1]
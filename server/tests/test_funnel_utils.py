@@ -0,0 +1,94 @@
+from collections import Counter
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from funnel_utils import build_event_index, compute_funnel
+
+STEPS = ["view", "click", "cart", "buy"]
+
+
+@pytest.fixture(scope="module")
+def events():
+    rng = np.random.default_rng(11)
+    rows = 4000
+    base = pd.Timestamp("2025-01-01", tz="UTC")
+    # Coarse timestamps so many events tie on time
+    ts = base + pd.to_timedelta(rng.integers(0, 20 * 24, rows), unit="h")
+    df = pd.DataFrame({
+        "user_id": rng.choice([f"u{i}" for i in range(150)], rows),
+        "event_type": rng.choice(STEPS + ["other"], rows, p=[0.35, 0.25, 0.15, 0.1, 0.15]),
+        "page": rng.choice(["home", "product", "blog"], rows),
+        "timestamp": ts.astype(str),
+    })
+    df.loc[rng.random(rows) < 0.02, "user_id"] = None
+    return df, pd.Series(ts, index=df.index)
+
+
+def _reference(df, ts, steps, window_hours, since=None, until=None):
+    """Per-user walk over (time, original order): entry at the first steps[0] event, then the
+    first matching event after the previous step within the window of entry."""
+    lo = pd.Timestamp(since, tz="UTC") if since else None
+    hi = pd.Timestamp(until, tz="UTC") if until else None
+    window = pd.Timedelta(hours=window_hours)
+    counts = [0] * len(steps)
+    entry_pages = Counter()
+    frame = df.assign(_ts=ts).dropna(subset=["user_id"])
+    for _, user_events in frame.groupby("user_id", sort=False):
+        seq = user_events.sort_values("_ts", kind="stable")
+        seq = seq[[(lo is None or t >= lo) and (hi is None or t < hi) for t in seq["_ts"]]]
+        pos, start = -1, None
+        for k, step in enumerate(steps):
+            found = None
+            for i, (etype, t) in enumerate(zip(seq["event_type"], seq["_ts"])):
+                if i > pos and etype == step and (k == 0 or t - start <= window):
+                    found = i
+                    break
+            if found is None:
+                break
+            if k == 0:
+                start = seq["_ts"].iloc[found]
+                entry_pages[seq["page"].iloc[found]] += 1
+            counts[k] += 1
+            pos = found
+    return counts, entry_pages
+
+
+@pytest.mark.parametrize("window_hours,since,until", [
+    (168, None, None),
+    (24, None, None),
+    (0, None, None),
+    (72, "2025-01-05", "2025-01-15"),
+])
+def test_funnel_counts_match_brute_force(events, window_hours, since, until):
+    df, ts = events
+    out = compute_funnel(build_event_index(df, ts), STEPS, window_hours=window_hours, since=since, until=until)
+    expected, _ = _reference(df, ts, STEPS, window_hours, since, until)
+    assert [r["users"] for r in out["rows"]] == expected
+    assert out["summary"]["entered"] == expected[0]
+    assert out["summary"]["completed"] == expected[-1]
+
+
+def test_page_breakdown_uses_entry_page(events):
+    df, ts = events
+    out = compute_funnel(build_event_index(df, ts), STEPS, window_hours=48, breakdown="page")
+    _, entry_pages = _reference(df, ts, STEPS, 48)
+    entered = {r["page"]: r["users"] for r in out["rows"] if r["step"] == 1}
+    assert entered == dict(entry_pages)
+
+
+def test_unknown_step_is_an_error(events):
+    df, ts = events
+    with pytest.raises(ValueError):
+        compute_funnel(build_event_index(df, ts), ["view", "nope"])
+
+
+def test_tool_honours_zero_window(server):
+    index = server._event_index()
+    steps = ["page_view", "purchase"]
+    zero = server.tool_funnel_analysis({"steps": steps, "window_hours": 0})
+    default = server.tool_funnel_analysis({"steps": steps})
+    assert zero["summary"]["window_hours"] == 0
+    assert default["summary"]["window_hours"] == 168
+    assert zero["rows"] == compute_funnel(index, steps, window_hours=0)["rows"]
@@ -0,0 +1,182 @@
+import os
+import json
+import time
+import threading
+
+import pytest
+
+from memory_utils import EntityLRU, MemoryStore, session_path
+
+
+@pytest.fixture
+def store(tmp_path):
+    # A long flush interval keeps the background thread out of the way; tests flush explicitly
+    s = MemoryStore(str(tmp_path / "memory"), flush_interval=3600, dirty_threshold=10_000, compact_interval=3600)
+    yield s
+    s.close()
+
+
+def _user(i: int, name: str = "") -> dict:
+    return {"id": f"u{i}", "name": name or f"User {i}", "email": f"u{i}@example.com"}
+
+
+def test_entity_lru_evicts_least_recently_used():
+    lru = EntityLRU(capacity=3)
+    for i in range(3):
+        lru.put(f"u{i}", _user(i))
+    lru.get("u0")
+    lru.put("u3", _user(3))
+    assert list(lru.by_id) == ["u2", "u0", "u3"]
+    assert "u1" not in lru.by_id
+    assert lru.get_by_name("user 1") is None
+    assert lru.get_by_name("  USER 0 ")["id"] == "u0"
+
+
+def test_entity_lru_name_index_follows_renames():
+    lru = EntityLRU(capacity=2)
+    lru.put("u1", _user(1, "Ada"))
+    lru.put("u1", _user(1, "Grace"))
+    assert lru.get_by_name("ada") is None
+    assert lru.get_by_name("grace")["id"] == "u1"
+    # Evicting an entity whose name was re-pointed to another id keeps the other mapping
+    lru.put("u2", _user(2, "Grace"))
+    lru.put("u3", _user(3))
+    assert lru.by_name["grace"] == "u2"
+    lru.put("u4", _user(4))
+    assert "grace" not in lru.by_name
+    assert set(lru.by_name.values()) <= set(lru.by_id)
+
+
+def test_entity_lru_round_trips_in_recency_order():
+    lru = EntityLRU(capacity=3)
+    for i in range(3):
+        lru.put(f"u{i}", _user(i))
+    lru.get("u0")
+    again = EntityLRU.from_dict(lru.to_dict(), capacity=3)
+    assert list(again.by_id) == list(lru.by_id)
+    assert again.by_name == lru.by_name
+
+
+def test_session_path_shards_by_hash(tmp_path):
+    path = session_path(str(tmp_path), "abc")
+    shard, fname = os.path.split(path)
+    assert os.path.dirname(shard) == str(tmp_path)
+    assert fname.startswith(os.path.basename(shard)) and fname.endswith(".json")
+    assert session_path(str(tmp_path), "abc") == path != session_path(str(tmp_path), "abd")
+
+
+def test_flush_writes_one_shard_per_session(store):
+    store.remember_users("s1", [_user(1)])
+    store.add_fact("s2", "likes charts")
+    assert not os.path.exists(session_path(store.memory_dir, "s1"))
+    store.flush()
+    with open(session_path(store.memory_dir, "s1")) as f:
+        assert json.load(f)["entities"]["users_by_id"]["u1"]["email"] == "u1@example.com"
+    with open(session_path(store.memory_dir, "s2")) as f:
+        assert json.load(f)["facts"][0]["fact"] == "likes charts"
+    assert store.stats()["dirty_sessions"] == 0
+
+
+def test_sessions_reload_from_disk(store):
+    store.remember_users("s1", [_user(1), _user(2)])
+    store.flush()
+    reopened = MemoryStore(store.memory_dir, flush_interval=3600, compact_interval=3600)
+    try:
+        sess = reopened.get_session("s1")
+        assert list(sess["entities"]["users_by_id"]) == ["u1", "u2"]
+        assert reopened.get_session("missing") == {}
+    finally:
+        reopened.close()
+
+
+def test_dirty_threshold_wakes_flusher(tmp_path):
+    s = MemoryStore(str(tmp_path / "memory"), flush_interval=3600, dirty_threshold=2, compact_interval=3600)
+    try:
+        s.remember_users("s1", [_user(1), _user(2)])
+        deadline = time.time() + 5
+        while not os.path.exists(session_path(s.memory_dir, "s1")) and time.time() < deadline:
+            time.sleep(0.01)
+        assert os.path.exists(session_path(s.memory_dir, "s1"))
+    finally:
+        s.close()
+
+
+def test_compact_expires_stale_shards_and_prunes_dirs(store):
+    store.add_fact("old", "x")
+    store.add_fact("new", "y")
+    store.flush()
+    old_path = session_path(store.memory_dir, "old")
+    stale = time.time() - store.ttl - 60
+    os.utime(old_path, (stale, stale))
+    # Unload both so compaction judges them by their shard files
+    store.idle_unload = -1
+    stats = store.compact()
+    assert stats["unloaded"] == 2
+    assert stats["expired"] == 1
+    assert not os.path.exists(old_path) and not os.path.exists(os.path.dirname(old_path))
+    assert store.get_session("new")["facts"][0]["fact"] == "y"
+    assert store.get_session("old") == {}
+
+
+def test_compact_keeps_dirty_sessions_loaded(store):
+    store.add_fact("s1", "x")
+    store.idle_unload = -1
+    # compact() flushes first, so the session is clean and can be unloaded afterwards
+    assert store.compact()["unloaded"] == 1
+    assert store.stats()["loaded_sessions"] == 0
+    assert store.get_session("s1")["facts"][0]["fact"] == "x"
+
+
+def test_compact_counts_sessions_expired_in_memory(store):
+    store.add_fact("loaded-old", "x")
+    store.flush()
+    path = session_path(store.memory_dir, "loaded-old")
+    store._sessions["loaded-old"]["last_access"] = time.time() - store.ttl - 60
+    stale = time.time() - store.ttl - 60
+    os.utime(path, (stale, stale))
+    stats = store.compact()
+    assert stats["expired"] == 1
+    assert not os.path.exists(path)
+    assert store.get_session("loaded-old") == {}
+
+
+def test_session_load_reads_disk_outside_the_lock(store, monkeypatch):
+    store.add_fact("s1", "x")
+    store.idle_unload = -1
+    store.compact()
+    lock_free = []
+    real_load = store._load_session
+
+    def probing_load(session_id):
+        def probe():
+            ok = store._lock.acquire(timeout=1)
+            lock_free.append(ok)
+            if ok:
+                store._lock.release()
+
+        t = threading.Thread(target=probe)
+        t.start()
+        t.join()
+        return real_load(session_id)
+
+    monkeypatch.setattr(store, "_load_session", probing_load)
+    assert store.get_session("s1")["facts"][0]["fact"] == "x"
+    assert lock_free == [True]
+
+
+def test_legacy_file_is_migrated_once(tmp_path):
+    legacy = tmp_path / "memory.json"
+    legacy.write_text(json.dumps({"sessions": {"s1": {"entities": {"users_by_id": {"u1": _user(1)}}, "facts": [{"fact": "f"}]}}}))
+    memory_dir = str(tmp_path / "memory")
+    s = MemoryStore(memory_dir, legacy_path=str(legacy), flush_interval=3600, compact_interval=3600)
+    try:
+        assert s.get_session("s1")["entities"]["users_by_name"] == {"user 1": "u1"}
+        assert os.path.exists(os.path.join(memory_dir, ".migrated"))
+    finally:
+        s.close()
+    legacy.write_text(json.dumps({"sessions": {"s2": {"facts": [{"fact": "late"}]}}}))
+    again = MemoryStore(memory_dir, legacy_path=str(legacy), flush_interval=3600, compact_interval=3600)
+    try:
+        assert again.get_session("s2") == {}
+    finally:
+        again.close()
@@ -0,0 +1,107 @@
+import os
+import sys
+import subprocess
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from parallel_utils import aggregation_stats, group_aggregate, shutdown_pool
+
+SERVER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+AGGS = {
+    "n": ("clicks", "size"),
+    "clicks": ("clicks", "sum"),
+    "avg_clicks": ("clicks", "mean"),
+    "secs": ("duration", "sum"),
+    "avg_secs": ("duration", "mean"),
+    "timed": ("duration", "count"),
+    "min_secs": ("duration", "min"),
+    "max_secs": ("duration", "max"),
+    "min_clicks": ("clicks", "min"),
+    "any_flag": ("flag", "max"),
+}
+
+
+@pytest.fixture(scope="module")
+def events():
+    rng = np.random.default_rng(7)
+    rows = 20_000
+    users = np.array([f"u{i}" for i in range(500)], dtype=object)
+    user = users[rng.integers(0, len(users), rows)]
+    user[rng.random(rows) < 0.02] = None
+    df = pd.DataFrame({
+        "user_id": user,
+        "page": rng.choice(["home", "cart", "checkout", "blog"], rows),
+        "clicks": rng.integers(0, 50, rows),
+        "duration": np.where(rng.random(rows) < 0.1, np.nan, rng.random(rows) * 300),
+        "flag": rng.random(rows) < 0.3,
+    })
+    yield df
+    shutdown_pool()
+
+
+def _assert_parity(parallel: pd.DataFrame, serial: pd.DataFrame) -> None:
+    # Float sums are uncompensated on the parallel path, so compare those within a tolerance
+    pd.testing.assert_frame_equal(parallel, serial, check_exact=False, rtol=1e-9)
+
+
+@pytest.mark.parametrize("keys", [["user_id"], ["page"], ["user_id", "page"], ["page", "flag"]])
+def test_parallel_matches_serial(events, keys):
+    serial = group_aggregate(events, keys, AGGS, parallel=False)
+    for workers in (1, 3):
+        before = aggregation_stats()["parallel"]
+        parallel = group_aggregate(events, keys, AGGS, parallel=True, workers=workers)
+        assert aggregation_stats()["parallel"] == before + 1
+        _assert_parity(parallel, serial)
+
+
+def test_parallel_matches_serial_on_filtered_rows_with_sources(events):
+    subset = events[events["clicks"] > 25]
+    keys = ["user_id", "page"]
+    sources = {k: events for k in keys}
+    serial = group_aggregate(subset, keys, AGGS, parallel=False)
+    _assert_parity(group_aggregate(subset, keys, AGGS, sources=sources, parallel=True, workers=2), serial)
+    # Second call serves the key encoding from the cache
+    _assert_parity(group_aggregate(subset, keys, AGGS, sources=sources, parallel=True, workers=2), serial)
+
+
+def test_rows_beyond_a_stale_source_fall_back_to_factorize(events):
+    # `source` captured before an append: the filtered frame has labels the source doesn't cover
+    grown = pd.concat([events, events.tail(100).set_axis(pd.RangeIndex(len(events), len(events) + 100))])
+    stale = events
+    subset = grown[grown["clicks"] > 40]
+    serial = group_aggregate(subset, ["user_id"], AGGS, parallel=False)
+    before = aggregation_stats()["parallel"]
+    _assert_parity(group_aggregate(subset, ["user_id"], AGGS, sources={"user_id": stale}, parallel=True, workers=2), serial)
+    assert aggregation_stats()["parallel"] == before + 1
+
+
+def test_sparse_key_product_is_compacted():
+    rng = np.random.default_rng(1)
+    rows = 2_000
+    df = pd.DataFrame({
+        "a": rng.integers(0, 10_000, rows),
+        "b": rng.integers(0, 10_000, rows),
+        "v": rng.random(rows),
+    })
+    aggs = {"n": ("v", "size"), "total": ("v", "sum")}
+    _assert_parity(group_aggregate(df, ["a", "b"], aggs, parallel=True, workers=2), group_aggregate(df, ["a", "b"], aggs, parallel=False))
+
+
+def test_importing_server_as_worker_main_has_no_side_effects(tmp_path):
+    # spawn/forkserver workers re-run the main script as __mp_main__; that must not start the server
+    # or open (and evict from) the completion cache
+    cache_dir = tmp_path / "llm_cache"
+    script = (
+        "import runpy, threading\n"
+        f"g = runpy.run_path({os.path.join(SERVER_DIR, 'server.py')!r}, run_name='__mp_main__')\n"
+        "names = sorted(t.name for t in threading.enumerate())\n"
+        "print(g['_started'], g['DATA_READY'].is_set(), len(g['dfs']), names)\n"
+    )
+    env = {**os.environ, "LLM_CACHE_DIR": str(cache_dir)}
+    out = subprocess.run([sys.executable, "-c", script], cwd=SERVER_DIR, env=env, capture_output=True, text=True, timeout=120)
+    assert out.returncode == 0, out.stderr
+    assert out.stdout.strip() == "False False 0 ['MainThread']"
+    assert not cache_dir.exists()
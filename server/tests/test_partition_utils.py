@@ -0,0 +1,141 @@
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from partition_utils import NULL_PARTITION, PartitionedTable, cluster_by_time
+
+
+def _purchases(rows: int, seed: int = 0, start: int = 0) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    ts = pd.Timestamp("2025-03-01", tz="UTC") + pd.to_timedelta(rng.integers(0, 30 * 24, rows), unit="h")
+    df = pd.DataFrame({
+        "id": np.arange(start, start + rows),
+        "total_amount": rng.integers(1, 1000, rows).astype(float),
+        "purchased_at": ts.strftime("%Y-%m-%dT%H:%M:%SZ"),
+    }, index=pd.RangeIndex(start, start + rows))
+    df.loc[df.index[::50], "purchased_at"] = None
+    return df
+
+
+def _ts(df: pd.DataFrame) -> pd.Series:
+    return pd.to_datetime(df["purchased_at"], errors="coerce", utc=True)
+
+
+@pytest.fixture
+def table(tmp_path):
+    df = _purchases(2000)
+    part = PartitionedTable.open_or_build("purchases", df, "purchased_at", _ts(df), fingerprint="v1", base_dir=str(tmp_path))
+    return part, df
+
+
+def _ids(df: pd.DataFrame):
+    return sorted(df["id"].tolist())
+
+
+def test_time_filter_prunes_and_keeps_matching_rows(table):
+    part, df = table
+    filters = [{"column": "purchased_at", "op": "gte", "value": "2025-03-20"}, {"column": "purchased_at", "op": "lt", "value": "2025-03-23"}]
+    out, info = part.select(filters, df)
+    assert info["partitions_scanned"] == 3
+    assert info["partitions_total"] == 31  # 30 days plus the NULL partition
+    ts = _ts(df)
+    expected = df[(ts >= "2025-03-20") & (ts < "2025-03-23")]
+    # Whole days are kept, and nothing outside them
+    assert _ids(out) == _ids(expected)
+    assert list(out.index) == sorted(out.index)
+    assert NULL_PARTITION not in part.prune(filters)
+
+
+def test_qualified_time_column_does_not_prune(table):
+    part, df = table
+    # The row filter does not resolve qualified names, so pruning must not half-apply them
+    filters = [{"column": "purchases.purchased_at", "op": "gte", "value": "2025-03-20"}]
+    assert part.prune(filters) == part.prune(None)
+    assert _ids(part.select(filters, df)[0]) == _ids(df)
+
+
+def test_numeric_stats_prune(table):
+    part, df = table
+    out, info = part.select([{"column": "total_amount", "op": "gt", "value": 998}], df)
+    assert info["partitions_scanned"] < info["partitions_total"]
+    assert set(df.loc[df["total_amount"] > 998, "id"]) <= set(out["id"])
+
+
+def test_unpruned_scan_returns_the_resident_frame(table):
+    part, df = table
+    out, info = part.select(None, df)
+    assert out is df
+    assert info["partitions_scanned"] == info["partitions_total"] and info["rows_scanned"] == len(df)
+
+
+def test_clustered_partitions_are_single_ranges_of_the_frame(tmp_path):
+    raw = _purchases(2000)
+    df = cluster_by_time(raw, _ts(raw))
+    assert _ids(df) == _ids(raw) and list(df.index) == list(range(len(df)))
+    part = PartitionedTable.open_or_build("purchases", df, "purchased_at", _ts(df), fingerprint="v1", base_dir=str(tmp_path))
+    assert all(len(m["ranges"]) == 1 for m in part.manifest["partitions"].values())
+    # Rows are served from the resident frame; only the manifest is on disk
+    assert os.listdir(tmp_path / "purchases") == ["manifest.json"]
+    out, _ = part.select([{"column": "purchased_at", "op": "gte", "value": "2025-03-25"}], df)
+    ts = _ts(df)
+    assert out.equals(df[(ts >= "2025-03-25")])
+
+
+def test_reopen_reuses_manifest_and_rebuilds_on_new_fingerprint(table, tmp_path):
+    part, df = table
+    again = PartitionedTable.open_or_build("purchases", df, "purchased_at", _ts(df), fingerprint="v1", base_dir=str(tmp_path))
+    assert again.manifest == part.manifest
+    changed = df.iloc[:500]
+    rebuilt = PartitionedTable.open_or_build("purchases", changed, "purchased_at", _ts(changed), fingerprint="v2", base_dir=str(tmp_path))
+    assert rebuilt.manifest["rows"] == 500
+    assert rebuilt.select([{"column": "purchased_at", "op": "lt", "value": "2025-03-10"}], changed)[1]["partitions_scanned"] == 9
+
+
+def test_append_updates_touched_partitions(table):
+    part, df = table
+    new = _purchases(300, seed=1, start=len(df))
+    part.append(new, _ts(new))
+    both = pd.concat([df, new])
+    assert part.manifest["rows"] == len(both)
+    assert sum(m["rows"] for m in part.manifest["partitions"].values()) == len(both)
+    filters = [{"column": "purchased_at", "op": "gte", "value": "2025-03-28"}]
+    ts = _ts(both)
+    assert _ids(part.select(filters, both)[0]) == _ids(both[ts >= "2025-03-28"])
+
+
+def test_concurrent_select_during_append(table):
+    part, df = table
+    errors = []
+    stop = threading.Event()
+    frames = [df]
+
+    def scan():
+        while not stop.is_set():
+            try:
+                part.select([{"column": "purchased_at", "op": "gte", "value": "2025-03-15"}], frames[-1])
+                part.stats()
+            except Exception as e:
+                errors.append(e)
+                return
+
+    readers = [threading.Thread(target=scan) for _ in range(3)]
+    for r in readers:
+        r.start()
+    try:
+        start = len(df)
+        for i in range(20):
+            # Every batch opens new day partitions, so the manifest grows while readers iterate it
+            new = _purchases(20, seed=10 + i, start=start)
+            new["purchased_at"] = (pd.Timestamp("2025-05-01", tz="UTC") + pd.to_timedelta(i * 40 + np.arange(20), unit="D")).strftime("%Y-%m-%dT%H:%M:%SZ")
+            frames.append(pd.concat([frames[-1], new]))
+            part.append(new, _ts(new))
+            start += len(new)
+    finally:
+        stop.set()
+        for r in readers:
+            r.join()
+    assert not errors
+    assert part.manifest["rows"] == start
@@ -0,0 +1,97 @@
+import gc
+import json
+
+import pandas as pd
+import pytest
+
+import plan_utils
+
+PLANS = [
+    # Filter on a joined table: pushed down, left join becomes inner
+    {"source": "events", "joins": [{"table": "users"}], "filters": [{"column": "users.age", "op": "gt", "value": 40}],
+     "group_by": ["event_type"], "metrics": [{"column": "clicks", "op": "mean", "alias": "avg_clicks"}]},
+    # Unused join is dropped
+    {"source": "events", "joins": [{"table": "users"}], "group_by": ["page"], "metrics": [{"column": "clicks", "op": "sum"}]},
+    {"source": "purchases", "joins": [{"table": "users", "on": {"purchases.user_id": "users.id"}}],
+     "group_by": ["location"], "metrics": [{"column": "total_amount", "op": "sum", "alias": "revenue"}],
+     "order_by": [{"column": "revenue", "dir": "desc"}], "limit": 5},
+    # Top-K without aggregation
+    {"source": "events", "filters": [{"column": "clicks", "op": "gte", "value": 5}],
+     "select": ["user_id", "page", "clicks"], "order_by": [{"column": "clicks", "dir": "desc"}], "limit": 20},
+    {"source": "events", "filters": [{"column": "page", "op": "in", "value": ["home", "cart"]}, {"column": "event_type", "op": "eq", "value": "purchase"}],
+     "group_by": ["page"], "metrics": [{"column": "id", "op": "count", "alias": "n"}]},
+    # Time filter on a partitioned table
+    {"source": "purchases", "filters": [{"column": "purchased_at", "op": "gte", "value": "2025-07-15"}],
+     "group_by": ["payment_method"], "metrics": [{"column": "total_amount", "op": "max"}, {"column": "items_count", "op": "sum"}]},
+    {"source": "sessions", "filters": [{"column": "converted", "op": "eq", "value": True}],
+     "group_by": ["entry_page"], "metrics": [{"column": "event_count", "op": "mean"}],
+     "order_by": [{"column": "mean_event_count", "dir": "asc"}], "limit": 3},
+    {"source": "purchases", "joins": [{"table": "users"}], "filters": [{"column": "location", "op": "contains", "value": "a"}],
+     "metrics": [{"column": "total_amount", "op": "sum"}]},
+]
+
+
+def _canonical(rows):
+    def norm(v):
+        return round(v, 6) if isinstance(v, float) else v
+    return sorted(json.dumps({k: norm(v) for k, v in r.items()}, sort_keys=True, default=str) for r in rows)
+
+
+@pytest.mark.parametrize("args", PLANS)
+def test_optimized_plan_matches_naive(server, args):
+    optimized = server.tool_run_analysis_plan({**args, "optimize": True})
+    naive = server.tool_run_analysis_plan({**args, "optimize": False})
+    assert "error" not in optimized and "error" not in naive, (optimized, naive)
+    assert optimized["columns"] == naive["columns"]
+    assert optimized["rows"], "plan should return rows"
+    if args.get("limit") and args.get("order_by"):
+        # Top-K and a full sort may keep different rows among ties at the cutoff; the ordered keys must agree
+        key = args["order_by"][0]["column"]
+        assert [r[key] for r in optimized["rows"]] == pytest.approx([r[key] for r in naive["rows"]])
+        boundary = optimized["rows"][-1][key]
+        assert _canonical(r for r in optimized["rows"] if r[key] != boundary) == _canonical(r for r in naive["rows"] if r[key] != boundary)
+    else:
+        assert _canonical(optimized["rows"]) == _canonical(naive["rows"])
+
+
+def test_time_filters_compare_instants(server):
+    # Same instant as 2025-07-15T00:00:00Z, written with another offset
+    args = {"source": "purchases", "filters": [{"column": "purchased_at", "op": "lt", "value": "2025-07-15T02:00:00+02:00"}],
+            "metrics": [{"column": "id", "op": "count", "alias": "n"}]}
+    parsed = pd.to_datetime(server.dfs["purchases"]["purchased_at"], errors="coerce", utc=True)
+    expected = int((parsed < pd.Timestamp("2025-07-15", tz="UTC")).sum())
+    for optimize in (True, False):
+        out = server.tool_run_analysis_plan({**args, "optimize": optimize})
+        assert out["rows"] == [{"n": expected}], optimize
+
+
+def test_explain_reports_pushdown(server):
+    out = server.tool_run_analysis_plan({**PLANS[0], "explain": True})
+    users = next(i for i in out["explain"]["inputs"] if i["table"] == "users")
+    assert users["filters"] == [{"column": "users.age", "op": "gt", "value": 40}]
+    assert users["columns"] == ["id"]
+    assert out["explain"]["actual"]["aggregated"] == len(out["rows"])
+
+
+def test_tool_is_not_exposed_to_the_model(server):
+    assert "run_analysis_plan" not in server.TOOLS_IMPL
+    assert "run_analysis_plan" not in {t["function"]["name"] for t in server.OPENAI_TOOLS}
+
+
+def test_ndistinct_cache_is_bounded_and_ignores_recycled_ids(monkeypatch):
+    monkeypatch.setattr(plan_utils, "NDISTINCT_CACHE_SIZE", 4)
+    plan_utils._ndistinct_cache.clear()
+    frames = [pd.DataFrame({"a": range(i + 1)}) for i in range(10)]
+    assert [plan_utils._ndistinct(df, "a") for df in frames] == list(range(1, 11))
+    assert len(plan_utils._ndistinct_cache) == 4
+
+    df = pd.DataFrame({"a": [1, 1, 2]})
+    assert plan_utils._ndistinct(df, "a") == 2
+    key = (id(df), "a")
+    del df
+    gc.collect()
+    # A dead frame's entry is never served, even if a new frame reuses its id
+    assert plan_utils._ndistinct_cache[key][0]() is None
+    other = pd.DataFrame({"a": [1, 2, 3, 4, 5]})
+    plan_utils._ndistinct_cache[(id(other), "a")] = plan_utils._ndistinct_cache.pop(key)
+    assert plan_utils._ndistinct(other, "a") == 5
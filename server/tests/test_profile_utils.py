@@ -0,0 +1,72 @@
+import time
+import threading
+from types import SimpleNamespace
+
+import profile_utils
+from profile_utils import SamplingProfiler, is_admin
+
+
+def _spin(stop: threading.Event) -> None:
+    while not stop.is_set():
+        sum(range(1000))
+
+
+def test_samples_only_the_selected_thread():
+    stop = threading.Event()
+    worker = threading.Thread(target=_spin, args=(stop,), name="spinner")
+    idle = threading.Thread(target=stop.wait, name="idle")
+    worker.start()
+    idle.start()
+    try:
+        prof = SamplingProfiler(interval_ms=1, thread_ids=[worker.ident]).start()
+        time.sleep(0.2)
+        prof.stop()
+    finally:
+        stop.set()
+        worker.join()
+        idle.join()
+    assert prof.samples > 0 and prof.stacks
+    for stack in prof.stacks:
+        assert stack.startswith("spinner;")
+        assert "test_profile_utils.py:_spin" in stack
+    lines = prof.collapsed().splitlines()
+    counts = [int(line.rsplit(" ", 1)[1]) for line in lines]
+    assert counts == sorted(counts, reverse=True) and sum(counts) == sum(prof.stacks.values())
+
+
+def test_summary_reports_self_time():
+    prof = SamplingProfiler(interval_ms=0.1)
+    assert prof.interval == profile_utils.MIN_INTERVAL_MS / 1000
+    prof.stacks.update({"main;a.py:f;a.py:g": 3, "main;a.py:f": 1, "main;b.py:g": 4})
+    prof.samples = 8
+    summary = prof.summary(top=2)
+    assert summary["stack_samples"] == 8
+    assert summary["top_self"] == [
+        {"frame": "b.py:g", "samples": 4, "share": 0.5},
+        {"frame": "a.py:g", "samples": 3, "share": 0.375},
+    ]
+
+
+def _request(headers):
+    return SimpleNamespace(headers=headers)
+
+
+def test_is_admin_accepts_header_or_bearer(monkeypatch):
+    monkeypatch.setattr(profile_utils, "ADMIN_TOKEN", "secret")
+    assert is_admin(_request({"X-Admin-Token": "secret"}))
+    assert is_admin(_request({"Authorization": "Bearer secret"}))
+    assert not is_admin(_request({"X-Admin-Token": "wrong"}))
+    assert not is_admin(_request({}))
+    monkeypatch.setattr(profile_utils, "ADMIN_TOKEN", "")
+    # No configured token disables admin access entirely, even for an empty header
+    assert not is_admin(_request({"X-Admin-Token": ""}))
+
+
+def test_debug_profile_endpoint(client, admin_headers):
+    assert client.get("/debug/profile?seconds=0.1").status_code == 403
+    resp = client.get("/debug/profile?seconds=0.1&interval_ms=5&format=json", headers=admin_headers)
+    assert resp.status_code == 200
+    body = resp.get_json()
+    assert body["samples"] > 0 and "collapsed" in body
+    text = client.post("/debug/profile", json={"seconds": 0.1}, headers={"Authorization": f"Bearer {admin_headers['X-Admin-Token']}"})
+    assert text.status_code == 200 and text.mimetype == "text/plain"
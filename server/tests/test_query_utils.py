@@ -0,0 +1,52 @@
+import pandas as pd
+import pytest
+
+from query_utils import QueryProfiler, validate_read_only
+
+
+@pytest.fixture(scope="module")
+def profiler():
+    events = pd.DataFrame({"user_id": ["u1", "u2", "u1", "u3"], "clicks": [1, 2, 3, 4]})
+    return QueryProfiler({"events": events})
+
+
+def test_select_returns_rows_and_stats(profiler):
+    out = profiler.profile("SELECT user_id, SUM(clicks) AS clicks FROM events GROUP BY user_id ORDER BY user_id")
+    assert out["columns"] == ["user_id", "clicks"]
+    assert out["rows"] == [{"user_id": "u1", "clicks": 4}, {"user_id": "u2", "clicks": 2}, {"user_id": "u3", "clicks": 4}]
+    assert not out["truncated"]
+    assert out["explain_analyze"]
+
+
+@pytest.mark.parametrize("sql", [
+    "SELECT COUNT(*) AS n FROM events -- trailing comment",
+    "SELECT COUNT(*) AS n FROM events -- trailing comment;",
+    "SELECT COUNT(*) AS n\nFROM events -- count them\n",
+    "SELECT COUNT(*) AS n FROM events /* block */;",
+])
+def test_trailing_comments(profiler, sql):
+    out = profiler.profile(sql)
+    assert "error" not in out, out
+    assert out["rows"] == [{"n": 4}]
+
+
+def test_max_rows_truncates(profiler):
+    out = profiler.profile("SELECT * FROM events", max_rows=2)
+    assert out["row_count"] == 2 and out["truncated"]
+
+
+def test_statement_cache_hits(profiler):
+    before = profiler.cache_hits
+    profiler.profile("SELECT 42 AS answer")
+    profiler.profile("  SELECT 42 AS answer ;")
+    assert profiler.cache_hits == before + 1
+
+
+def test_statement_cache_keeps_literal_whitespace(profiler):
+    assert profiler.profile("SELECT 'a  b' AS s")["rows"] == [{"s": "a  b"}]
+    assert profiler.profile("SELECT 'a b' AS s")["rows"] == [{"s": "a b"}]
+
+
+@pytest.mark.parametrize("sql", ["DELETE FROM events", "SELECT 1; SELECT 2", "CREATE TABLE t AS SELECT 1"])
+def test_rejects_non_select(sql):
+    assert validate_read_only(sql)
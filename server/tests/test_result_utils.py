@@ -0,0 +1,81 @@
+import json
+from types import SimpleNamespace
+
+import numpy as np
+
+import result_utils
+from result_utils import ResultStore
+
+
+def _result(n):
+    return {"columns": ["id", "value"], "rows": [[i, np.float64(i / 2)] for i in range(n)], "note": "kept"}
+
+
+def test_small_results_pass_through():
+    store = ResultStore(inline_rows=5)
+    small = _result(5)
+    assert store.truncate(small) is small
+    assert store.truncate(["not", "a", "dict"]) == ["not", "a", "dict"]
+
+
+def test_truncate_and_page():
+    store = ResultStore(inline_rows=5)
+    out = store.truncate(_result(12))
+    assert out["rows"] == _result(5)["rows"] and out["total_rows"] == 12 and out["note"] == "kept"
+    page = store.page(out["result_id"], 10, 5)
+    assert page["columns"] == ["id", "value"]
+    assert [r[0] for r in page["rows"]] == [10, 11]
+    assert store.page(out["result_id"], -3, 0)["rows"] == [[0, 0.0]]
+    assert store.page("missing", 0, 5) is None
+
+
+def test_page_size_is_capped():
+    store = ResultStore(inline_rows=1)
+    out = store.truncate(_result(result_utils.MAX_PAGE_ROWS + 10))
+    assert len(store.page(out["result_id"], 0, 10 ** 6)["rows"]) == result_utils.MAX_PAGE_ROWS
+
+
+def test_lru_bound_and_ttl(monkeypatch):
+    store = ResultStore(max_results=2, inline_rows=1)
+    a, b = (store.truncate(_result(3))["result_id"] for _ in range(2))
+    assert store.page(a, 0, 1) is not None  # refreshes a, so b is evicted next
+    c = store.truncate(_result(3))["result_id"]
+    assert store.page(b, 0, 1) is None
+    assert store.page(a, 0, 1) is not None and store.page(c, 0, 1) is not None
+
+    now = result_utils.time.time()
+    monkeypatch.setattr(result_utils, "time", SimpleNamespace(time=lambda: now + store.ttl + 1))
+    assert store.page(a, 0, 1) is None
+    assert a not in store._results
+
+
+def test_results_endpoint(server, client):
+    out = server.RESULT_STORE.truncate(_result(server.RESULT_STORE.inline_rows + 3))
+    resp = client.get(f"/results/{out['result_id']}?offset={server.RESULT_STORE.inline_rows}&limit=10")
+    assert resp.status_code == 200
+    body = resp.get_json()
+    assert body["total_rows"] == out["total_rows"] and len(body["rows"]) == 3
+    assert client.get(f"/results/{out['result_id']}?offset=x").status_code == 400
+    assert client.get("/results/nope").status_code == 404
+
+
+def test_chat_truncates_only_the_client_frame(server, client, monkeypatch):
+    rows = [{"id": i} for i in range(server.RESULT_STORE.inline_rows + 50)]
+    monkeypatch.setitem(server.TOOLS_IMPL, "sql_profile", lambda args: {"columns": ["id"], "rows": rows})
+    call = SimpleNamespace(id="call-1", function=SimpleNamespace(name="sql_profile", arguments='{"sql": "SELECT 1"}'))
+    histories = []
+
+    def complete(cache, client_, messages, **kwargs):
+        histories.append(list(messages))
+        if len(histories) == 1:
+            return SimpleNamespace(content="", tool_calls=[call])
+        return SimpleNamespace(content="done", tool_calls=None)
+
+    monkeypatch.setattr(server, "cached_chat_completion", complete)
+    body = client.post("/agent-chat", json={"messages": [{"role": "user", "content": "run it"}]}).get_data()
+    frames = [json.loads(line[len(b"data: "):]) for line in body.split(b"\n\n") if line.startswith(b"data: ")]
+    sent = next(f["result"] for f in frames if f["type"] == "tool_result")
+    assert len(sent["rows"]) == server.RESULT_STORE.inline_rows and sent["total_rows"] == len(rows)
+    assert server.RESULT_STORE.page(sent["result_id"], 0, len(rows))["rows"] == rows
+    tool_message = next(m for m in histories[1] if m["role"] == "tool")
+    assert json.loads(tool_message["content"]) == {"columns": ["id"], "rows": rows}
@@ -0,0 +1,49 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from funnel_utils import build_event_index
+from session_utils import Sessionizer, sessionize
+
+
+@pytest.fixture(scope="module")
+def events():
+    rng = np.random.default_rng(3)
+    rows = 2000
+    ts = pd.Timestamp("2025-01-01", tz="UTC") + pd.to_timedelta(rng.integers(0, 5 * 24 * 60, rows), unit="min")
+    df = pd.DataFrame({
+        "user_id": rng.choice([f"u{i}" for i in range(40)], rows),
+        "event_type": rng.choice(["page_view", "click", "purchase"], rows, p=[0.6, 0.3, 0.1]).astype(object),
+        "page": rng.choice(["home", "product", "cart"], rows).astype(object),
+        "timestamp": ts.astype(str),
+    })
+    df.loc[rng.random(rows) < 0.05, "event_type"] = None
+    df.loc[rng.random(rows) < 0.05, "page"] = None
+    return df, pd.Series(ts, index=df.index)
+
+
+@pytest.mark.parametrize("conversion_event", ["purchase", "signup"])
+def test_index_path_matches_plain_path(events, conversion_event):
+    df, ts = events
+    plain = Sessionizer.build(df, ts, conversion_event=conversion_event).table
+    indexed = Sessionizer.build(df, ts, build_event_index(df, ts), conversion_event=conversion_event).table
+    key = ["user_id", "started_at"]
+    pd.testing.assert_frame_equal(
+        plain.sort_values(key).drop(columns="session_id").reset_index(drop=True),
+        indexed.sort_values(key).drop(columns="session_id").reset_index(drop=True),
+    )
+    if conversion_event == "signup":
+        assert not indexed["converted"].any()
+
+
+def test_gap_splits_sessions():
+    df = pd.DataFrame({
+        "user_id": ["a", "a", "a", "b"],
+        "event_type": ["page_view", "purchase", "page_view", None],
+        "page": ["home", "cart", "home", "home"],
+    })
+    ts = pd.Series(pd.to_datetime(["2025-01-01 10:00", "2025-01-01 10:20", "2025-01-01 11:00", "2025-01-01 10:00"], utc=True))
+    out = sessionize(df, ts, gap_sec=30 * 60, conversion_event="purchase")
+    assert out["event_count"].tolist() == [2, 1, 1]
+    assert out["converted"].tolist() == [True, False, False]
+    assert out["exit_page"].tolist() == ["cart", "home", "home"]
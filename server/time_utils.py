@@ -0,0 +1,14 @@
+from typing import Any, Optional
+
+import pandas as pd
+
+
+def as_utc(value: Any) -> Optional[pd.Timestamp]:
+    """`value` as a UTC timestamp (naive values are taken as UTC); None when it does not parse."""
+    try:
+        ts = pd.Timestamp(value)
+    except (TypeError, ValueError):
+        return None
+    if pd.isna(ts):
+        return None
+    return ts.tz_localize("UTC") if ts.tzinfo is None else ts.tz_convert("UTC")